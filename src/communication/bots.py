@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+import asyncio
+from argparse import ArgumentParser
+from time import perf_counter
+
+from src.communication import messages
+from src.communication.client import Client
+from src.communication.clock import Clock, REAL_TIME
+from src.communication.framing import MESSAGE_SEPARATOR, encode_message
+from src.communication.info import Allegiance
+from src.communication.metrics import Histogram, format_ms
+from src.communication.player import Player
+from src.communication.strategy import DEFAULT_STRATEGY, STRATEGIES
+from src.communication.transport import LOOPBACK, TCP, UNIX, address
+from src.communication.unexpected import UnexpectedServerMessage
+
+
+class AsyncPlayer(Player):
+    """
+    a Player driven by an asyncio event loop instead of his own thread: all the I/O goes through non-blocking streams,
+    everything else (joining, strategy, handling Data and knowledge exchanges) is done by the usual Player methods.
+    """
+
+    def __init__(self, index=1, verbose=False, game_name='easy clone', clock: Clock = None, pipelined=False,
+                 transport: str = TCP, strategies: dict = None, fast_join=False):
+        if transport == LOOPBACK:
+            raise ValueError("Bots need real sockets to run on an event loop, use the tcp or unix transport.")
+        super().__init__(index, verbose, game_name, clock, pipelined, transport=transport, strategies=strategies,
+                         fast_join=fast_join)
+        self.socket.close()  # the streams opened in open() are used instead.
+        self.reader = None
+        self.writer = None
+        self.keep_alive_task = None
+
+        # turn statistics:
+        self.turns = 0
+        self.turn_times = Histogram()  # time between handling two consecutive responses
+        self.started_at = None
+        self.finished_at = None
+
+    async def open(self, hostname=Client.DEFAULT_HOSTNAME, port=Client.DEFAULT_PORT):
+        if self.transport == UNIX:
+            self.reader, self.writer = await asyncio.open_unix_connection(address(UNIX, hostname, port))
+        else:
+            self.reader, self.writer = await asyncio.open_connection(hostname, port)
+        self.connected = True
+        self.verbose_debug("Succesfully connected to server.")
+        self.keep_alive_task = asyncio.ensure_future(self.send_keep_alives())
+
+    async def send_keep_alives(self):
+        """
+        counterpart of Client.send_keep_alives, running as a task on the bots' event loop.
+        """
+        while self.connected:
+            await asyncio.sleep(self.keep_alive_interval / 1000)
+            if self.connected and REAL_TIME.time() - self.last_sent >= self.keep_alive_interval / 1000:
+                self.writer.write(MESSAGE_SEPARATOR)
+                self.last_sent = REAL_TIME.time()
+
+    def send(self, message: str):
+        """
+        queue the message in the stream. it's written out without blocking, the next time the bot awaits.
+        """
+        self.writer.write(encode_message(message))
+        self.last_sent = REAL_TIME.time()
+        self.last_message = message
+        self.verbose_debug("Sent to server: \"" + message + "\".")
+
+    async def receive_async(self):
+        """
+        counterpart of Player.receive: answers other players' knowledge exchanges while waiting for a response.
+        :returns: the response, or None if the connection was closed.
+        """
+        while True:
+            await self.writer.drain()
+            received = self.received.next_message()
+            while received is None:
+                data = await self.reader.read(Client.MESSAGE_BUFFER_SIZE)
+                if len(data) < 1:
+                    return None
+                self.received.feed(data)
+                received = self.received.next_message()
+            self.verbose_debug("Received from server: \"" + received + "\".")
+
+            if "GameMasterDisconnected" in received:
+                # unlike a threaded Player, a bot doesn't try to re-join: it just stops playing.
+                self.game_on = False
+                return received
+
+            if not self.handle_knowledge_exchange(received):
+                return received
+
+    async def join(self, game_name) -> bool:
+        if self.fast_join:
+            join_message = self.join_any_game()
+        else:
+            self.send(messages.GetGames())
+            games = await self.receive_async()
+            if games is None:
+                return False
+            join_message = self.choose_game(games)
+
+        if join_message is None:
+            return False
+        self.send(join_message)
+
+        confirmation = await self.receive_async()
+        if confirmation is None:
+            raise UnexpectedServerMessage
+        if not self.handle_confirmation(confirmation):
+            return False
+
+        game_message = await self.receive_async()
+        if game_message is None:
+            raise UnexpectedServerMessage
+        self.handle_game(game_message)
+        return True
+
+    async def play_async(self):
+        self.start_playing()
+        self.started_at = last_turn = perf_counter()
+
+        while self.game_on:
+            self.send_requests()
+
+            response = await self.receive_async()
+            if response is None:
+                self.verbose_debug("Something wrong happened to the server! Stopping.")
+                break
+
+            self.handle_response(response)
+
+            now = perf_counter()
+            self.turn_times.add(now - last_turn)
+            self.turns += 1
+            last_turn = now
+
+        self.finished_at = perf_counter()
+
+    async def run(self, hostname=Client.DEFAULT_HOSTNAME, port=Client.DEFAULT_PORT):
+        try:
+            await self.open(hostname, port)
+            if await self.join(self.game_name):
+                await self.play_async()
+        except OSError as e:
+            self.verbose_debug("Socket error caught: " + str(e), True)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """
+        close the connection, without stopping the whole process (the other bots are still playing).
+        """
+        self.connected = False
+        self.game_on = False
+        if self.keep_alive_task is not None:
+            self.keep_alive_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+    def turn_rate(self) -> float:
+        """
+        :returns: turns per second while the bot was playing.
+        """
+        if self.started_at is None or self.turns == 0:
+            return 0.0
+        finished_at = self.finished_at if self.finished_at is not None else perf_counter()
+        return self.turns / (finished_at - self.started_at)
+
+    def report(self) -> str:
+        return " P" + str(self.index) + ": turns=" + str(self.turns) + " turns/s=" + (
+            "%.2f" % self.turn_rate()) + " turn " + self.turn_times.summary()
+
+
+async def run_bots(bot_count, game_name='easy clone', hostname=Client.DEFAULT_HOSTNAME, port=Client.DEFAULT_PORT,
+                   verbose=False, clock: Clock = None, pipelined=False, transport: str = TCP,
+                   strategies: dict = None, fast_join=False) -> list:
+    """
+    run bot_count bots concurrently, in one event loop, until all of their games end.
+    :returns: list of the AsyncPlayers, with their turn statistics.
+    """
+    bots = [AsyncPlayer(index=i, verbose=verbose, game_name=game_name, clock=clock, pipelined=pipelined,
+                        transport=transport, strategies=strategies, fast_join=fast_join) for i in range(bot_count)]
+    await asyncio.gather(*[bot.run(hostname, port) for bot in bots])
+    return bots
+
+
+def report(bots: list, elapsed: float) -> str:
+    """
+    :returns: a human-readable report of the turn rates of all the bots, one line per bot and a total.
+    """
+    lines = [bot.report() for bot in bots]
+    turns = sum(bot.turns for bot in bots)
+    lines.append(" total: bots=" + str(len(bots)) + " turns=" + str(turns) + " turns/s=" + (
+        "%.2f" % (turns / elapsed if elapsed > 0 else 0.0)) + " elapsed=" + format_ms(elapsed))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    def simulate(bot_count, verbose, dilation, pipelined, transport, strategies, fast_join):
+        started = perf_counter()
+        bots = asyncio.run(run_bots(bot_count, verbose=verbose, clock=Clock(dilation), pipelined=pipelined,
+                                    transport=transport, strategies=strategies, fast_join=fast_join))
+        print("Turn rates:\n" + report(bots, perf_counter() - started))
+
+
+    parser = ArgumentParser()
+    parser.add_argument('-c', '--botcount', default=100, help='Number of bots to be deployed.')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False, help='Use verbose debugging mode.')
+    parser.add_argument('-d', '--dilation', default=1, help='How many times faster than real time the clock runs.')
+    parser.add_argument('-p', '--pipelined', action='store_true', default=False,
+                        help='Send a Discover along with every move, without waiting for the move to finish.')
+    parser.add_argument('-t', '--transport', default=TCP, choices=[TCP, UNIX], help='How to connect to the server.')
+    parser.add_argument('--red-strategy', default=DEFAULT_STRATEGY, choices=sorted(STRATEGIES),
+                        help='Strategy to play with in the red team.')
+    parser.add_argument('--blue-strategy', default=DEFAULT_STRATEGY, choices=sorted(STRATEGIES),
+                        help='Strategy to play with in the blue team.')
+    parser.add_argument('-f', '--fast-join', action='store_true', default=False,
+                        help='Join any open game in one round trip, without asking for the list of games.')
+    args = vars(parser.parse_args())
+    simulate(int(args["botcount"]), args["verbose"], float(args["dilation"]), args["pipelined"], args["transport"],
+             {Allegiance.RED.value: args["red_strategy"], Allegiance.BLUE.value: args["blue_strategy"]},
+             args["fast_join"])
@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 import socket
 from datetime import datetime
-from time import sleep
-
+from threading import Lock, Thread
+from src.communication.clock import Clock, REAL_TIME
+from src.communication.framing import MESSAGE_SEPARATOR, MessageBuffer, encode_message
 from src.communication.info import ClientTypeTag
+from src.communication.keepalive import keep_alive_interval
+from src.communication.multiplex import MultiplexedConnection
+from src.communication.transport import TCP, address, new_socket
 
 
 class Client:
@@ -14,22 +18,32 @@ class Client:
     DEFAULT_PORT = 420
     MESSAGE_BUFFER_SIZE = 2048
 
-    def __init__(self, index=1, verbose=False):
+    def __init__(self, index=1, verbose=False, clock: Clock = None, connection: MultiplexedConnection = None,
+                 transport: str = TCP):
         """
         constructor.
         :param index: local index used to differentiate between different clients running in threads
         :param verbose: boolean value. if yes, there will be a lot of output printed out.
+        :param clock: Clock used for all waiting done by the client. real time by default.
+        :param connection: if given, the client talks over a channel of this shared connection, not his own socket.
+        :param transport: how to reach the server: TCP, UNIX or LOOPBACK (see transport.py)
         """
         self.interConnectionTime = Client.INTER_CONNECTION_TIME
         self.timeBetweenMessages = Client.TIME_BETWEEN_MESSAGES
         self.connectionAttempts = Client.CONNECTION_ATTEMPTS
-        self.socket = socket.socket()
+        self.transport = transport
+        self.socket = connection.channel() if connection is not None else new_socket(transport)
         self.index = index
         self.id = None  # will be assigned after connecting to gamemaster.
         self.verbose = verbose
         self.connected = False  # will be changed if connected
         self.last_message = None
+        self.received = MessageBuffer()
         self.typeTag = ClientTypeTag.CLIENT
+        self.clock = clock if clock is not None else REAL_TIME
+        self.keep_alive_interval = keep_alive_interval()  # ms of silence after which a keep-alive is sent
+        self.send_lock = Lock()  # the keep-alives are sent from another thread
+        self.last_sent = REAL_TIME.time()
 
         # self.socket.settimeout(1)
 
@@ -46,9 +60,10 @@ class Client:
         while True:
             try:
                 self.verbose_debug("Trying to connect to server " + str(hostname + " at port " + str(port) + "."))
-                if self.socket.connect_ex((hostname, port)) == 0:
+                if self.socket.connect_ex(address(self.transport, hostname, port)) == 0:
                     self.connected = True
                     self.verbose_debug("Succesfully connected to server.")
+                    Thread(target=self.send_keep_alives, daemon=True).start()
                     return True
 
                 else:
@@ -59,7 +74,7 @@ class Client:
                 if failed_connections < self.connectionAttempts:
                     self.verbose_debug("Attempt number " + str(failed_connections) + " failed. Trying again in " + str(
                         self.interConnectionTime) + " seconds.")
-                    sleep(self.interConnectionTime)
+                    self.clock.sleep(self.interConnectionTime)
                     continue
                 else:
                     self.verbose_debug("Attempt number " + str(
@@ -68,6 +83,23 @@ class Client:
                     self.connected = False
                     return False
 
+    def send_keep_alives(self):
+        """
+        method running on a separate thread, sends an empty message to the server whenever the client was silent for
+        keep_alive_interval, so that the server can tell a client thinking about his next move from a dead one.
+        the interval is in real time: it's about the connection, not the game.
+        """
+        while self.connected:
+            REAL_TIME.sleep_ms(self.keep_alive_interval)
+            if REAL_TIME.time() - self.last_sent < self.keep_alive_interval / 1000:
+                continue
+            try:
+                with self.send_lock:
+                    self.socket.sendall(MESSAGE_SEPARATOR)
+                    self.last_sent = REAL_TIME.time()
+            except OSError:
+                break  # the connection is gone, the main thread will find out by itself.
+
     def verbose_debug(self, message, important=False):
         """
         if in verbose mode, print out the given message with client index and timestamp
@@ -90,7 +122,9 @@ class Client:
         Send message to server.
         """
         try:
-            self.socket.send(message.encode())
+            with self.send_lock:
+                self.socket.sendall(encode_message(message))
+                self.last_sent = REAL_TIME.time()
             self.last_message = message
             self.verbose_debug("Sent to server: \"" + message + "\".")
         except socket.error as e:
@@ -100,17 +134,19 @@ class Client:
     def receive(self) -> str:
         """
         Read and decode bytes from server.
+        :returns: the oldest message which hasn't been returned yet (a single read may bring several of them).
         """
-
-        # TODO: upgrade this method to split clumped messages and return the last message from queue.
-
         try:
-            received_data = (self.socket.recv(Client.MESSAGE_BUFFER_SIZE)).decode()
-            if len(received_data) < 1 or received_data is None:
-                raise ConnectionAbortedError
-            else:
-                self.verbose_debug("Received from server: \"" + received_data + "\".")
-                return received_data
+            received_data = self.received.next_message()
+            while received_data is None:
+                data = self.socket.recv(Client.MESSAGE_BUFFER_SIZE)
+                if len(data) < 1:
+                    raise ConnectionAbortedError
+                self.received.feed(data)
+                received_data = self.received.next_message()
+
+            self.verbose_debug("Received from server: \"" + received_data + "\".")
+            return received_data
 
         except ConnectionAbortedError:
             self.verbose_debug("Server has shut down. Shutting down the client as well.", True)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+import time
+
+
+class Clock:
+    """
+    source of time for the whole networked stack (GameMaster, Client, CommunicationServer).
+    every delay in the game (action costs, placing new pieces, re-connecting...) goes through a Clock,
+    so that tests can run full games over real sockets much faster, while keeping the relative timing of actions.
+    """
+
+    def __init__(self, dilation: float = 1.0):
+        """
+        constructor.
+        :param dilation: how many times faster than real time the clock runs. e.g. with dilation=100,
+        a 2.5s wait for a new piece takes 25ms of real time.
+        """
+        if dilation <= 0:
+            raise ValueError("Time dilation has to be a positive number, got: " + str(dilation))
+        self.dilation = float(dilation)
+        self._real_start = time.monotonic()
+
+    def sleep(self, seconds: float):
+        """
+        block for the given amount of virtual seconds.
+        """
+        if seconds > 0:
+            time.sleep(seconds / self.dilation)
+
+    def sleep_ms(self, milliseconds):
+        """
+        block for the given amount of virtual milliseconds (all the delays in GameMasterSettings.xml are in ms).
+        """
+        self.sleep(float(milliseconds) / 1000)
+
+    def time(self) -> float:
+        """
+        :returns: virtual seconds elapsed since the clock was created.
+        """
+        return (time.monotonic() - self._real_start) * self.dilation
+
+
+REAL_TIME = Clock()  # default clock, used when no other clock is injected.
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+from collections import deque
+
+MESSAGE_SEPARATOR = b"\x17"  # ETB byte, ends every message sent over a socket. an empty message is a keep-alive.
+
+
+def encode_message(message: str) -> bytes:
+    return message.encode() + MESSAGE_SEPARATOR
+
+
+class MessageBuffer:
+    """
+    splits the bytes received from a socket into messages.
+    a single recv can return several messages clumped together, or only a part of one.
+    """
+
+    def __init__(self):
+        self.data = b""
+        self.messages = deque()
+
+    def feed(self, data: bytes):
+        self.data += data
+        if MESSAGE_SEPARATOR in data:
+            *complete, self.data = self.data.split(MESSAGE_SEPARATOR)
+            self.messages.extend(message.decode() for message in complete if len(message) > 0)
+
+    def next_message(self):
+        """
+        :returns: the oldest complete message not returned yet, or None if there isn't one.
+        """
+        if len(self.messages) > 0:
+            return self.messages.popleft()
+        return None
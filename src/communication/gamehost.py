@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+import xml.etree.ElementTree as ET
+from argparse import ArgumentParser
+from collections import deque
+from queue import Queue
+from threading import Lock, Thread
+
+from src.communication.client import Client
+from src.communication.clock import Clock
+from src.communication.framing import MESSAGE_SEPARATOR, MessageBuffer, encode_message
+from src.communication.gamemaster import GameMaster, parse_game_master_settings
+from src.communication.transport import TCP, TRANSPORTS, new_socket, socket_name
+
+
+class GameChannel:
+    """
+    one hosted game's end of the host's connection, used as the socket of its GameMaster.
+    the GameMaster sends whole messages, so they're written to the shared socket as they are; what the server sends
+    to the game is put into the channel's queue by the host (see GameHost.route).
+    """
+
+    def __init__(self, host, index: int):
+        self.host = host
+        self.index = index
+        self.incoming = Queue()  # messages for this game, as bytes, b"" once the channel is closed
+        self.closed = False
+
+    def connect_ex(self, address) -> int:
+        return self.host.connect_ex(address)
+
+    def send(self, data: bytes) -> int:
+        if self.closed:
+            raise ConnectionAbortedError
+        self.host.send_raw(data)
+        return len(data)
+
+    def sendall(self, data: bytes):
+        self.send(data)
+
+    def recv(self, buffer_size: int = None) -> bytes:
+        return self.incoming.get()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.incoming.put(b"")
+            self.host.close_channel(self.index)
+
+    def getsockname(self):
+        return self.host.getsockname() + ("game " + str(self.index),)
+
+
+class GameHost:
+    """
+    runs many games in one process, over one connection to the server: each game has its own GameMaster
+    (with its own board, piece placing and handler threads), but all of them share the settings and the socket.
+
+    the server sees a single Game Master which registered many games. the messages it sends are routed to the games
+    by gameId; the few which don't carry one are routed by gameName (JoinGame) or by playerId (PlayerDisconnected).
+    confirmations of registration come back in the order in which the games registered.
+    """
+
+    def __init__(self, transport: str = TCP):
+        self.transport = transport
+        self.socket = new_socket(transport)
+        self.send_lock = Lock()
+        self.connected = False
+        self.received = MessageBuffer()
+        self.channels = {}  # index => GameChannel
+        self.channel_indexer = 0
+
+        # routing:
+        self.route_lock = Lock()
+        self.registering = deque()  # GameChannels of the games waiting for the server to answer RegisterGame
+        self.by_game_id = {}  # game id => GameChannel
+        self.by_game_name = {}  # game name => GameChannel
+        self.by_player_id = {}  # player id => GameChannel of the game he joined
+
+    def channel(self) -> GameChannel:
+        channel = GameChannel(self, self.channel_indexer)
+        self.channels[channel.index] = channel
+        self.channel_indexer += 1
+        return channel
+
+    def connect_ex(self, address) -> int:
+        """
+        connect the shared socket (only the first game to connect really does it).
+        """
+        with self.send_lock:
+            if self.connected:
+                return 0
+            result = self.socket.connect_ex(address)
+            if result == 0:
+                self.connected = True
+                Thread(target=self.demultiplex, daemon=True).start()
+            return result
+
+    def send_raw(self, data: bytes):
+        """
+        write an encoded message of one of the games to the shared socket. registrations are remembered,
+        so that the server's answers to them can be routed back.
+        """
+        with self.send_lock:
+            if b"RegisterGame" in data:
+                # (under the send lock, so that the registrations are queued in the order they're sent)
+                game_name = ET.fromstring(data.rstrip(MESSAGE_SEPARATOR).decode())[0].attrib["gameName"]
+                with self.route_lock:
+                    self.registering.append(self.by_game_name.get(game_name))
+            self.socket.sendall(data)
+
+    def host_game(self, game_name: str, channel: GameChannel):
+        with self.route_lock:
+            self.by_game_name[game_name] = channel
+
+    def close_channel(self, index: int):
+        """
+        forget a game whose GameMaster has shut down.
+        """
+        channel = self.channels.pop(index, None)
+        with self.route_lock:
+            for routes in (self.by_game_id, self.by_game_name, self.by_player_id):
+                for key in [key for key, routed in routes.items() if routed is channel]:
+                    del routes[key]
+
+    def demultiplex(self):
+        """
+        runs on a thread: passes every message from the server on to the game it is meant for.
+        """
+        while True:
+            try:
+                data = self.socket.recv(Client.MESSAGE_BUFFER_SIZE)
+            except OSError:
+                break
+            if len(data) < 1:
+                break
+            self.received.feed(data)
+            message = self.received.next_message()
+            while message is not None:
+                channel = self.route(message)
+                if channel is not None and not channel.closed:
+                    channel.incoming.put(encode_message(message))
+                message = self.received.next_message()
+
+        # the shared socket is gone, so every game is disconnected:
+        self.connected = False
+        for channel in list(self.channels.values()):
+            channel.closed = True
+            channel.incoming.put(b"")
+
+    def route(self, message: str):
+        """
+        :returns: the GameChannel of the game the message is meant for, or None if there's no such game (anymore).
+        """
+        root = ET.fromstring(message)
+        with self.route_lock:
+            if "ConfirmGameRegistration" in message or "RejectGameRegistration" in message:
+                if len(self.registering) == 0:
+                    return None  # not an answer to any of the registrations.
+                channel = self.registering.popleft()
+                if "ConfirmGameRegistration" in message and channel is not None:
+                    self.by_game_id[root.attrib["gameId"]] = channel
+                return channel
+
+            game_id = root.attrib.get("gameId")
+            if game_id is not None:
+                return self.by_game_id.get(game_id)
+
+            if "JoinGame" in message:
+                channel = self.by_game_name.get(root.attrib["gameName"])
+                if channel is not None:
+                    self.by_player_id[root.attrib["playerId"]] = channel
+                return channel
+
+            return self.by_player_id.get(root.attrib.get("playerId"))
+
+    def getsockname(self):
+        return socket_name(self.socket)
+
+    def close(self):
+        for channel in list(self.channels.values()):
+            channel.close()
+        self.socket.close()
+
+
+def game_masters(host: GameHost, game_count: int, verbose=False, clock: Clock = None, delta_data=False,
+                 discover_tick=None, settings=None) -> list:
+    """
+    :returns: list of GameMasters of game_count games hosted by the host, each one with a different game name.
+    """
+    if settings is None:
+        settings = parse_game_master_settings()
+    hosted = []
+    for i in range(game_count):
+        gm = GameMaster(verbose, clock=clock, delta_data=delta_data, discover_tick=discover_tick,
+                        transport=host.transport, index=i, settings=settings, connection=host)
+        gm.game_name = gm.game_name + " " + str(i)
+        host.host_game(gm.game_name, gm.socket)
+        hosted.append(gm)
+    return hosted
+
+
+def run_games(hosted: list, hostname=Client.DEFAULT_HOSTNAME, port=Client.DEFAULT_PORT):
+    """
+    connect and run all the hosted games, each on its own thread, until all of them are over.
+    """
+    threads = []
+    for gm in hosted:
+        if gm.connect(hostname, port):
+            thread = Thread(target=gm.run, daemon=True)
+            thread.start()
+            threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    def simulate(game_count, verbose, dilation, delta_data, discover_tick, transport):
+        host = GameHost(transport)
+        run_games(game_masters(host, game_count, verbose, Clock(dilation), delta_data, discover_tick))
+        host.close()
+
+
+    parser = ArgumentParser()
+    parser.add_argument('-g', '--games', default=10, help='Number of games hosted at once.')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False, help='Use verbose debugging mode.')
+    parser.add_argument('-d', '--dilation', default=1, help='How many times faster than real time the clock runs.')
+    parser.add_argument('--delta', action='store_true', default=False,
+                        help='Only send fields and pieces which changed since the player last received them.')
+    parser.add_argument('--discover-tick', type=int, default=None,
+                        help='Answer Discover messages in batches, once every given number of ms.')
+    parser.add_argument('-t', '--transport', default=TCP, choices=TRANSPORTS, help='How to connect to the server.')
+    args = vars(parser.parse_args())
+    simulate(int(args["games"]), args["verbose"], float(args["dilation"]), args["delta"], args["discover_tick"],
+             args["transport"])
@@ -1,17 +1,20 @@
-import copy
 import os
+import signal
 import uuid
 import xml.etree.ElementTree as ET
 from argparse import ArgumentParser
 from random import random, randint
-from threading import Thread
-from time import sleep
+from threading import Thread, Lock
+from time import perf_counter
 
 from src.communication import messages
 from src.communication.client import Client
+from src.communication.clock import Clock
 from src.communication.helpful_math import Manhattan_Distance as manhattan
+from src.communication.metrics import LatencyRecorder
 from src.communication.info import GameInfo, Direction, Allegiance, PieceInfo, PieceType, \
-    GoalFieldType, ClientTypeTag, PlayerType, PlayerInfo
+    GoalFieldType, ClientTypeTag, PlayerType, PlayerInfo, PieceStore, TaskFieldInfo, GoalFieldView
+from src.communication.transport import TCP, TRANSPORTS
 from src.communication.unexpected import UnexpectedServerMessage
 
 GAME_SETTINGS_TAG = "{https://se2.mini.pw.edu.pl/17-pl-19/17-pl-19/}"
@@ -20,16 +23,119 @@ ET.register_namespace('', "https://se2.mini.pw.edu.pl/17-results/")
 
 
 def parse_game_master_settings():
-    full_file = os.getcwd() + "\GameMasterSettings.xml"
+    full_file = os.path.join(os.getcwd(), "GameMasterSettings.xml")
     tree = ET.parse(full_file)
     root = tree.getroot()
 
     return root
 
 
+def normalized_id(value):
+    # "-1" and None both mean "nothing" in our infos, and neither of them is ever sent.
+    if value is None or value == "-1":
+        return "-1"
+    return str(value)
+
+
+def task_field_record(field):
+    """
+    :returns: tuple of everything about a TaskField that ends up in a Data message (apart from the timestamp)
+    """
+    return normalized_id(field.player_id), field.distance_to_piece, normalized_id(field.piece_id)
+
+
+def goal_field_record(field):
+    """
+    :returns: tuple of everything about a GoalField that ends up in a Data message (apart from the timestamp)
+    """
+    return normalized_id(field.player_id), field.type, field.allegiance
+
+
+def piece_record(piece):
+    """
+    :returns: tuple of everything about a Piece that ends up in a Data message (apart from the timestamp)
+    """
+    return piece.type, normalized_id(piece.player_id)
+
+
+def strip_known_data(player_info: PlayerInfo, data: dict):
+    """
+    delta mode: remove from the Data contents every field and piece which the player has already received
+    with exactly the same values. whatever is left is remembered as what the player knows now.
+    the player keeps the older timestamps of the fields left out, so the message stays valid against the schema.
+    :param data: keyword arguments for messages.Data, modified in place
+    """
+    for key, record, sent in (("task_fields", task_field_record, player_info.sent_fields),
+                              ("goal_fields", goal_field_record, player_info.sent_fields),
+                              ("pieces", piece_record, player_info.sent_pieces)):
+        items = data.get(key)
+        if items is None:
+            continue
+        changed = {}
+        for item_id, item in items.items():
+            values = record(item)
+            if sent.get(item_id) != values:
+                sent[item_id] = values
+                changed[item_id] = item
+        data[key] = changed if len(changed) > 0 else None
+
+
+def direction_towards(location: tuple, target: tuple):
+    """
+    :returns: direction of the next step on a shortest path from location to target (horizontal moves first),
+    or None if the target has been reached.
+    """
+    if target[0] > location[0]:
+        return Direction.RIGHT.value
+    if target[0] < location[0]:
+        return Direction.LEFT.value
+    if target[1] > location[1]:
+        return Direction.UP.value
+    if target[1] < location[1]:
+        return Direction.DOWN.value
+    return None
+
+
+class DiscoverWindow:
+    """
+    cached snapshot of the 3x3 window of the master board around a location, used to answer Discover messages.
+    the snapshot is rebuilt only when the version of any field inside the window has changed.
+    """
+
+    def __init__(self, fields: list):
+        """
+        :param fields: master FieldInfo objects inside the window (the window itself never changes, only the fields)
+        """
+        self.fields = fields
+        self.versions = None
+        self.task_fields = []  # list of tuples: (location, player_id, distance_to_piece, piece_id)
+        self.goal_fields = []  # list of tuples: (location, player_id, allegiance)
+
+    def refresh(self):
+        """
+        re-build the snapshot if anything inside the window has changed since the last refresh.
+        :returns: True if the snapshot had to be re-built.
+        """
+        versions = tuple(field.version for field in self.fields)
+        if versions == self.versions:
+            return False
+
+        task_fields, goal_fields = [], []
+        for field in self.fields:
+            if isinstance(field, TaskFieldInfo):
+                piece_id = field.piece_id if field.has_piece else "-1"
+                task_fields.append((field.location, field.player_id, field.distance_to_piece, piece_id))
+            else:
+                goal_fields.append((field.location, field.player_id, field.allegiance))
+
+        self.task_fields, self.goal_fields = task_fields, goal_fields
+        self.versions = versions
+        return True
+
+
 class GameMaster(Client):
     def parse_game_definition(self):
-        root = parse_game_master_settings()
+        root = self.settings
 
         self.keep_alive_interval = int(root.attrib.get('KeepAliveInterval'))
         self.retry_register_game_interval = int(root.attrib.get('RetryRegisterGameInterval'))
@@ -52,6 +158,9 @@ class GameMaster(Client):
             self.placing_pieces_frequency = int(
                 game_attributes.find(GAME_SETTINGS_TAG + "PlacingNewPiecesFrequency").text)
             self.initial_number_of_pieces = int(game_attributes.find(GAME_SETTINGS_TAG + "InitialNumberOfPieces").text)
+            max_live_pieces = game_attributes.find(GAME_SETTINGS_TAG + "MaxLivePieces")
+            if max_live_pieces is not None:
+                self.max_live_pieces = int(max_live_pieces.text)
             board_width = int(game_attributes.find(GAME_SETTINGS_TAG + "BoardWidth").text)
             task_area_length = int(game_attributes.find(GAME_SETTINGS_TAG + "TaskAreaLength").text)
             goal_area_length = int(game_attributes.find(GAME_SETTINGS_TAG + "GoalAreaLength").text)
@@ -59,14 +168,18 @@ class GameMaster(Client):
             self.game_name = game_attributes.find(GAME_SETTINGS_TAG + "GameName").text
             self.team_limit = int(game_attributes.find(GAME_SETTINGS_TAG + "NumberOfPlayersPerTeam").text)
 
+        if self.max_live_pieces is None:
+            # there can't be more pieces lying on the board than there are task fields anyway:
+            self.max_live_pieces = board_width * task_area_length
+
         self.info = GameInfo(board_width=board_width, task_height=task_area_length,
                              goals_height=goal_area_length, max_blue_players=self.team_limit,
-                             max_red_players=self.team_limit)
+                             max_red_players=self.team_limit, pieces=PieceStore(self.max_live_pieces))
 
         self.goal_target = len(self.goals) / 2
 
     def parse_action_costs(self):
-        root = parse_game_master_settings()
+        root = self.settings
 
         for action_costs in root.findall(GAME_SETTINGS_TAG + "ActionCosts"):
             self.move_delay = int(action_costs.find(GAME_SETTINGS_TAG + "MoveDelay").text)
@@ -76,14 +189,31 @@ class GameMaster(Client):
             self.placing_delay = int(action_costs.find(GAME_SETTINGS_TAG + "PlacingDelay").text)
             self.knowledge_exchange_delay = int(action_costs.find(GAME_SETTINGS_TAG + "KnowledgeExchangeDelay").text)
 
-    def __init__(self, verbose=False):
-        super().__init__(verbose=verbose)
+    def __init__(self, verbose=False, clock: Clock = None, delta_data=False, discover_tick=None,
+                 transport: str = TCP, index=1, settings=None, connection=None):
+        """
+        :param delta_data: if True, Data messages only contain fields and pieces which changed since the player
+        last received them (see strip_known_data)
+        :param discover_tick: if set (in ms), Discover messages are answered in batches, once every tick
+        (see resolve_discovers), instead of each one on its own thread
+        :param transport: how to reach the server: TCP, UNIX or LOOPBACK (see transport.py)
+        :param settings: root of already parsed GameMasterSettings, shared by the games of one process.
+        read from GameMasterSettings.xml by default.
+        :param connection: shared connection to talk over, instead of the GM's own socket (see gamehost.py)
+        """
+        super().__init__(index=index, verbose=verbose, clock=clock, connection=connection, transport=transport)
+        self.settings = settings if settings is not None else parse_game_master_settings()
 
         self.achieved_goal_counters = {Allegiance.RED.value: 0, Allegiance.BLUE.value: 0}
 
-        self.PIECE_DICT_PRELOAD_CAPACITY = 256
         self.RANDOMIZATION_ATTEMPTS = 10
-        self.piece_indexer = 0
+        self.max_live_pieces = None  # optional MaxLivePieces setting, defaults to the number of task fields
+        self.latency = LatencyRecorder()  # per-action latency histograms, see dump_latency()
+        self.discover_windows = {}  # (x,y) => DiscoverWindow
+        self.delta_data = delta_data
+        self.discover_tick = discover_tick
+        self.pending_discovers = []  # list of tuples: (due time, PlayerInfo, time of receiving the message)
+        self.discover_lock = Lock()
         self.typeTag = ClientTypeTag.GAME_MASTER
         self.game_on = False
         self.player_indexer = 0
@@ -104,7 +234,7 @@ class GameMaster(Client):
 
         try:
             if "RejectGameRegistration" in message:
-                sleep(self.retry_register_game_interval)
+                self.clock.sleep_ms(self.retry_register_game_interval)
                 self.send(register_game_message)
 
             elif "ConfirmGameRegistration" in message:
@@ -116,7 +246,11 @@ class GameMaster(Client):
                     # now, we will be receiving messages about players who are trying to join:
                     message = self.receive()  # this will block
 
-                    if "JoinGame" in message:
+                    if "PlayerDisconnected" in message:
+                        # a player left (or went silent) before the game started: his slot is free again.
+                        self.remove_player(ET.fromstring(message).attrib.get("playerId"))
+
+                    elif "JoinGame" in message:
                         self.handle_join(message)
 
                         if self.get_num_of_players == self.team_limit * 2:
@@ -126,6 +260,10 @@ class GameMaster(Client):
                             self.game_on = True
                             self.play()
 
+                            # the game is over, and the server has released the players.
+                            self.verbose_debug("Game finished, shutting down.", True)
+                            self.shutdown()
+
                     else:
                         raise UnexpectedServerMessage
 
@@ -174,6 +312,7 @@ class GameMaster(Client):
     def set_up_game(self):
         # now that the players have connected, we can prepare the game
         self.info.initialize_fields()
+        self.discover_windows = {}
 
         # set-up the goal fields using info obtained from the configuration file:
         for goal_field in self.info.goal_fields.values():
@@ -210,27 +349,21 @@ class GameMaster(Client):
             self.info.teams[Allegiance.BLUE.value][player_id].location = (x, y)
 
         # create the first pieces:
-        for i in range(self.PIECE_DICT_PRELOAD_CAPACITY):
-            # using pre-loading of the dict to avoid thread synchronization problems due to changing size of dict
-            if i <= self.initial_number_of_pieces:
-                self.add_piece()
-            else:
-                self.info.pieces[str(i)] = PieceInfo()
+        for i in range(self.initial_number_of_pieces):
+            self.add_piece()
 
     def place_pieces(self):
         # this function runs on a thread and keeps adding new pieces to the board. forever.
         while self.game_on:
-            sleep(float(self.placing_pieces_frequency) / 1000)
+            self.clock.sleep_ms(self.placing_pieces_frequency)
             self.add_piece()
 
     def add_piece(self):
         """
         randomly place a piece on the board (if possible)
         """
-        piece_id = str(self.piece_indexer)
-
         # check if we can add the piece at all:
-        if not self.info.check_for_empty_task_fields():
+        if self.info.pieces.is_full or not self.info.check_for_empty_task_fields():
             return False
 
         # randomize until we find a suitable field:
@@ -250,24 +383,26 @@ class GameMaster(Client):
                     y = task_field.y
                     break
 
-        new_piece = PieceInfo(piece_id, location=(x, y))
-
         # assign type to new piece
         if random() >= self.sham_probability:
-            new_piece.type = PieceType.NORMAL.value
+            piece_type = PieceType.NORMAL.value
         else:
-            new_piece.type = PieceType.SHAM.value
+            piece_type = PieceType.SHAM.value
+
+        new_piece = self.info.pieces.new_piece(piece_type, location=(x, y))
+        if new_piece is None:
+            return False
+        piece_id = new_piece.id
 
         self.info.task_fields[x, y].piece_id = piece_id
-        self.info.pieces[piece_id] = new_piece
 
         # update distance_to_piece in all fields:
         self.update_field_distances()
 
-        self.piece_indexer += 1
         self.verbose_debug(
             "Added a " + new_piece.type + " piece with id: " + piece_id + " at coordinates " + str(x) + ", " + str(
                 y) + ".")
+        return True
 
     def add_player(self, player_id, pref_role, pref_team, private_guid):
         """
@@ -299,6 +434,35 @@ class GameMaster(Client):
                                                                 self.info.board_width)
         return team, role
 
+    def remove_player(self, player_id):
+        """
+        remove a disconnected player from the game: free his field and drop the piece he was holding.
+        """
+        player_info = self.find_player_by_id(player_id)
+        if player_info is None:
+            return
+        del self.info.teams[player_info.team][player_info.id]
+        self.verbose_debug("Player " + str(player_id) + " disconnected, removing him from the game.")
+
+        location = player_info.location
+        if location is None:
+            return  # the game hasn't started yet.
+        if self.info.is_task_field(location):
+            field = self.info.task_fields[location]
+        else:
+            field = self.info.goal_fields[location]
+        field.player_id = "-1"
+
+        piece_id = player_info.piece_id
+        if piece_id != "-1":
+            if self.info.is_task_field(location) and not field.has_piece:
+                self.info.pieces.put_down(piece_id, location)
+                field.piece_id = piece_id
+                self.update_field_distances()
+            else:
+                self.info.pieces.consume(piece_id)
+                self.forget_piece(piece_id)
+
     def find_player_by_guid(self, guid):
         for team in self.info.teams.values():
             for player in team:
@@ -311,10 +475,63 @@ class GameMaster(Client):
                 if team[player].id == id:
                     return team[player]
 
-    def handle_move_message(self, direction, player_info: PlayerInfo):
+    def handle_move_message(self, direction, player_info: PlayerInfo, queued_at=None, request_id=None):
+        self.record_queue_wait("move", queued_at)
+        with self.latency.measure("move", "delay"):
+            self.clock.sleep_ms(self.move_delay)
+        started = perf_counter()
+
+        moved, task_fields, goal_fields, pieces = self.make_move(direction, player_info)
 
-        sleep(float(self.move_delay) / 1000)
+        self.send_data("move", started, player_info, task_fields=task_fields or None,
+                       goal_fields=goal_fields or None, pieces=pieces or None, player_location=player_info.location,
+                       request_id=request_id)
 
+    def handle_move_path_message(self, directions, target, player_info: PlayerInfo, queued_at=None,
+                                 request_id=None):
+        """
+        make a sequence of moves for the player (either the given directions, or towards the target field),
+        each of them costing the usual move delay. stop at the first move which couldn't be made,
+        and send one Data message with everything the player saw along the way.
+        """
+        self.record_queue_wait("move_path", queued_at)
+        task_fields, goal_fields, pieces = {}, {}, {}
+        compute_time = 0.0
+
+        for step in range(messages.MAX_PATH_LENGTH):
+            if target is not None:
+                direction = direction_towards(player_info.location, target)
+            elif step < len(directions):
+                direction = directions[step]
+            else:
+                direction = None
+            if direction is None:
+                break
+
+            with self.latency.measure("move_path", "delay"):
+                self.clock.sleep_ms(self.move_delay)
+
+            step_started = perf_counter()
+            moved, step_task_fields, step_goal_fields, step_pieces = self.make_move(direction, player_info)
+            task_fields.update(step_task_fields)
+            goal_fields.update(step_goal_fields)
+            pieces.update(step_pieces)
+            compute_time += perf_counter() - step_started
+
+            if not moved:
+                break
+
+        self.latency.record("move_path", "compute", compute_time)
+        self.send_data("move_path", None, player_info, task_fields=task_fields or None,
+                       goal_fields=goal_fields or None, pieces=pieces or None, player_location=player_info.location,
+                       request_id=request_id)
+
+    def make_move(self, direction, player_info: PlayerInfo):
+        """
+        move the player one field in the given direction, if possible.
+        :returns: a tuple: (moved, task_fields, goal_fields, pieces) - dicts with what the player saw on the new field
+        """
+        task_fields, goal_fields, pieces = {}, {}, {}
         new_location = player_info.location
 
         if direction == Direction.UP.value:
@@ -334,44 +551,34 @@ class GameMaster(Client):
             old_field = self.info.task_fields[old_location]
         else:
             old_field = self.info.goal_fields[old_location]
-        player_info.location = new_location
 
         if self.info.is_task_field(new_location):
             new_task_field = self.info.task_fields[new_location]
 
             if new_task_field.is_occupied:
                 # can't move, stay in the same location.
-                player_info.location = old_location
-                old_field.player_id = player_info.id
-                self.send(messages.Data(player_info.id, self.info.finished, player_location=player_info.location))
+                return False, task_fields, goal_fields, pieces
 
-            else:
-                # we can move to the new field.
-                new_task_field.player_id = player_info.id
-                old_field.player_id = "-1"  # set old field to not have a player.
-
-                if new_task_field.has_piece:
-                    piece_id = new_task_field.piece_id
+            # we can move to the new field.
+            player_info.location = new_location
+            new_task_field.player_id = player_info.id
+            old_field.player_id = "-1"  # set old field to not have a player.
+            task_fields[new_location] = new_task_field
 
-                    # check if the Player already knows what type this piece is:
-                    # if yes, keep his information about it:
-                    piece_info = player_info.info.pieces.get(piece_id)
+            if new_task_field.has_piece:
+                piece_id = new_task_field.piece_id
 
-                    if piece_info is None:
-                        # if he doesn't yet know about the Piece, set its type to unknown
-                        piece_info = PieceInfo(piece_id, type=PieceType.UNKNOWN.value, location=new_location)
-                        player_info.info.pieces[piece_id] = piece_info
+                # check if the Player already knows what type this piece is:
+                # if yes, keep his information about it:
+                piece_info = player_info.info.pieces.get(piece_id)
 
-                    piece_dict = {piece_id: piece_info}
+                if piece_info is None:
+                    # if he doesn't yet know about the Piece, set its type to unknown
+                    piece_info = PieceInfo(piece_id, type=PieceType.UNKNOWN.value, location=new_location)
+                    player_info.info.pieces[piece_id] = piece_info
 
-                    # finally, send the message.
-                    self.send(
-                        messages.Data(player_info.id, self.info.finished, task_fields={new_location: new_task_field},
-                                      pieces=piece_dict, player_location=new_location))
-                else:
-                    # this new field doesn't have a piece.
-                    self.send(
-                        messages.Data(player_info.id, self.info.finished, task_fields={new_location: new_task_field}))
+                pieces[piece_id] = piece_info
+            return True, task_fields, goal_fields, pieces
 
         elif self.info.is_goal_field(new_location):
             # it's a Goal Field, yo.
@@ -381,86 +588,108 @@ class GameMaster(Client):
 
             if self.info.goal_fields[new_location].is_occupied:
                 # can't move.
-                player_info.location = old_location
-                self.send(messages.Data(player_info.id, self.info.finished, player_location=player_info.location))
+                return False, task_fields, goal_fields, pieces
 
-            else:
-                # get a working copy of the new field.
-                new_goal_field = copy.deepcopy(self.info.goal_fields[new_location])
-                # use the type that the player knows.
-                new_goal_field.type = player_info.info.goal_fields[new_location].type
+            player_info.location = new_location
+            self.info.goal_fields[new_location].player_id = player_info.id
+            old_field.player_id = "-1"  # set old field to not have a player.
+
+            # a view of the new field, with the type that the player knows.
+            goal_fields[new_location] = GoalFieldView(self.info.goal_fields[new_location],
+                                                      player_info.info.goal_fields[new_location].type)
+            return True, task_fields, goal_fields, pieces
 
-                self.info.goal_fields[new_location].player_id = player_info.id
-                old_field.player_id = "-1"  # set old field to not have a player.
+        # out of bounds, stay in the same location.
+        return False, task_fields, goal_fields, pieces
 
-                self.send(messages.Data(player_info.id, self.info.finished, goal_fields={new_location: new_goal_field},
-                                        player_location=player_info.location))
+    def handle_discover_message(self, player_info: PlayerInfo, queued_at=None, request_id=None):
+        self.record_queue_wait("discover", queued_at)
+        with self.latency.measure("discover", "delay"):
+            self.clock.sleep_ms(self.discover_delay)
+        started = perf_counter()
 
-        elif self.info.is_out_of_bounds(new_location):
-            player_info.location = old_location
-            self.send(messages.Data(player_info.id, self.info.finished, player_location=player_info.location))
+        # the 3x3 window around the player (cached until any of its fields changes):
+        window = self.get_discover_window(player_info.location)
+        self.respond_to_discover(player_info, window, started, request_id)
 
-    def handle_discover_message(self, player_info: PlayerInfo):
+    def queue_discover(self, player_info: PlayerInfo, queued_at=None, request_id=None):
+        """
+        batch mode: instead of answering right away, remember the Discover. it will be answered by resolve_discovers,
+        together with all the other Discovers which are due in the same tick.
+        the player's location isn't remembered: as with an unbatched Discover (which looks around once its delay has
+        passed), the answer shows where the player is when it's sent, e.g. after a move he made in the meantime.
+        """
+        due = self.clock.time() + float(self.discover_delay) / 1000
+        with self.discover_lock:
+            self.pending_discovers.append((due, player_info, queued_at, request_id))
 
-        sleep(float(self.discover_delay) / 1000)
+    def resolve_discovers(self):
+        """
+        batch mode: runs on a thread. every tick, answers all the Discover messages whose delay has passed.
+        """
+        while self.game_on:
+            self.clock.sleep_ms(self.discover_tick)
+            self.resolve_due_discovers(self.clock.time())
 
+    def resolve_due_discovers(self, now: float) -> int:
+        """
+        one tick of the batch mode: answer the queued Discover messages which are due at the given time.
+        players standing on the same field share one DiscoverWindow, which is brought up to date once per tick
+        (before any response is sent), instead of once per Discover.
+        :param now: virtual time (see Clock.time) of the tick
+        :returns: number of Discover messages answered.
+        """
+        with self.discover_lock:
+            due = [request for request in self.pending_discovers if request[0] <= now]
+            if len(due) == 0:
+                return 0
+            self.pending_discovers = [request for request in self.pending_discovers if request[0] > now]
+
+        started = perf_counter()
+        windows = {}  # (x,y) => DiscoverWindow
+        for due_time, player_info, queued_at, request_id in due:
+            if player_info.location not in windows:
+                windows[player_info.location] = self.get_discover_window(player_info.location)
+        self.latency.record("discover", "batch_windows", perf_counter() - started)
+        self.latency.increment("discover", "batches")
+
+        for due_time, player_info, queued_at, request_id in due:
+            if queued_at is not None:
+                self.latency.record("discover", "batch_wait", perf_counter() - queued_at)
+            self.respond_to_discover(player_info, windows[player_info.location], perf_counter(), request_id)
+        return len(due)
+
+    def respond_to_discover(self, player_info: PlayerInfo, window, started=None, request_id=None):
+        """
+        send the player what he sees in the given DiscoverWindow, updating the GM's copy of his knowledge.
+        """
         goal_fields = {}
         task_fields = {}
         pieces = {}
 
-        # get all 8 neighbours
-        for (x, y), neighbour in self.info.get_neighbours(player_info.location, True).items():
-
-            # if neighbour is a TaskField, update info about a player who is standing on that Field, and about distance to piece
-            if self.info.is_task_field((x, y)):
-                player_info.info.task_fields[x, y].player_id = neighbour.player_id
-                player_info.info.task_fields[x, y].distance_to_piece = neighbour.distance_to_piece
-
-                if neighbour.has_piece:
-                    # if this field has a piece, check if player knows about it
-                    if neighbour.piece_id not in player_info.info.pieces.keys():
-                        # if he doesn't know, add an unknown piece to his info
-                        player_info.info.pieces[neighbour.piece_id] = PieceInfo(neighbour.piece_id,
-                                                                                location=neighbour.location)
-                    player_info.info.task_fields[x, y].piece_id = neighbour.piece_id
+        # update the player's knowledge about the task fields, about players standing on them and distances to pieces:
+        for location, player_id, distance_to_piece, piece_id in window.task_fields:
+            field = player_info.info.task_fields[location]
+            field.player_id = player_id
+            field.distance_to_piece = distance_to_piece
+            field.piece_id = piece_id
 
-                    pieces[neighbour.piece_id] = player_info.info.pieces[neighbour.piece_id]
-                task_fields[x, y] = player_info.info.task_fields[x, y]
-
-            else:
-                # it is a goal field.
-                # get a working copy of the new field.
-                new_goal_field = copy.deepcopy(self.info.goal_fields[neighbour.location])
-                # use the type that the player knows.
-                new_goal_field.type = player_info.info.goal_fields[neighbour.location].type
-
-                player_info.info.goal_fields[x, y] = new_goal_field
-                goal_fields[x, y] = player_info.info.goal_fields[x, y]
-
-        # add information about the player's own field:
-        if self.info.is_goal_field(player_info.location):
-            # get a working copy of the new field.
-            new_goal_field = copy.deepcopy(self.info.goal_fields[player_info.location])
-            # use the type that the player knows.
-            new_goal_field.type = player_info.info.goal_fields[player_info.location].type
-
-            player_info.info.goal_fields[player_info.location] = new_goal_field
-            goal_fields[player_info.location] = player_info.info.goal_fields[player_info.location]
-        else:
-            # it's a task field...
-            field = player_info.info.task_fields[player_info.location]
-            field.distance_to_piece = self.info.task_fields[player_info.location].distance_to_piece
-
-            if self.info.task_fields[player_info.location].has_piece:
+            if piece_id != "-1":
                 # if this field has a piece, check if player knows about it
-                piece_id = self.info.task_fields[player_info.location].piece_id
-                if piece_id not in player_info.info.pieces.keys():
+                piece_info = player_info.info.pieces.get(piece_id)
+                if piece_info is None:
                     # if he doesn't know, add an unknown piece to his info
-                    player_info.info.pieces[piece_id] = PieceInfo(piece_id, location=player_info.location)
-                player_info.info.task_fields[player_info.location].piece_id = piece_id
-
-                pieces[piece_id] = player_info.info.pieces[piece_id]
-            task_fields[player_info.location] = player_info.info.task_fields[player_info.location]
+                    piece_info = PieceInfo(piece_id, location=location)
+                    player_info.info.pieces[piece_id] = piece_info
+                pieces[piece_id] = piece_info
+            task_fields[location] = field
+
+        # goal fields: the player keeps the type he knows, everything else comes from the master board.
+        for location, player_id, allegiance in window.goal_fields:
+            field = player_info.info.goal_fields[location]
+            field.player_id = player_id
+            field.allegiance = allegiance
+            goal_fields[location] = field
 
         if len(pieces) < 1:
             pieces = None
@@ -469,11 +698,14 @@ class GameMaster(Client):
         if len(task_fields) < 1:
             task_fields = None
 
-        self.send(messages.Data(player_info.id, self.info.finished, task_fields, goal_fields, pieces))
-
-    def handle_pick_up_message(self, player_info: PlayerInfo):
+        self.send_data("discover", started, player_info, task_fields=task_fields, goal_fields=goal_fields,
+                       pieces=pieces, request_id=request_id)
 
-        sleep(float(self.pickup_delay) / 1000)
+    def handle_pick_up_message(self, player_info: PlayerInfo, queued_at=None, request_id=None):
+        self.record_queue_wait("pick_up", queued_at)
+        with self.latency.measure("pick_up", "delay"):
+            self.clock.sleep_ms(self.pickup_delay)
+        started = perf_counter()
 
         location = player_info.location
 
@@ -483,7 +715,7 @@ class GameMaster(Client):
             if self.info.has_piece(location[0], location[1]):
                 # update GM's knowledge:
                 piece_id = self.info.task_fields[location].piece_id
-                self.info.pieces[piece_id].player_id = player_info.id
+                self.info.pieces.pick_up(piece_id, player_info.id)
                 self.info.task_fields[location].piece_id = "-1"  # setting as empty
 
                 # we update the GM's info of distance to pieces so it sends valid data later to player
@@ -502,32 +734,34 @@ class GameMaster(Client):
                 players_piece_info.piece_id = "-1"
 
                 # send him piece Data with his info about the piece
-                self.send(messages.Data(player_info.id, self.info.finished, pieces={piece_id: players_piece_info}))
+                self.send_data("pick_up", started, player_info, pieces={piece_id: players_piece_info},
+                               request_id=request_id)
 
             else:
                 # no piece on this field. respond with an empty Data message
-                self.send(messages.Data(player_info.id, self.info.finished))
+                self.send_data("pick_up", started, player_info, request_id=request_id)
         else:
             # piece isn't a task field, there can be no pieces on it to pick up, respond with an empty Data message
-            self.send(messages.Data(player_info.id, self.info.finished))
+            self.send_data("pick_up", started, player_info, request_id=request_id)
 
-    def handle_place_message(self, player_info: PlayerInfo):
-
-        sleep(float(self.placing_delay) / 1000)
+    def handle_place_message(self, player_info: PlayerInfo, queued_at=None, request_id=None):
+        self.record_queue_wait("place", queued_at)
+        with self.latency.measure("place", "delay"):
+            self.clock.sleep_ms(self.placing_delay)
+        started = perf_counter()
 
         # check if that player really has a piece:
         piece_id = player_info.piece_id
         if piece_id == "-1" or piece_id is None:
             # seems like the player doesn't have a piece at all. send him an empty Data message
-            self.send(messages.Data(player_info.id, self.info.finished))
+            self.send_data("place", started, player_info, request_id=request_id)
 
         else:
             # check if the player is standing on TaskField or GoalField:
             if self.info.is_task_field(player_info.location):
                 # update GM's info
                 self.info.task_fields[player_info.location].piece_id = piece_id
-                self.info.pieces[piece_id].location = player_info.location
-                self.info.pieces[piece_id].player_id = "-1"  # mark as untaken.
+                self.info.pieces.put_down(piece_id, player_info.location)  # mark as untaken.
 
                 # update player's info
                 player_info.info.task_fields[player_info.location].piece_id = piece_id
@@ -537,27 +771,22 @@ class GameMaster(Client):
                 field = player_info.info.task_fields[player_info.location]
 
                 # send him a response
-                self.send(messages.Data(player_info.id, self.info.finished, task_fields={field.id: field}))
+                self.send_data("place", started, player_info, task_fields={field.location: field},
+                               request_id=request_id)
 
             else:
                 # the field is a goal field.
 
-                # warning: this piece will be consumed and never again picked up.
-                # as such it should probably be deleted from the dict of all pieces.
-                # however, i want to avoid thread synchronization problems that could occur due to changing the size of a dict during runtime
-                # hence i set the owner of a piece to -1 and its location to None :)
-
-                # update GM's info:
-                self.info.pieces[piece_id].player_id = "-1"
-                self.info.pieces[piece_id].location = None
+                # this piece will be consumed and never again picked up, so it's removed from the store
+                # (and from what the players know), and its slot will be reused by a new piece.
+                consumed_piece = self.info.pieces.consume(piece_id)
+                self.forget_piece(piece_id)
 
                 # update player info.
                 player_info.piece_id = "-1"  # he holds nothing.
-                player_info.info.pieces[piece_id].player_id = "-1"
-                player_info.info.pieces[piece_id].location = None
 
                 # check if the piece is legit:
-                if self.info.pieces[piece_id].type == PieceType.NORMAL.value:
+                if consumed_piece is not None and consumed_piece.type == PieceType.NORMAL.value:
 
                     # update player info about this field
                     field = self.info.goal_fields[player_info.location]
@@ -570,11 +799,45 @@ class GameMaster(Client):
                     self.check_for_game_over(player_info)
 
                     # send information about the true nature of this goal field
-                    self.send(messages.Data(player_info.id, self.info.finished, goal_fields={field.location: field}))
+                    self.send_data("place", started, player_info, goal_fields={field.location: field},
+                                   request_id=request_id)
 
                 else:
                     # piece is a sham, send an empty Data message
-                    self.send(messages.Data(player_info.id, self.info.finished))
+                    self.send_data("place", started, player_info, request_id=request_id)
+
+    def handle_knowledge_exchange_message(self, with_player_id, player_info: PlayerInfo, queued_at=None):
+        """
+        a player wants to exchange knowledge with another one. ask the other player (he will answer the requester
+        directly: with an AcceptExchangeRequest followed by his knowledge, or with a RejectKnowledgeExchange).
+        """
+        self.record_queue_wait("knowledge_exchange", queued_at)
+        with self.latency.measure("knowledge_exchange", "delay"):
+            self.clock.sleep_ms(self.knowledge_exchange_delay)
+
+        other_player = self.find_player_by_id(with_player_id)
+        if other_player is None or other_player is player_info:
+            # there's no one to exchange knowledge with.
+            self.send(messages.RejectKnowledgeExchange(player_info.id, with_player_id, True))
+            return
+
+        # both players are going to learn things the GM doesn't know they know, so in delta mode
+        # we can no longer assume that they have what we sent them last:
+        for player in (player_info, other_player):
+            player.sent_fields = {}
+            player.sent_pieces = {}
+
+        with self.latency.measure("knowledge_exchange", "send"):
+            self.send(messages.KnowledgeExchangeRequest(other_player.id, player_info.id))
+
+    def forget_piece(self, piece_id):
+        """
+        remove a consumed piece from the knowledge of all players.
+        """
+        for team in self.info.teams.values():
+            for player in team.values():
+                player.info.pieces.pop(piece_id, None)
+                player.sent_pieces.pop(piece_id, None)
 
     def check_for_game_over(self, player_info: PlayerInfo):
         # update self.info.finished and self.game_on if a team has completed all its goals.
@@ -590,14 +853,73 @@ class GameMaster(Client):
         """
         re-calculates distance_to_piece field in all TaskFields on the board.
         """
-        for field in self.info.task_fields.values():
-            min_piece, min_dist = None, None
-            for piece in [piece for piece in self.info.pieces.values() if piece.location is not None]:
-                if min_dist is None:
-                    min_piece, min_dist = piece, manhattan(field.location, piece.location)
-                if manhattan(field.location, piece.location) <= min_dist:
-                    min_piece, min_dist = piece, manhattan(field.location, piece.location)
-            field.distance_to_piece = min_dist
+        with self.latency.measure("board", "update_field_distances"):
+            pieces_on_board = self.info.pieces.on_board()
+            # with no piece on the board, every field gets a distance longer than any real one (it can't be empty):
+            no_piece_distance = self.info.board_width + self.info.whole_board_length
+            for field in self.info.task_fields.values():
+                min_piece, min_dist = None, no_piece_distance if len(pieces_on_board) == 0 else None
+                for piece in pieces_on_board:
+                    if min_dist is None:
+                        min_piece, min_dist = piece, manhattan(field.location, piece.location)
+                    if manhattan(field.location, piece.location) <= min_dist:
+                        min_piece, min_dist = piece, manhattan(field.location, piece.location)
+                field.distance_to_piece = min_dist
+
+    def get_discover_window(self, location):
+        """
+        :returns: an up-to-date DiscoverWindow of the given location (the location itself and its 8 neighbours).
+        """
+        window = self.discover_windows.get(location)
+        if window is None:
+            fields = list(self.info.get_neighbours(location, True).values())
+            if self.info.is_task_field(location):
+                fields.append(self.info.task_fields[location])
+            else:
+                fields.append(self.info.goal_fields[location])
+            window = DiscoverWindow(fields)
+            self.discover_windows[location] = window
+
+        if window.refresh():
+            self.latency.increment("discover", "window_rebuilt")
+        else:
+            self.latency.increment("discover", "window_reused")
+        return window
+
+    def record_queue_wait(self, action, queued_at):
+        """
+        record how long a message waited between being received in play() and being picked up by its handler.
+        """
+        if queued_at is not None:
+            self.latency.record(action, "queue_wait", perf_counter() - queued_at)
+
+    def send_data(self, action, compute_started, player_info: PlayerInfo, **data):
+        """
+        build a Data message for the player and send it, recording the compute, serialization and send times.
+        :param action: name of the action the message responds to, e.g. "move"
+        :param compute_started: perf_counter() value from when the handler started updating the board, or None if
+        the handler records the compute time itself
+        :param data: keyword arguments passed to messages.Data (including request_id of the message answered)
+        """
+        if compute_started is not None:
+            self.latency.record(action, "compute", perf_counter() - compute_started)
+        if self.delta_data:
+            with self.latency.measure(action, "delta"):
+                strip_known_data(player_info, data)
+        with self.latency.measure(action, "serialize"):
+            message = messages.Data(player_info.id, self.info.finished, game_id=self.info.id, **data)
+        with self.latency.measure(action, "send"):
+            self.send(message)
+
+    def dump_latency(self):
+        """
+        print out all the latency histograms collected so far.
+        """
+        self.verbose_debug("Latency report:\n" + self.latency.dump(), True)
+
+    def shutdown(self):
+        self.dump_latency()
+        super().shutdown()
 
     def play(self):
         # send the initial Game message to all players:
@@ -609,41 +931,83 @@ class GameMaster(Client):
         # deploy the Piece-placing thread:
         Thread(target=self.place_pieces).start()
 
-        while self.game_on:
+        if self.discover_tick:
+            # deploy the thread answering Discover messages in batches:
+            Thread(target=self.resolve_discovers, daemon=True).start()
+
+        # the game ends on a handler thread (see check_for_game_over), but the loop goes on until the server confirms
+        # that it has closed the game: leaving earlier would shut the socket down under the handler's final Data.
+        while True:
             try:
                 message = self.receive()
                 if message is None:
                     raise ConnectionAbortedError
+                received_at = perf_counter()
 
                 # handling depends on type of message:
                 root = ET.fromstring(message)
 
                 player_guid = root.attrib.get("playerGuid")
                 player_info = self.find_player_by_guid(player_guid)
+                request_id = root.attrib.get("requestId")  # echoed in the response, if the player sent one
+
+                if "GameFinished" in message:
+                    # the server has closed the game and released the players.
+                    self.game_on = False
+                    break
+
+                if "PlayerDisconnected" in message:
+                    self.remove_player(root.attrib.get("playerId"))
+
+                elif "MovePath" in message:
+                    directions = [step.get('direction') for step in root.findall(XML_MESSAGE_TAG + "Step")]
+                    target = root.find(XML_MESSAGE_TAG + "Target")
+                    if target is not None:
+                        target = int(target.get('x')), int(target.get('y'))
+                    Thread(target=self.handle_move_path_message,
+                           args=[directions, target, player_info, received_at, request_id], daemon=True).start()
 
-                if "Move" in message:
+                elif "Move" in message:
                     direction = root.get('direction')
-                    Thread(target=self.handle_move_message, args=[direction, player_info], daemon=True).start()
+                    Thread(target=self.handle_move_message, args=[direction, player_info, received_at, request_id],
+                           daemon=True).start()
 
                 elif "Discover" in message:
-                    Thread(target=self.handle_discover_message, args=[player_info], daemon=True).start()
+                    if self.discover_tick:
+                        self.queue_discover(player_info, received_at, request_id)
+                    else:
+                        Thread(target=self.handle_discover_message, args=[player_info, received_at, request_id],
+                               daemon=True).start()
 
                 elif "PlacePiece" in message:
-                    Thread(target=self.handle_place_message, args=[player_info], daemon=True).start()
+                    Thread(target=self.handle_place_message, args=[player_info, received_at, request_id],
+                           daemon=True).start()
 
                 elif "PickUpPiece" in message:
-                    Thread(target=self.handle_pick_up_message, args=[player_info], daemon=True).start()
+                    Thread(target=self.handle_pick_up_message, args=[player_info, received_at, request_id],
+                           daemon=True).start()
+
+                elif "AuthorizeKnowledgeExchange" in message:
+                    with_player_id = root.get('withPlayerId')
+                    Thread(target=self.handle_knowledge_exchange_message,
+                           args=[with_player_id, player_info, received_at], daemon=True).start()
 
                     # TODO: add handling of other types of messages
 
+                self.latency.record("play", "dispatch", perf_counter() - received_at)
+
             except Exception as e:
                 self.verbose_debug("Is this an error I see before me? " + str(e), True)
                 raise e
 
 
 if __name__ == '__main__':
-    def simulate(verbose):
-        gm = GameMaster(verbose)
+    def simulate(verbose, dilation, delta_data, discover_tick, transport):
+        gm = GameMaster(verbose, clock=Clock(dilation), delta_data=delta_data, discover_tick=discover_tick,
+                        transport=transport)
+        if hasattr(signal, "SIGUSR1"):
+            # kill -USR1 <pid> prints out the latency report without stopping the game
+            signal.signal(signal.SIGUSR1, lambda signum, frame: gm.dump_latency())
         if gm.connect():
             gm.run()
             gm.shutdown()
@@ -651,5 +1015,11 @@ if __name__ == '__main__':
 
     parser = ArgumentParser()
     parser.add_argument('-v', '--verbose', action='store_true', default=False, help='Use verbose debugging mode.')
+    parser.add_argument('-d', '--dilation', default=1, help='How many times faster than real time the clock runs.')
+    parser.add_argument('--delta', action='store_true', default=False,
+                        help='Only send fields and pieces which changed since the player last received them.')
+    parser.add_argument('--discover-tick', type=int, default=None,
+                        help='Answer Discover messages in batches, once every given number of ms.')
+    parser.add_argument('-t', '--transport', default=TCP, choices=TRANSPORTS, help='How to connect to the server.')
     args = vars(parser.parse_args())
-    simulate(args["verbose"])
+    simulate(args["verbose"], float(args["dilation"]), args["delta"], args["discover_tick"], args["transport"])
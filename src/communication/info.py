@@ -1,5 +1,19 @@
+from bisect import bisect_left
 from datetime import datetime
 from enum import Enum
+from threading import RLock
+
+from src.communication.framing import MessageBuffer
+
+
+def parse_timestamp(timestamp) -> datetime:
+    """
+    timestamps are kept either as datetimes (created locally) or as strings (parsed from XML messages).
+    :returns: the timestamp as a datetime
+    """
+    if isinstance(timestamp, datetime):
+        return timestamp
+    return datetime.fromisoformat(str(timestamp))
 
 
 class Location:
@@ -51,12 +65,24 @@ class GoalFieldType(Enum):
 
 
 class FieldInfo:
+    # changing any of these attributes bumps the field's version counter:
+    VERSIONED_ATTRIBUTES = frozenset(["player_id", "piece_id", "distance_to_piece", "type", "allegiance"])
+
     def __init__(self, x=0, y=0, timestamp=datetime.now(), player_id="-1"):
+        self.version = 0  # grows every time the content of the field changes, see __setattr__
         self.x = x
         self.y = y
         self.timestamp = timestamp
         self.player_id = player_id
 
+    def __setattr__(self, key, value):
+        changed = key in FieldInfo.VERSIONED_ATTRIBUTES and self.__dict__.get(key, value) != value
+        self.__dict__[key] = value
+        if changed:
+            # (the version goes up only after the new value is in place: a DiscoverWindow refreshing on another thread
+            # in the meantime may snapshot the new value under the old version, but never the old value under the new)
+            self.__dict__["version"] += 1
+
     @property
     def is_occupied(self):
         return not (self.player_id == "-1" or self.player_id is None)
@@ -112,6 +138,49 @@ class GoalFieldInfo(FieldInfo):
         self.type = type
 
 
+class GoalFieldView:
+    """
+    read-only view of a (master) GoalFieldInfo, with the type replaced by what a given player knows about the field.
+    used instead of copying the field when answering players, so no GoalFieldInfo has to be created.
+    """
+    __slots__ = ("field", "type")
+
+    def __init__(self, field: GoalFieldInfo, type):
+        object.__setattr__(self, "field", field)
+        object.__setattr__(self, "type", type)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("GoalFieldView is read-only")
+
+    @property
+    def x(self):
+        return self.field.x
+
+    @property
+    def y(self):
+        return self.field.y
+
+    @property
+    def location(self):
+        return self.field.location
+
+    @property
+    def player_id(self):
+        return self.field.player_id
+
+    @property
+    def allegiance(self):
+        return self.field.allegiance
+
+    @property
+    def timestamp(self):
+        return self.field.timestamp
+
+    @property
+    def is_occupied(self):
+        return self.field.is_occupied
+
+
 class PieceInfo:
     def __init__(self, id="-1", type=PieceType.UNKNOWN.value, player_id="-1", location=None, timestamp=datetime.now()):
         self.id = id
@@ -121,6 +190,296 @@ class PieceInfo:
         self.timestamp = timestamp
 
 
+class GoalIndex:
+    """
+    locations of the goal fields of one team which are still unknown to a player. they are kept row by row,
+    in sorted lists, so that the nearest one is found by looking at a couple of fields in every row,
+    instead of at the whole goal area.
+    """
+
+    def __init__(self):
+        self.rows = {}  # y => sorted list of x
+        self.count = 0
+
+    def add(self, location: tuple):
+        row = self.rows.setdefault(location[1], [])
+        index = bisect_left(row, location[0])
+        if index == len(row) or row[index] != location[0]:
+            row.insert(index, location[0])
+            self.count += 1
+
+    def discard(self, location: tuple):
+        row = self.rows.get(location[1])
+        if row is None:
+            return
+        index = bisect_left(row, location[0])
+        if index < len(row) and row[index] == location[0]:
+            del row[index]
+            self.count -= 1
+            if len(row) == 0:
+                del self.rows[location[1]]
+
+    def nearest(self, location: tuple, accept=None):
+        """
+        :param accept: optional predicate on locations, fields for which it returns False are skipped.
+        :returns: the location closest to the given one (in Manhattan distance), or None if there isn't any.
+        """
+        best, best_distance = None, None
+        for y in sorted(self.rows, key=lambda row_y: abs(row_y - location[1])):
+            dy = abs(y - location[1])
+            if best_distance is not None and dy >= best_distance:
+                break  # the other rows are even further away.
+            row = self.rows[y]
+            index = bisect_left(row, location[0])
+            # walk away from location to the right, and to the left, until an accepted field is found:
+            for indices in (range(index, len(row)), range(index - 1, -1, -1)):
+                for i in indices:
+                    distance = dy + abs(row[i] - location[0])
+                    if best_distance is not None and distance >= best_distance:
+                        break
+                    if accept is None or accept((row[i], y)):
+                        best, best_distance = (row[i], y), distance
+                        break
+        return best
+
+    def __contains__(self, location: tuple):
+        row = self.rows.get(location[1], [])
+        index = bisect_left(row, location[0])
+        return index < len(row) and row[index] == location[0]
+
+    def __len__(self):
+        return self.count
+
+
+class KnowledgeStore:
+    """
+    player's index of what he knows about the pieces: who holds which of them and where the ones lying on the board
+    are. kept up to date field by field and piece by piece (see update_field and update_piece), so that none of it
+    has to be found by looking through the whole board or all the pieces.
+    """
+
+    def __init__(self):
+        self.holders = {}  # player id => id of the piece he holds
+        self.piece_locations = {}  # (x,y) => id of the piece lying there
+        self.version = 0  # grows every time piece_locations changes
+        self._held = {}  # piece id => id of the player holding it
+        self._located = {}  # piece id => (x,y) of the task field it lies on
+        self._nearest = {}  # (x,y) => location of the nearest known piece, valid for self._nearest_version
+        self._nearest_version = 0
+
+    def update_piece(self, piece: PieceInfo):
+        """
+        bring the index up to date after the given piece was changed.
+        """
+        holder = self._held.pop(piece.id, None)
+        if holder is not None and self.holders.get(holder) == piece.id:
+            del self.holders[holder]
+        if piece.player_id is not None and piece.player_id != "-1":
+            self._held[piece.id] = piece.player_id
+            self.holders[piece.player_id] = piece.id
+            self.forget_location(piece.id)
+        elif piece.id in self._located:
+            # its field was seen before the piece itself.
+            piece.location = self._located[piece.id]
+
+    def update_field(self, field: TaskFieldInfo, pieces: dict = None):
+        """
+        bring the index up to date after the given task field was changed.
+        :param pieces: pieceId => PieceInfo, the location of the piece lying on the field is set there, if it's known.
+        """
+        location = field.location
+        piece_id = self.piece_locations.get(location)
+        if piece_id == field.piece_id:
+            return
+        if piece_id is not None:
+            del self.piece_locations[location]
+            del self._located[piece_id]
+        if field.has_piece:
+            self.forget_location(field.piece_id)
+            self.piece_locations[location] = field.piece_id
+            self._located[field.piece_id] = location
+            if pieces is not None and field.piece_id in pieces:
+                pieces[field.piece_id].location = location
+        self.version += 1
+
+    def forget_location(self, piece_id):
+        location = self._located.pop(piece_id, None)
+        if location is not None:
+            del self.piece_locations[location]
+            self.version += 1
+
+    def held_by(self, player_id) -> str:
+        """
+        :returns: id of the piece held by the given player, or "-1" if he doesn't hold any (as far as we know).
+        """
+        return self.holders.get(player_id, "-1")
+
+    def nearest_piece(self, location: tuple):
+        """
+        :returns: location of the known piece closest to the given location (in Manhattan distance),
+        or None if we don't know about any. remembered until a piece is found or disappears somewhere.
+        """
+        if self._nearest_version != self.version:
+            self._nearest.clear()
+            self._nearest_version = self.version
+        if location not in self._nearest:
+            self._nearest[location] = min(self.piece_locations, default=None, key=lambda piece_location: abs(
+                piece_location[0] - location[0]) + abs(piece_location[1] - location[1]))
+        return self._nearest[location]
+
+
+class PieceStore:
+    """
+    GameMaster's storage of pieces. keeps pieces lying on the board (live) and pieces held by players (carried)
+    separately. consumed pieces (placed in a goal area) are dropped from the store and their slot is reclaimed.
+
+    piece ids are generation-tagged: id = generation * SLOT_STRIDE + slot. every time a slot is reused its generation
+    goes up, so an id of a consumed piece never points to the new piece living in the same slot.
+    """
+    SLOT_STRIDE = 1 << 16  # maximal number of slots, i.e. maximal number of not yet consumed pieces
+
+    def __init__(self, max_live_pieces=None):
+        """
+        :param max_live_pieces: cap on the number of pieces lying on the board. None means no cap.
+        """
+        self.max_live_pieces = max_live_pieces
+        self.consumed_count = 0
+        self._pieces = {}  # pieceId => PieceInfo, only live and carried pieces
+        self._live_ids = set()
+        self._carried_ids = set()
+        self._generations = []  # slot => current generation of the slot
+        self._free_slots = []  # slots of consumed pieces, ready to be reused
+        self._lock = RLock()  # handlers of the GameMaster run on separate threads
+
+    @staticmethod
+    def slot_of(piece_id):
+        return int(piece_id) % PieceStore.SLOT_STRIDE
+
+    @staticmethod
+    def generation_of(piece_id):
+        return int(piece_id) // PieceStore.SLOT_STRIDE
+
+    @property
+    def live_count(self):
+        return len(self._live_ids)
+
+    @property
+    def carried_count(self):
+        return len(self._carried_ids)
+
+    @property
+    def is_full(self):
+        return self.max_live_pieces is not None and self.live_count >= self.max_live_pieces
+
+    def new_piece(self, type=PieceType.UNKNOWN.value, location=None):
+        """
+        create a new piece lying on the given location.
+        :returns: the new PieceInfo, or None if the cap on live pieces has been reached.
+        """
+        with self._lock:
+            if self.is_full:
+                return None
+            if len(self._free_slots) > 0:
+                slot = self._free_slots.pop()
+                self._generations[slot] += 1
+            else:
+                slot = len(self._generations)
+                if slot >= PieceStore.SLOT_STRIDE:
+                    return None
+                self._generations.append(0)
+
+            piece_id = str(self._generations[slot] * PieceStore.SLOT_STRIDE + slot)
+            piece = PieceInfo(piece_id, type, location=location, timestamp=datetime.now())
+            self._pieces[piece_id] = piece
+            self._live_ids.add(piece_id)
+            return piece
+
+    def pick_up(self, piece_id, player_id):
+        """
+        mark a live piece as carried by a player.
+        """
+        with self._lock:
+            piece = self._pieces[piece_id]
+            piece.player_id = player_id
+            piece.location = None
+            piece.timestamp = datetime.now()
+            self._live_ids.discard(piece_id)
+            self._carried_ids.add(piece_id)
+            return piece
+
+    def put_down(self, piece_id, location):
+        """
+        mark a carried piece as lying on the board again.
+        """
+        with self._lock:
+            piece = self._pieces[piece_id]
+            piece.player_id = "-1"
+            piece.location = location
+            piece.timestamp = datetime.now()
+            self._carried_ids.discard(piece_id)
+            self._live_ids.add(piece_id)
+            return piece
+
+    def consume(self, piece_id):
+        """
+        remove a piece from the game for good (it was placed in a goal area) and reclaim its slot.
+        :returns: the consumed PieceInfo, or None if the id is unknown or stale.
+        """
+        with self._lock:
+            piece = self._pieces.pop(piece_id, None)
+            if piece is None:
+                return None
+            self._live_ids.discard(piece_id)
+            self._carried_ids.discard(piece_id)
+            self._free_slots.append(PieceStore.slot_of(piece_id))
+            self.consumed_count += 1
+            piece.player_id = "-1"
+            piece.location = None
+            return piece
+
+    def on_board(self):
+        """
+        :returns: a list of all live pieces (the ones lying on the board).
+        """
+        with self._lock:
+            return [self._pieces[piece_id] for piece_id in self._live_ids]
+
+    def carried(self):
+        """
+        :returns: a list of all pieces currently held by players.
+        """
+        with self._lock:
+            return [self._pieces[piece_id] for piece_id in self._carried_ids]
+
+    # dict-like access, so that the store can be used in place of GameInfo.pieces:
+    def get(self, piece_id, default=None):
+        return self._pieces.get(piece_id, default)
+
+    def keys(self):
+        with self._lock:
+            return list(self._pieces.keys())
+
+    def values(self):
+        with self._lock:
+            return list(self._pieces.values())
+
+    def items(self):
+        with self._lock:
+            return list(self._pieces.items())
+
+    def __getitem__(self, piece_id):
+        return self._pieces[piece_id]
+
+    def __contains__(self, piece_id):
+        return piece_id in self._pieces
+
+    def __len__(self):
+        return len(self._pieces)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
 class ClientInfo:
     """might not actually be used that much, encapsulate some information about client id, their type etc."""
 
@@ -128,6 +487,7 @@ class ClientInfo:
         self.id = id
         self.tag = tag
         self.socket = socket
+        self.received = MessageBuffer()  # bytes received from the client, split into messages
         self.game_name = game_name
         self.game_id = game_id
         self.game_master_id = game_master_id
@@ -161,10 +521,120 @@ class GameInfo:
 
         self.teams = {Allegiance.RED.value: {}, Allegiance.BLUE.value: {}}
         # self.teams is a dict of dicts: team => {player_id => PlayerInfo}
+        self.unknown_goals = {Allegiance.RED.value: GoalIndex(), Allegiance.BLUE.value: GoalIndex()}
+        # team => GoalIndex of the team's goal fields whose type is unknown, see update_goal_index
+        self.knowledge = KnowledgeStore()  # held pieces and known piece locations, see update_piece_index
 
         self.max_blue_players = max_blue_players
         self.max_red_players = max_red_players
 
+        self.created = datetime.now()  # anything older than that is a default value, not actual knowledge
+
+    def knowledge_since(self, since: datetime = None, limit: int = None):
+        """
+        collect the fields and pieces which were updated after the given moment (used in knowledge exchange).
+        :param since: only newer knowledge is collected. if None, everything learned since creation is collected.
+        :param limit: maximal number of fields and pieces to collect, the newest ones are kept.
+        :returns: a tuple: (task_fields, goal_fields, pieces, newest_timestamp), dicts as in GameInfo.
+        """
+        if since is None:
+            since = self.created
+
+        updates = []  # (timestamp, collection index, key, info)
+        for index, collection in enumerate((self.task_fields, self.goal_fields, self.pieces)):
+            for key, info in collection.items():
+                timestamp = parse_timestamp(info.timestamp)
+                if timestamp > since:
+                    updates.append((timestamp, index, key, info))
+
+        if limit is not None and len(updates) > limit:
+            updates.sort(key=lambda update: update[0], reverse=True)
+            updates = updates[:limit]
+
+        collected = ({}, {}, {})
+        newest = since
+        for timestamp, index, key, info in updates:
+            collected[index][key] = info
+            newest = max(newest, timestamp)
+        return collected[0], collected[1], collected[2], newest
+
+    def merge_knowledge(self, task_fields: dict = None, goal_fields: dict = None, pieces: dict = None):
+        """
+        merge knowledge received from another player. a field or a piece is overwritten only if the received
+        information is newer than ours. types of goal fields and pieces never change, so a known type is always kept.
+        :returns: number of fields and pieces which were updated.
+        """
+        updated = 0
+
+        for location, field in (task_fields or {}).items():
+            own_field = self.task_fields.get(location)
+            if own_field is not None and parse_timestamp(field.timestamp) > parse_timestamp(own_field.timestamp):
+                own_field.player_id = field.player_id
+                own_field.distance_to_piece = field.distance_to_piece
+                own_field.piece_id = field.piece_id
+                own_field.timestamp = field.timestamp
+                self.update_piece_index(location=location)
+                updated += 1
+
+        for location, field in (goal_fields or {}).items():
+            own_field = self.goal_fields.get(location)
+            if own_field is None:
+                continue
+            changed = False
+            if parse_timestamp(field.timestamp) > parse_timestamp(own_field.timestamp):
+                own_field.player_id = field.player_id
+                own_field.allegiance = field.allegiance
+                own_field.timestamp = field.timestamp
+                changed = True
+            if own_field.type == GoalFieldType.UNKNOWN.value and field.type != GoalFieldType.UNKNOWN.value:
+                own_field.type = field.type
+                changed = True
+            if changed:
+                self.update_goal_index(location)
+            updated += changed
+
+        for piece_id, piece in (pieces or {}).items():
+            own_piece = self.pieces.get(piece_id)
+            if own_piece is None:
+                self.pieces[piece_id] = piece
+                self.update_piece_index(piece_id)
+                updated += 1
+                continue
+            changed = False
+            if parse_timestamp(piece.timestamp) > parse_timestamp(own_piece.timestamp):
+                own_piece.player_id = piece.player_id
+                own_piece.timestamp = piece.timestamp
+                changed = True
+            if own_piece.type == PieceType.UNKNOWN.value and piece.type != PieceType.UNKNOWN.value:
+                own_piece.type = piece.type
+                changed = True
+            if changed:
+                self.update_piece_index(piece_id)
+            updated += changed
+
+        return updated
+
+    def update_goal_index(self, location: tuple):
+        """
+        bring self.unknown_goals up to date after the goal field on the given location was changed.
+        """
+        field = self.goal_fields[location]
+        for team, index in self.unknown_goals.items():
+            if team == field.allegiance and field.type == GoalFieldType.UNKNOWN.value:
+                index.add(location)
+            else:
+                index.discard(location)
+
+    def update_piece_index(self, piece_id=None, location: tuple = None):
+        """
+        bring self.knowledge up to date after the piece with the given id, or the task field on the given location,
+        was changed.
+        """
+        if piece_id is not None:
+            self.knowledge.update_piece(self.pieces[piece_id])
+        if location is not None:
+            self.knowledge.update_field(self.task_fields[location], self.pieces)
+
     def check_for_empty_task_fields(self):
         for task_field in self.task_fields.values():
             if task_field.piece_id == "-1":
@@ -233,6 +703,7 @@ class GameInfo:
             for x in range(self.board_width):
                 if (x, y) not in self.goal_fields.keys():
                     self.goal_fields[x, y] = GoalFieldInfo(x, y, Allegiance.RED.value)
+                    self.update_goal_index((x, y))
             y -= 1
 
         for i in range(self.task_height):
@@ -245,6 +716,7 @@ class GameInfo:
             for x in range(self.board_width):
                 if (x, y) not in self.goal_fields.keys():
                     self.goal_fields[x, y] = GoalFieldInfo(x, y, Allegiance.BLUE.value)
+                    self.update_goal_index((x, y))
             y -= 1
 
 
@@ -262,3 +734,7 @@ class PlayerInfo():
         self.location = location
         self.piece_id = piece_id
         self.guid = guid
+
+        # what the GameMaster has last sent to this player (used by the GM's delta mode):
+        self.sent_fields = {}  # (x,y) => tuple of field values
+        self.sent_pieces = {}  # pieceId => tuple of piece values
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+import os
+import xml.etree.ElementTree as ET
+from heapq import heappop, heappush
+from threading import Lock
+
+from src.communication.clock import Clock, REAL_TIME
+
+FALLBACK_KEEP_ALIVE_INTERVAL = 500  # ms, for a process started where there's no GameMasterSettings.xml to read
+IDLE_INTERVALS = 4  # keep-alive intervals of silence after which the server considers a client dead
+
+
+def read_keep_alive_interval(path: str = None) -> int:
+    """
+    :param path: settings file, GameMasterSettings.xml in the working directory by default
+    :returns: KeepAliveInterval (in ms) of the settings: how often every client (GM or player) sends a keep-alive.
+    """
+    if path is None:
+        path = os.path.join(os.getcwd(), "GameMasterSettings.xml")
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return FALLBACK_KEEP_ALIVE_INTERVAL
+    return int(root.attrib.get("KeepAliveInterval", FALLBACK_KEEP_ALIVE_INTERVAL))
+
+
+def idle_timeout(keep_alive_interval: int) -> float:
+    """
+    :returns: seconds of silence after which a client sending keep-alives every keep_alive_interval ms is dead.
+    """
+    return IDLE_INTERVALS * keep_alive_interval / 1000
+
+
+_keep_alive_interval = None  # read from the settings on the first call of keep_alive_interval()
+
+
+def keep_alive_interval() -> int:
+    """
+    :returns: KeepAliveInterval (in ms) of GameMasterSettings.xml in the working directory. the file is read
+    only once, when it's first needed (not on import, so that importing doesn't depend on the working directory).
+    """
+    global _keep_alive_interval
+    if _keep_alive_interval is None:
+        _keep_alive_interval = read_keep_alive_interval()
+    return _keep_alive_interval
+
+
+def default_idle_timeout() -> float:
+    """
+    :returns: idle timeout (in seconds) matching the keep-alives the clients send, see keep_alive_interval().
+    """
+    return idle_timeout(keep_alive_interval())
+
+
+class IdleTracker:
+    """
+    keeps track of when each client was last heard from, to find the ones which went silent for too long.
+    one heap of deadlines serves all the clients: touching a client only updates his last-seen time,
+    and his deadline is moved forward lazily, when it comes up on the heap. each time a client starts being
+    tracked, his entries get a new generation, so the entries left over from before he was forgotten are skipped.
+    """
+
+    def __init__(self, timeout: float, clock: Clock = None):
+        """
+        :param timeout: how many seconds of silence make a client dead
+        """
+        self.timeout = timeout
+        self.clock = clock if clock is not None else REAL_TIME
+        self.last_seen = {}  # client id => clock time of the last message (or keep-alive) from the client
+        self.generations = {}  # client id => generation of his current heap entry
+        self.generation_counter = 0
+        self.deadlines = []  # heap of (deadline, generation, client id), one current entry per client
+        self.lock = Lock()
+
+    def touch(self, client_id):
+        now = self.clock.time()
+        with self.lock:
+            if client_id not in self.last_seen:
+                self.generation_counter += 1
+                self.generations[client_id] = self.generation_counter
+                heappush(self.deadlines, (now + self.timeout, self.generation_counter, client_id))
+            self.last_seen[client_id] = now
+
+    def forget(self, client_id):
+        with self.lock:
+            self.last_seen.pop(client_id, None)
+            self.generations.pop(client_id, None)
+
+    def expired(self) -> list:
+        """
+        :returns: ids of the clients who haven't been heard from within the timeout. they are forgotten.
+        """
+        now = self.clock.time()
+        dead = []
+        with self.lock:
+            while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+                deadline, generation, client_id = heappop(self.deadlines)
+                if self.generations.get(client_id) != generation:
+                    continue  # forgotten in the meantime (and maybe tracked again, with a newer entry).
+                last_seen = self.last_seen[client_id]
+                if last_seen + self.timeout <= now:
+                    del self.last_seen[client_id]
+                    del self.generations[client_id]
+                    dead.append(client_id)
+                else:
+                    heappush(self.deadlines, (last_seen + self.timeout, generation, client_id))
+        return dead
+
+    def time_to_next_deadline(self) -> float:
+        """
+        :returns: seconds until the earliest deadline (the timeout, if no client is tracked).
+        """
+        with self.lock:
+            if len(self.deadlines) == 0:
+                return self.timeout
+            return max(0.0, self.deadlines[0][0] - self.clock.time())
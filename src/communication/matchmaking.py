@@ -0,0 +1,150 @@
+from collections import deque
+from threading import RLock
+
+from src.communication.info import Allegiance
+
+TEAMS = (Allegiance.RED.value, Allegiance.BLUE.value)
+
+
+class MatchmakingQueue:
+    """
+    server's index of the open places in the games which haven't started yet, used to seat players who want to join
+    any game (see JoinAnyGame). games are kept in buckets by team, team size and number of free places in the team,
+    so finding a place never looks at more than a few buckets, however many games there are.
+
+    a player gets a place in the fullest game which has one in his team (the one closest to starting), so concurrent
+    games fill up one after another instead of all of them waiting for the last few players. players for whom there's
+    no place wait in the queue until a game is registered or a place is freed.
+    """
+
+    def __init__(self):
+        self.free = {}  # game id => {team => number of free places}
+        self.capacity = {}  # game id => {team => number of players in the team}
+        self.buckets = {team: {} for team in TEAMS}  # team => {team size => {free places => {game id: None}}}
+        self.seats = {}  # player id => (game id, team) of the place he took, in a game which hasn't started yet
+        self.seated = {}  # game id => set of ids of the players who took places in it
+        self.waiting = deque()  # (player id, preferred team, preferred role, team size or None) in order of arrival
+        self._lock = RLock()  # the server handles every client on a separate thread
+
+    def add_game(self, game_id, capacity: dict):
+        """
+        :param capacity: team => number of players in the team
+        """
+        with self._lock:
+            self.capacity[game_id] = dict(capacity)
+            self.free[game_id] = {}
+            self.seated[game_id] = set()
+            for team in TEAMS:
+                self._set_free(game_id, team, capacity[team])
+
+    def remove_game(self, game_id):
+        """
+        forget a game which has started or is gone: its places aren't open anymore.
+        """
+        with self._lock:
+            if game_id not in self.free:
+                return
+            for team in TEAMS:
+                self._unbucket(game_id, team)
+            del self.free[game_id]
+            del self.capacity[game_id]
+            for player_id in self.seated.pop(game_id):
+                del self.seats[player_id]
+
+    def find(self, team: str, team_size=None):
+        """
+        :param team: preferred team. if none of the games has a place in it, a place in the other team is found.
+        :param team_size: if given, only teams of this size are considered.
+        :returns: a tuple (game id, team) of the fullest game with a free place, or None if there's no place.
+        """
+        with self._lock:
+            for candidate_team in (team, other_team(team)):
+                best = None  # (free places, game id)
+                for size, by_free in self.buckets[candidate_team].items():
+                    if team_size is not None and str(size) != str(team_size):
+                        continue
+                    if len(by_free) > 0:
+                        free = min(by_free)
+                        if best is None or free < best[0]:
+                            best = (free, next(iter(by_free[free])))
+                if best is not None:
+                    return best[1], candidate_team
+            return None
+
+    def take(self, player_id, game_id, team) -> bool:
+        """
+        give the player a place in the team of the game (moving him, if he already had another one).
+        :returns: False if the game isn't open.
+        """
+        with self._lock:
+            if game_id not in self.free:
+                return False
+            if self.seats.get(player_id) == (game_id, team):
+                return True
+            self.release(player_id)
+            self.seats[player_id] = (game_id, team)
+            self.seated[game_id].add(player_id)
+            self._set_free(game_id, team, self.free[game_id][team] - 1)
+            return True
+
+    def release(self, player_id) -> bool:
+        """
+        free the place of a player who left (or was rejected by the GM) before his game started.
+        :returns: True if a place was freed.
+        """
+        with self._lock:
+            seat = self.seats.pop(player_id, None)
+            if seat is None:
+                return False
+            game_id, team = seat
+            self.seated[game_id].discard(player_id)
+            self._set_free(game_id, team, self.free[game_id][team] + 1)
+            return True
+
+    def enqueue(self, player_id, team: str, role: str, team_size=None):
+        with self._lock:
+            self.waiting.append((player_id, team, role, team_size))
+
+    def assign(self, is_waiting=None) -> list:
+        """
+        seat the waiting players for whom there are places now.
+        :param is_waiting: optional predicate on player ids: players for whom it returns False have given up waiting.
+        :returns: list of tuples (player id, game id, team, role) of the players who got places.
+        """
+        with self._lock:
+            assigned, still_waiting = [], deque()
+            while len(self.waiting) > 0:
+                player_id, team, role, team_size = self.waiting.popleft()
+                if is_waiting is not None and not is_waiting(player_id):
+                    continue
+                place = self.find(team, team_size)
+                if place is None:
+                    still_waiting.append((player_id, team, role, team_size))
+                    continue
+                self.take(player_id, *place)
+                assigned.append((player_id, place[0], place[1], role))
+            self.waiting = still_waiting
+            return assigned
+
+    def _set_free(self, game_id, team, free: int):
+        self._unbucket(game_id, team)
+        self.free[game_id][team] = free
+        if free > 0:
+            by_free = self.buckets[team].setdefault(self.capacity[game_id][team], {})
+            by_free.setdefault(free, {})[game_id] = None
+
+    def _unbucket(self, game_id, team):
+        free = self.free[game_id].get(team, 0)
+        if free <= 0:
+            return
+        size = self.capacity[game_id][team]
+        by_free = self.buckets[team][size]
+        del by_free[free][game_id]
+        if len(by_free[free]) == 0:
+            del by_free[free]
+        if len(by_free) == 0:
+            del self.buckets[team][size]
+
+
+def other_team(team: str) -> str:
+    return Allegiance.BLUE.value if team == Allegiance.RED.value else Allegiance.RED.value
@@ -7,6 +7,7 @@ XSD_PATH = "../messages/TheProjectGameCommunication.xsd"
 XML_NAMESPACE = "https://se2.mini.pw.edu.pl/17-results/"
 NAMESPACE_PREFIX = "{%s}" % XML_NAMESPACE
 NSMAP = {None: XML_NAMESPACE}
+MAX_PATH_LENGTH = 32  # maximal number of steps in a MovePath message (see the schema)
 
 # pre-load the XML schema:
 SCHEMA = etree.XMLSchema(etree.parse(XSD_PATH))
@@ -28,14 +29,17 @@ def __base_message(message_name) -> etree.ElementBase:
     return etree.Element(NAMESPACE_PREFIX + message_name, nsmap=NSMAP)
 
 
-def __game_message(message_name, game_id, player_guid) -> etree.ElementBase:
+def __game_message(message_name, game_id, player_guid, request_id=None) -> etree.ElementBase:
     """
     :returns an xml root with GameMessage as its base (look at the schema for reference)
     used in messages sent from Player to GM (e.g. Move, PickUp...)
+    :param request_id: optional correlation id, echoed by the GM in its response
     """
     root = __base_message(message_name)
     root.set("gameId", str(game_id))
     root.set("playerGuid", str(player_guid))
+    if request_id is not None:
+        root.set("requestId", str(request_id))
     return root
 
 
@@ -55,7 +59,7 @@ def __between_players_message(message_name, player_id, sender_player_id) -> etre
     used in messages sent from Player to Player (e.g. KnowledgeExchangeRequest...)
     """
     root = __player_message(message_name, player_id)
-    root.set("senderPlayerId", sender_player_id)
+    root.set("senderPlayerId", str(sender_player_id))
     return root
 
 
@@ -63,34 +67,48 @@ def __append_element(root, tag, attrib=None):
     return etree.SubElement(root, NAMESPACE_PREFIX + tag, attrib, NSMAP)
 
 
-def Move(game_id, player_guid, direction: str):
-    root = __game_message("Move", game_id, player_guid)
+def Move(game_id, player_guid, direction: str, request_id=None):
+    root = __game_message("Move", game_id, player_guid, request_id)
     root.set("direction", direction)
     return __validate_encode(root)
 
 
-def PickUpPiece(game_id, player_guid):
-    root = __game_message("PickUpPiece", game_id, player_guid)
+def MovePath(game_id, player_guid, directions: list = None, target: tuple = None, request_id=None):
+    """
+    extension of Move: the GM makes up to MAX_PATH_LENGTH moves for the player, and answers with one Data message.
+    :param directions: list of directions of the consecutive steps
+    :param target: tuple x,y - alternatively, the field the GM should walk the player to
+    """
+    root = __game_message("MovePath", game_id, player_guid, request_id)
+    for direction in directions or []:
+        __append_element(root, "Step", {"direction": direction})
+    if target is not None:
+        __append_element(root, "Target", {"x": str(target[0]), "y": str(target[1])})
+    return __validate_encode(root)
+
+
+def PickUpPiece(game_id, player_guid, request_id=None):
+    root = __game_message("PickUpPiece", game_id, player_guid, request_id)
     return __validate_encode(root)
 
 
-def PlacePiece(game_id, player_guid):
-    root = __game_message("PlacePiece", game_id, player_guid)
+def PlacePiece(game_id, player_guid, request_id=None):
+    root = __game_message("PlacePiece", game_id, player_guid, request_id)
     return __validate_encode(root)
 
 
-def TestPiece(game_id, player_guid):
-    root = __game_message("TestPiece", game_id, player_guid)
+def TestPiece(game_id, player_guid, request_id=None):
+    root = __game_message("TestPiece", game_id, player_guid, request_id)
     return __validate_encode(root)
 
 
-def Discover(game_id, player_guid):
-    root = __game_message("Discover", game_id, player_guid)
+def Discover(game_id, player_guid, request_id=None):
+    root = __game_message("Discover", game_id, player_guid, request_id)
     return __validate_encode(root)
 
 
-def AuthorizeKnowledgeExchange(game_id, player_guid, with_player_id):
-    root = __game_message("AuthorizeKnowledgeExchange", game_id, player_guid)
+def AuthorizeKnowledgeExchange(game_id, player_guid, with_player_id, request_id=None):
+    root = __game_message("AuthorizeKnowledgeExchange", game_id, player_guid, request_id)
     root.set("withPlayerId", str(with_player_id))
     return __validate_encode(root)
 
@@ -101,7 +119,7 @@ def GetGames():
 
 
 def Data(player_id, game_finished: bool, task_fields: dict = None, goal_fields: dict = None, pieces: dict = None,
-         player_location: tuple = None):
+         player_location: tuple = None, request_id=None, game_id=None):
     """
     :param player_id: target player's id
     :param game_finished: bool value, should be True if the game has ended
@@ -109,18 +127,56 @@ def Data(player_id, game_finished: bool, task_fields: dict = None, goal_fields:
     :param goal_fields: dict: id -> GoalFieldInfo
     :param pieces: dict: id -> PieceInfo
     :param player_location: tuple x,y
+    :param request_id: requestId of the message this Data responds to
+    :param game_id: id of the game the Data comes from (the server closes this game when the Data is the final one)
     :return:
     """
     root = __player_message("Data", player_id)
     root.set("gameFinished", str(game_finished).lower())
+    if request_id is not None:
+        root.set("requestId", str(request_id))
+    if game_id is not None:
+        root.set("gameId", str(game_id))
+    __append_data(root, task_fields, goal_fields, pieces, player_location)
+    return __validate_encode(root)
+
+
+def KnowledgeExchangeResponse(player_id, sender_player_id, game_finished: bool, task_fields: dict = None,
+                              goal_fields: dict = None, pieces: dict = None):
+    """
+    a Data message sent from one player to another during a knowledge exchange.
+    unlike the GM's Data, it keeps the original timestamps of the sender's knowledge, so that the receiver can merge it.
+    :param player_id: target player's id
+    :param sender_player_id: id of the player sharing his knowledge
+    """
+    root = __player_message("Data", player_id)
+    root.set("gameFinished", str(game_finished).lower())
+    root.set("senderPlayerId", str(sender_player_id))
+    __append_data(root, task_fields, goal_fields, pieces, keep_timestamps=True)
+    return __validate_encode(root)
+
+
+def __timestamp(info, keep_timestamps):
+    if not keep_timestamps:
+        return str(datetime.now().isoformat())
+    if isinstance(info.timestamp, datetime):
+        return info.timestamp.isoformat()
+    return str(info.timestamp)
 
+
+def __append_data(root, task_fields: dict = None, goal_fields: dict = None, pieces: dict = None,
+                  player_location: tuple = None, keep_timestamps=False):
+    """
+    add the contents of a Data message to the root.
+    :param keep_timestamps: if True, use the timestamps of the infos instead of the current time
+    """
     # add TaskFields collection:
     if task_fields is not None:
         c_task_fields = __append_element(root, "TaskFields")
 
         # add each TaskField to the collection:
         for (x, y), field in task_fields.items():
-            e_attributes = {"x": str(x), "y": str(y), "timestamp": str(datetime.now().isoformat()),
+            e_attributes = {"x": str(x), "y": str(y), "timestamp": __timestamp(field, keep_timestamps),
                             "distanceToPiece": str(field.distance_to_piece)}
             if field.player_id is not None and field.player_id != "-1":
                 e_attributes["playerId"] = str(field.player_id)
@@ -134,8 +190,8 @@ def Data(player_id, game_finished: bool, task_fields: dict = None, goal_fields:
 
         # add each GoalField to the collection:
         for (x, y), field in goal_fields.items():
-            e_attributes = {"x": str(x), "y": str(y), "timestamp": str(datetime.now().isoformat()), "type": field.type,
-                            "team": field.allegiance}
+            e_attributes = {"x": str(x), "y": str(y), "timestamp": __timestamp(field, keep_timestamps),
+                            "type": field.type, "team": field.allegiance}
             if field.player_id is not None and field.player_id != "-1":
                 e_attributes["playerId"] = str(field.player_id)
             __append_element(c_goal_fields, "GoalField", e_attributes)
@@ -146,7 +202,7 @@ def Data(player_id, game_finished: bool, task_fields: dict = None, goal_fields:
 
         # add each Piece to the collection:
         for piece in pieces.values():
-            e_attributes = {"id": piece.id, "timestamp": str(datetime.now().isoformat()), "type": piece.type}
+            e_attributes = {"id": piece.id, "timestamp": __timestamp(piece, keep_timestamps), "type": piece.type}
             if piece.player_id is not None and piece.player_id != "-1":
                 e_attributes["playerId"] = piece.player_id
             __append_element(c_pieces, "Piece", e_attributes)
@@ -156,8 +212,6 @@ def Data(player_id, game_finished: bool, task_fields: dict = None, goal_fields:
         e_player_location = {"x": str(player_location[0]), "y": str(player_location[1])}
         __append_element(root, "PlayerLocation", e_player_location)
 
-    return __validate_encode(root)
-
 
 def Game(player_id, teams: dict, board_width, tasks_height, goals_height, player_location: tuple):
     """
@@ -227,6 +281,12 @@ def GameStarted(game_id):
     return __validate_encode(root)
 
 
+def GameFinished(game_id):
+    root = __base_message("GameFinished")
+    root.set("gameId", str(game_id))
+    return __validate_encode(root)
+
+
 def RegisteredGames(games: dict):
     """
     :param games: a dict of: game_id => GameInfo
@@ -250,6 +310,19 @@ def JoinGame(game_name, pref_team, pref_type, player_id=None):
     return __validate_encode(root)
 
 
+def JoinAnyGame(pref_team, pref_type, players_per_team=None):
+    """
+    extension of JoinGame: the server chooses an open game for the player (see the schema).
+    :param players_per_team: optional criterion: only games with this many players in each team are chosen.
+    """
+    root = __base_message("JoinAnyGame")
+    root.set("preferredTeam", pref_team)
+    root.set("preferredRole", pref_type)
+    if players_per_team is not None:
+        root.set("playersPerTeam", str(players_per_team))
+    return __validate_encode(root)
+
+
 def ConfirmJoiningGame(player_id, game_id, player_guid, team, type):
     root = __player_message("ConfirmJoiningGame", player_id)
     root.set("privateGuid", str(player_guid))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+
+class Histogram:
+    """
+    in-memory latency histogram with exponentially growing buckets (1us, 2us, 4us ... ~16s).
+    cheap enough to be updated on every message handled by the GameMaster.
+    """
+    BUCKET_BOUNDS = [0.000001 * 2 ** i for i in range(25)]  # upper bounds of buckets, in seconds
+
+    def __init__(self):
+        self.counts = [0] * (len(Histogram.BUCKET_BOUNDS) + 1)  # last bucket catches everything above the bounds
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds: float):
+        self.counts[bisect_left(Histogram.BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, p: float):
+        """
+        :param p: percentile, between 0 and 100
+        :returns: upper bound of the bucket in which the given percentile falls (in seconds).
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = self.count * p / 100
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= threshold:
+                if i < len(Histogram.BUCKET_BOUNDS):
+                    return min(Histogram.BUCKET_BOUNDS[i], self.max)
+                return self.max
+        return self.max
+
+    def summary(self) -> str:
+        return "n=" + str(self.count) + " mean=" + format_ms(self.mean) + " p50=" + format_ms(
+            self.percentile(50)) + " p95=" + format_ms(self.percentile(95)) + " p99=" + format_ms(
+            self.percentile(99)) + " max=" + format_ms(self.max or 0.0)
+
+
+def format_ms(seconds: float) -> str:
+    return "%.3fms" % (seconds * 1000)
+
+
+class LatencyRecorder:
+    """
+    collects Histograms of time spent in each phase of each action, e.g. ("move", "delay") or ("discover", "send"),
+    as well as simple event counters (e.g. cache hits).
+    """
+
+    def __init__(self):
+        self.histograms = {}  # (action, phase) => Histogram
+        self.counters = {}  # (action, event) => int
+        self.lock = Lock()
+
+    def record(self, action: str, phase: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get((action, phase))
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[action, phase] = histogram
+            histogram.add(seconds)
+
+    def increment(self, action: str, event: str):
+        with self.lock:
+            self.counters[action, event] = self.counters.get((action, event), 0) + 1
+
+    @contextmanager
+    def measure(self, action: str, phase: str):
+        """
+        record the time spent in the with-block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(action, phase, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def dump(self) -> str:
+        """
+        :returns: a human-readable report of all collected histograms and counters, one line per (action, phase).
+        """
+        with self.lock:
+            if len(self.histograms) == 0 and len(self.counters) == 0:
+                return "No latencies recorded."
+            lines = []
+            for (action, phase) in sorted(self.histograms.keys()):
+                lines.append(" " + action + "/" + phase + ": " + self.histograms[action, phase].summary())
+            for (action, event) in sorted(self.counters.keys()):
+                lines.append(" " + action + "/" + event + ": " + str(self.counters[action, event]))
+            return "\n".join(lines)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+import socket
+from queue import Queue
+from threading import Lock, Thread
+from time import sleep
+
+from src.communication.transport import TCP, new_socket, socket_name
+
+PREAMBLE = b"MULTIPLEX\n"  # first bytes sent over a multiplexed connection, so the server can tell it from a client
+HEADER_END = b"\n"
+PREAMBLE_WAIT = 0.001  # seconds between two looks at a preamble which has only partly arrived
+PREAMBLE_TIMEOUT = 1  # seconds after which a partly arrived preamble is given up on (its sender may be gone)
+
+
+def encode_frame(channel: int, payload: bytes) -> bytes:
+    """
+    a frame is a header "<channel> <payload length>\\n" followed by the payload.
+    an empty payload means that the channel was closed.
+    """
+    return str(channel).encode() + b" " + str(len(payload)).encode() + HEADER_END + payload
+
+
+def starts_with_preamble(client_socket) -> bool:
+    """
+    look at the first bytes of a new connection (without reading them) to tell if it's a multiplexed one.
+    the preamble may arrive in pieces, so it's waited for as long as what has arrived matches it (but no longer than
+    PREAMBLE_TIMEOUT: peeking can't tell if the sender closed the connection after a part of it).
+    """
+    for attempt in range(int(PREAMBLE_TIMEOUT / PREAMBLE_WAIT)):
+        peeked = client_socket.recv(len(PREAMBLE), socket.MSG_PEEK)
+        if len(peeked) == 0 or not PREAMBLE.startswith(peeked):
+            return False
+        if len(peeked) == len(PREAMBLE):
+            return True
+        sleep(PREAMBLE_WAIT)
+    return False
+
+
+class FrameReader:
+    """
+    splits the bytes received over a multiplexed connection into frames.
+    """
+
+    def __init__(self, sock, buffer_size=2048):
+        self.socket = sock
+        self.buffer_size = buffer_size
+        self.buffer = b""
+
+    def feed(self, data: bytes):
+        """
+        push back bytes which were already read from the socket (e.g. together with the preamble).
+        """
+        self.buffer += data
+
+    def next_frame(self):
+        """
+        block until a whole frame arrives.
+        :returns: a tuple (channel, payload), or None if the connection was closed.
+        """
+        while True:
+            header_end = self.buffer.find(HEADER_END)
+            if header_end >= 0:
+                channel, length = self.buffer[:header_end].split(b" ")
+                frame_end = header_end + 1 + int(length)
+                if len(self.buffer) >= frame_end:
+                    payload = self.buffer[header_end + 1:frame_end]
+                    self.buffer = self.buffer[frame_end:]
+                    return int(channel), payload
+
+            try:
+                data = self.socket.recv(self.buffer_size)
+            except OSError:
+                return None
+            if len(data) < 1:
+                return None
+            self.buffer += data
+
+
+class Channel:
+    """
+    one logical connection carried by a shared socket. it behaves like the socket it replaces,
+    as far as Client and CommunicationServer use it (send, sendall, recv, connect_ex, close, getsockname).
+    """
+
+    def __init__(self, connection, index: int):
+        self.connection = connection
+        self.index = index
+        self.incoming = Queue()  # payloads received on this channel, b"" once it's closed
+        self.closed = False
+
+    def connect_ex(self, address) -> int:
+        return self.connection.connect_ex(address)
+
+    def send(self, data: bytes) -> int:
+        if self.closed:
+            raise ConnectionAbortedError
+        self.connection.send_frame(self.index, data)
+        return len(data)
+
+    def sendall(self, data: bytes):
+        self.send(data)
+
+    def recv(self, buffer_size: int = None) -> bytes:
+        return self.incoming.get()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.incoming.put(b"")
+            self.connection.close_channel(self.index)
+
+    def getsockname(self):
+        return self.connection.getsockname() + ("channel " + str(self.index),)
+
+
+class MultiplexedConnection:
+    """
+    client side of a multiplexed connection: carries many logical clients (e.g. Players) over one socket.
+    give each Client a channel() in place of its own socket; the messages are tagged with the channel index,
+    and the server treats each channel as a separate client.
+    """
+
+    def __init__(self, transport: str = TCP):
+        self.socket = new_socket(transport)
+        self.send_lock = Lock()
+        self.channels = {}  # index => Channel
+        self.channel_indexer = 0
+        self.connected = False
+        self.reader = None
+
+    def channel(self) -> Channel:
+        channel = Channel(self, self.channel_indexer)
+        self.channels[channel.index] = channel
+        self.channel_indexer += 1
+        return channel
+
+    def connect_ex(self, address) -> int:
+        """
+        connect the shared socket (only the first channel to connect really does it).
+        """
+        with self.send_lock:
+            if self.connected:
+                return 0
+            result = self.socket.connect_ex(address)
+            if result == 0:
+                self.connected = True
+                self.socket.sendall(PREAMBLE)
+                self.reader = FrameReader(self.socket)
+                Thread(target=self.demultiplex, daemon=True).start()
+            return result
+
+    def send_frame(self, index: int, payload: bytes):
+        with self.send_lock:
+            self.socket.sendall(encode_frame(index, payload))
+
+    def close_channel(self, index: int):
+        self.channels.pop(index, None)
+        if self.connected:
+            try:
+                self.send_frame(index, b"")
+            except OSError:
+                pass
+
+    def demultiplex(self):
+        """
+        runs on a thread: passes every frame on to the queue of its channel.
+        """
+        while True:
+            frame = self.reader.next_frame()
+            if frame is None:
+                break
+            index, payload = frame
+            channel = self.channels.get(index)
+            if channel is None:
+                continue
+            if len(payload) == 0:
+                # closed by the server.
+                channel.closed = True
+            channel.incoming.put(payload)
+
+        # the shared socket is gone, so every channel is closed:
+        self.connected = False
+        for channel in list(self.channels.values()):
+            channel.closed = True
+            channel.incoming.put(b"")
+
+    def getsockname(self):
+        return socket_name(self.socket)
+
+    def close(self):
+        for channel in list(self.channels.values()):
+            channel.close()
+        self.socket.close()
+
+
+class ServerChannel:
+    """
+    server side of one channel of a multiplexed connection, used as the socket of its ClientInfo.
+    messages from the client are not read from it: the server's demultiplexing loop pushes them to the handlers.
+    """
+
+    def __init__(self, connection_socket, send_lock: Lock, index: int):
+        self.socket = connection_socket
+        self.send_lock = send_lock
+        self.index = index
+        self.closed = False
+
+    def send(self, data: bytes) -> int:
+        if self.closed:
+            raise ConnectionAbortedError
+        with self.send_lock:
+            self.socket.sendall(encode_frame(self.index, data))
+        return len(data)
+
+    def sendall(self, data: bytes):
+        self.send(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                with self.send_lock:
+                    self.socket.sendall(encode_frame(self.index, b""))
+            except OSError:
+                pass
+
+    def shutdown(self, how):
+        pass  # nothing to wake up: the channel's messages are pushed to the server by its connection's thread.
+
+    def getsockname(self):
+        return socket_name(self.socket) + ("channel " + str(self.index),)
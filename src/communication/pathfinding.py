@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+from heapq import heappop, heappush
+from itertools import count
+
+from src.communication.info import Direction, GameInfo
+
+STEPS = {Direction.UP.value: (0, 1), Direction.DOWN.value: (0, -1), Direction.LEFT.value: (-1, 0),
+         Direction.RIGHT.value: (1, 0)}
+
+
+def direction_between(location: tuple, neighbour: tuple):
+    """
+    :returns: the Direction of a move from location to a neighbouring field.
+    """
+    step = neighbour[0] - location[0], neighbour[1] - location[1]
+    for direction, direction_step in STEPS.items():
+        if direction_step == step:
+            return direction
+    raise ValueError(str(neighbour) + " is not a neighbour of " + str(location))
+
+
+def directions_along(location: tuple, path: list) -> list:
+    """
+    :returns: list of Directions of the moves which take a player from location through the given path.
+    """
+    directions = []
+    for neighbour in path:
+        directions.append(direction_between(location, neighbour))
+        location = neighbour
+    return directions
+
+
+class PathFinder:
+    """
+    A* search over what a player knows about the board (his GameInfo). occupied fields and the other team's goal area
+    are obstacles. the last path found is cached, and reused as long as the player stays on it, the targets don't
+    change and no field left on the path has become an obstacle (fields are checked only if their version changed).
+    """
+
+    def __init__(self, game_info: GameInfo, team: str, player_id=None):
+        self.game_info = game_info
+        self.team = team
+        self.player_id = player_id
+        self.path = []  # locations of the cached path, from where it was planned to a target
+        self.versions = []  # FieldInfo.version of every field on the cached path, when it was checked last
+        self.targets = None  # frozenset of targets of the cached path
+        self.searches = 0  # how many times a path had to be searched for (as opposed to reused)
+
+    def field(self, location: tuple):
+        field = self.game_info.task_fields.get(location)
+        if field is None:
+            field = self.game_info.goal_fields.get(location)
+        return field
+
+    def is_passable(self, location: tuple) -> bool:
+        field = self.field(location)
+        if field is None:
+            return False  # out of bounds
+        if location in self.game_info.goal_fields and field.allegiance != self.team:
+            return False
+        return not field.is_occupied or field.player_id == self.player_id
+
+    def path_to(self, location: tuple, targets) -> list:
+        """
+        :param targets: collection of locations, the path leads to the nearest of them.
+        :returns: list of locations of the fields to go through (the last one is a target, the current location is
+        not included), an empty list if the player already stands on a target, or None if no target can be reached.
+        """
+        targets = frozenset(targets)
+        if location in targets:
+            return []
+
+        if targets == self.targets:
+            remaining = self.cached_path_from(location)
+            if remaining is not None:
+                return remaining
+
+        self.searches += 1
+        self.targets = targets
+        self.path = self.search(location, targets)
+        if self.path is None:
+            self.versions = []
+            return None
+        self.versions = [self.field(step).version for step in self.path]
+        return self.path[1:]
+
+    def cached_path_from(self, location: tuple):
+        """
+        :returns: the rest of the cached path, if the player is on it and it's still passable. None otherwise.
+        """
+        if self.path is None or location not in self.path:
+            return None
+        start = self.path.index(location)
+
+        for index in range(start + 1, len(self.path)):
+            step = self.path[index]
+            version = self.field(step).version
+            if version != self.versions[index]:
+                if not self.is_passable(step):
+                    return None
+                self.versions[index] = version
+        return self.path[start + 1:]
+
+    def search(self, location: tuple, targets: frozenset):
+        """
+        :returns: list of locations from the given one to the nearest target (both included), or None.
+        """
+        passable_targets = [target for target in targets if self.is_passable(target)]
+        if len(passable_targets) == 0:
+            return None
+
+        # distance to the bounding box of the targets never overestimates the distance to the nearest of them:
+        min_x = min(target[0] for target in passable_targets)
+        max_x = max(target[0] for target in passable_targets)
+        min_y = min(target[1] for target in passable_targets)
+        max_y = max(target[1] for target in passable_targets)
+
+        def heuristic(field):
+            return max(min_x - field[0], 0, field[0] - max_x) + max(min_y - field[1], 0, field[1] - max_y)
+
+        tie_breaker = count()
+        came_from = {location: None}
+        distances = {location: 0}
+        frontier = [(heuristic(location), next(tie_breaker), location)]
+
+        while len(frontier) > 0:
+            _, _, current = heappop(frontier)
+            if current in targets:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = came_from[current]
+                path.reverse()
+                return path
+
+            for dx, dy in STEPS.values():
+                neighbour = current[0] + dx, current[1] + dy
+                distance = distances[current] + 1
+                if distance < distances.get(neighbour, distance + 1) and self.is_passable(neighbour):
+                    distances[neighbour] = distance
+                    came_from[neighbour] = current
+                    heappush(frontier, (distance + heuristic(neighbour), next(tie_breaker), neighbour))
+        return None
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 import xml.etree.ElementTree as ET
 from argparse import ArgumentParser
+from collections import OrderedDict
+from itertools import count
 
 from src.communication import messages
 from src.communication.client import Client
-from src.communication.info import GameInfo, PlayerType, Allegiance, PieceInfo, ClientTypeTag, PlayerInfo
-from src.communication.strategy import StrategyFactory, Decision
+from src.communication.clock import Clock
+from src.communication.info import GameInfo, PlayerType, Allegiance, PieceInfo, ClientTypeTag, PlayerInfo, \
+    TaskFieldInfo, GoalFieldInfo, parse_timestamp
+from src.communication.multiplex import MultiplexedConnection
+from src.communication.strategy import StrategyFactory, Decision, DEFAULT_STRATEGY, STRATEGIES
+from src.communication.transport import TCP, TRANSPORTS
 from src.communication.unexpected import UnexpectedServerMessage
 
 REGISTERED_GAMES_TAG = "{https://se2.mini.pw.edu.pl/17-results/}"
@@ -24,15 +30,56 @@ def parse_games(games):
     return open_games
 
 
+def parse_knowledge(root):
+    """
+    parse a Data message received from another player during a knowledge exchange (timestamps become datetimes).
+    :returns: a tuple: (task_fields, goal_fields, pieces), dicts as in GameInfo
+    """
+    task_fields, goal_fields, pieces = {}, {}, {}
+
+    for task_field in root.iter(REGISTERED_GAMES_TAG + "TaskField"):
+        x = int(task_field.attrib.get('x'))
+        y = int(task_field.attrib.get('y'))
+        task_fields[x, y] = TaskFieldInfo(x, y, parse_timestamp(task_field.attrib.get('timestamp')),
+                                          int(task_field.attrib.get('distanceToPiece')),
+                                          task_field.attrib.get('playerId', "-1"), task_field.attrib.get('pieceId', "-1"))
+
+    for goal_field in root.iter(REGISTERED_GAMES_TAG + "GoalField"):
+        x = int(goal_field.attrib.get('x'))
+        y = int(goal_field.attrib.get('y'))
+        goal_fields[x, y] = GoalFieldInfo(x, y, goal_field.attrib.get('team'), goal_field.attrib.get('playerId', "-1"),
+                                          parse_timestamp(goal_field.attrib.get('timestamp')),
+                                          goal_field.attrib.get('type'))
+
+    for piece in root.iter(REGISTERED_GAMES_TAG + "Piece"):
+        piece_id = piece.attrib.get('id')
+        pieces[piece_id] = PieceInfo(piece_id, piece.attrib.get('type'), piece.attrib.get('playerId', "-1"),
+                                     timestamp=parse_timestamp(piece.attrib.get('timestamp')))
+
+    return task_fields, goal_fields, pieces
+
+
 class Player(Client):
-    def __init__(self, index=1, verbose=False, game_name='easy clone'):
+    KNOWLEDGE_EXCHANGE_LIMIT = 256  # maximal number of fields and pieces sent in one knowledge exchange
+
+    def __init__(self, index=1, verbose=False, game_name='easy clone', clock: Clock = None, pipelined=False,
+                 connection: MultiplexedConnection = None, transport: str = TCP, strategies: dict = None,
+                 fast_join=False):
         """
 
         :param index: Player index for the server
         :param verbose: Verbose functionality boolean
         :param game_name: Game name for player to join
+        :param clock: Clock used for all waiting done by the player
+        :param pipelined: if True, the player sends a Discover along with every move, without waiting for the move
+        :param connection: shared connection to talk over, instead of the player's own socket
+        :param transport: how to reach the server: TCP, UNIX or LOOPBACK (see transport.py)
+        :param strategies: team => name of the registered strategy to play with in that team (see strategy.py).
+        the default strategy is used for teams which aren't given.
+        :param fast_join: if True, the player joins (and re-joins) any open game with a single JoinAnyGame,
+        instead of asking for the list of games first
         """
-        super().__init__(index, verbose)
+        super().__init__(index, verbose, clock, connection, transport)
 
         self.typeTag = ClientTypeTag.PLAYER
         self.Guid = 'Not Assigned'
@@ -43,8 +90,15 @@ class Player(Client):
         self.type = 'Not Assigned'
         self.location = tuple()
         self.game_on = False
+        self.pending_exchange = None  # id of the player we're waiting to exchange knowledge with
+        self.last_exchange = {}  # player id => timestamp of the newest knowledge we have already shared with him
+        self.pipelined = pipelined
+        self.request_ids = count(1)
+        self.in_flight = OrderedDict()  # request id => Decision choice, for every request still waiting for a response
 
+        self.strategies = strategies if strategies is not None else {}
         self.strategy = None
+        self.fast_join = fast_join
 
     def handle_confirmation(self, message: str):
         """
@@ -101,19 +155,25 @@ class Player(Client):
 
     def handle_data(self, response_data: str):
         """
-        parses a Data messsage, updates self.game_info
+        parses a Data messsage, updates self.game_info in place (timestamps are kept as datetimes,
+        so they don't have to be parsed again when they're compared)
         """
         root = ET.fromstring(response_data)
 
         if root.attrib.get('gameFinished') == 'true':
             self.game_on = False
 
+        if root.attrib.get('senderPlayerId') is not None:
+            # knowledge shared by another player: merge it, keeping whatever we know that is newer.
+            self.game_info.merge_knowledge(*parse_knowledge(root))
+            return
+
         for task_field_list in root.findall(REGISTERED_GAMES_TAG + "TaskFields"):
             if task_field_list is not None:
                 for task_field in task_field_list.findall(REGISTERED_GAMES_TAG + "TaskField"):
                     x = int(task_field.attrib.get('x'))
                     y = int(task_field.attrib.get('y'))
-                    self.game_info.task_fields[x, y].timestamp = task_field.attrib.get('timestamp')
+                    self.game_info.task_fields[x, y].timestamp = parse_timestamp(task_field.attrib.get('timestamp'))
                     self.game_info.task_fields[x, y].distance_to_piece = int(task_field.attrib.get('distanceToPiece'))
                     if task_field.attrib.get('playerId') is not None:
                         self.game_info.task_fields[x, y].player_id = str(task_field.attrib.get('playerId'))
@@ -123,29 +183,31 @@ class Player(Client):
                         self.game_info.task_fields[x, y].piece_id = str(task_field.attrib.get('pieceId'))
                     else:
                         self.game_info.task_fields[x, y].piece_id = "-1"
+                    self.game_info.update_piece_index(location=(x, y))
 
         for goal_field_list in root.findall(REGISTERED_GAMES_TAG + "GoalFields"):
             if goal_field_list is not None:
                 for goal_field in goal_field_list.findall(REGISTERED_GAMES_TAG + "GoalField"):
                     x = int(goal_field.attrib.get('x'))
                     y = int(goal_field.attrib.get('y'))
-                    self.game_info.goal_fields[x, y].timestamp = goal_field.attrib.get('timestamp')
+                    self.game_info.goal_fields[x, y].timestamp = parse_timestamp(goal_field.attrib.get('timestamp'))
                     if goal_field.attrib.get('playerId') is not None:
                         self.game_info.goal_fields[x, y].player_id = str(goal_field.attrib.get('playerId'))
                     self.game_info.goal_fields[x, y].allegiance = goal_field.attrib.get('team')
                     self.game_info.goal_fields[x, y].type = goal_field.attrib.get('type')
+                    self.game_info.update_goal_index((x, y))
 
         for piece_list in root.findall(REGISTERED_GAMES_TAG + "Pieces"):
             if piece_list is not None:
                 for piece in piece_list.findall(REGISTERED_GAMES_TAG + "Piece"):
                     id = piece.attrib.get('id')
-                    timestamp = piece.attrib.get('timestamp')
-                    type = piece.attrib.get('type')
-                    player_id = piece.attrib.get('playerId')
-                    if player_id is not None:
-                        self.game_info.pieces[id] = PieceInfo(id, type, player_id, timestamp=timestamp)
-                    else:
-                        self.game_info.pieces[id] = PieceInfo(id, type, timestamp=timestamp)
+                    piece_info = self.game_info.pieces.get(id)
+                    if piece_info is None:
+                        piece_info = self.game_info.pieces[id] = PieceInfo(id)
+                    piece_info.timestamp = parse_timestamp(piece.attrib.get('timestamp'))
+                    piece_info.type = piece.attrib.get('type')
+                    piece_info.player_id = piece.attrib.get('playerId', "-1")
+                    self.game_info.update_piece_index(id)
 
         for player_location in root.findall(REGISTERED_GAMES_TAG + "PlayerLocation"):
             if player_location is not None:
@@ -155,23 +217,102 @@ class Player(Client):
 
     def receive(self):
         """
-        overriding the parent method to implement re-joining when GM disconnects
+        overriding the parent method to implement re-joining when GM disconnects,
+        and to answer other players' knowledge exchanges while waiting for a response
         """
-        received = super(Player, self).receive()
-        if "GameMasterDisconnected" in received:
-            # clean up our knowledge and try to join to the game again.
-            self.game_on = False
-            self.verbose_debug("GameMaster has disconnected! Trying to join game again...")
-            if not self.try_join(self.game_name):
-                # if we failed to join, kys
-                self.verbose_debug("Failed to re-join game. Shutting down.")
-                self.shutdown()
-        return received
+        while True:
+            received = super(Player, self).receive()
+            if "GameMasterDisconnected" in received:
+                # clean up our knowledge and try to join to the game again.
+                self.game_on = False
+                self.verbose_debug("GameMaster has disconnected! Trying to join game again...")
+                if not self.try_join(self.game_name):
+                    # if we failed to join, kys
+                    self.verbose_debug("Failed to re-join game. Shutting down.")
+                    self.shutdown()
+                return received
+
+            if not self.handle_knowledge_exchange(received):
+                return received
+
+    def handle_knowledge_exchange(self, message: str) -> bool:
+        """
+        handle messages of a knowledge exchange which are not a response to our own action.
+        :returns: True if the message was handled here, False if it should be treated as a response
+        """
+        if "KnowledgeExchangeRequest" in message:
+            # somebody wants to know what we know. we're a nice player, so we always accept.
+            sender_id = ET.fromstring(message).attrib.get('senderPlayerId')
+            self.send(messages.AcceptExchangeRequest(sender_id, self.id))
+            self.share_knowledge(sender_id)
+            return True
+
+        elif "AcceptExchangeRequest" in message:
+            # the other player accepted our request, so he's sending us his knowledge. let's send him ours.
+            sender_id = ET.fromstring(message).attrib.get('senderPlayerId')
+            self.share_knowledge(sender_id)
+            return True
+
+        elif "RejectKnowledgeExchange" in message:
+            sender_id = ET.fromstring(message).attrib.get('senderPlayerId')
+            if sender_id == self.pending_exchange:
+                self.pending_exchange = None
+                return False
+            return True
+
+        elif "senderPlayerId" in message:
+            # Data from another player.
+            sender_id = ET.fromstring(message).attrib.get('senderPlayerId')
+            if sender_id == self.pending_exchange:
+                # it's the response to our exchange request.
+                self.pending_exchange = None
+                return False
+            # it's the second half of an exchange somebody else started: merge it and keep waiting.
+            self.handle_data(message)
+            return True
+
+        return False
+
+    def share_knowledge(self, player_id):
+        """
+        send another player everything we learned since the last time we exchanged knowledge with him.
+        """
+        task_fields, goal_fields, pieces, newest = self.game_info.knowledge_since(self.last_exchange.get(player_id),
+                                                                                  Player.KNOWLEDGE_EXCHANGE_LIMIT)
+        self.send(messages.KnowledgeExchangeResponse(player_id, self.id, not self.game_on, task_fields or None,
+                                                     goal_fields or None, pieces or None))
+        self.last_exchange[player_id] = newest
 
     def try_join(self, game_name):
-        self.send(messages.GetGames())
-        games = self.receive()
+        if self.fast_join:
+            join_message = self.join_any_game()
+        else:
+            self.send(messages.GetGames())
+            games = self.receive()
+            join_message = self.choose_game(games)
+
+        if join_message is not None:
+            self.send(join_message)
+
+            confirmation = self.receive()
+            if confirmation is not None:
+                self.handle_confirmation(confirmation)
+            else:
+                raise UnexpectedServerMessage
+
+            game_message = self.receive()
+            if game_message is not None:
+                self.handle_game(game_message)
+                return True
+            else:
+                raise UnexpectedServerMessage
+        return False
 
+    def choose_game(self, games: str):
+        """
+        :param games: RegisteredGames message
+        :returns: a JoinGame message for one of the open games, or None if there are none.
+        """
         if 'RegisteredGames' in games:
             self.open_games = parse_games(games)
 
@@ -180,31 +321,20 @@ class Player(Client):
                 temp_game_name = self.open_games[0][0]
                 temp_preferred_role = PlayerType.LEADER.value
                 temp_preferred_team = Allegiance.RED.value
-                self.send(messages.JoinGame(temp_game_name, temp_preferred_team, temp_preferred_role))
-
-                confirmation = self.receive()
-                if confirmation is not None:
-                    self.handle_confirmation(confirmation)
-                else:
-                    raise UnexpectedServerMessage
-
-                game_message = self.receive()
-                if game_message is not None:
-                    self.handle_game(game_message)
-                    return True
-                else:
-                    raise UnexpectedServerMessage
-        return False
+                return messages.JoinGame(temp_game_name, temp_preferred_team, temp_preferred_role)
+        return None
+
+    def join_any_game(self):
+        """
+        :returns: a JoinAnyGame message, the server picks the game for us.
+        """
+        return messages.JoinAnyGame(Allegiance.RED.value, PlayerType.LEADER.value)
 
     def play(self):
-        self.game_on = True
-        self.strategy = StrategyFactory(self.team, self.type, self.location, self.game_info)
+        self.start_playing()
 
         while self.game_on:
-            # find the next decision, send a message specified by it.
-            decision = self.strategy.get_next_move(self.location)
-
-            self.send(self.choose_message(decision))
+            self.send_requests()
 
             response = self.receive()
             if response is None:
@@ -213,44 +343,118 @@ class Player(Client):
 
             else:
                 # normal response!
-                self.handle_data(response)
-                self.strategy.current_location = self.location
-
-                # check if we have a piece now
-                for piece_info in self.game_info.pieces.values():
-                    if piece_info.player_id == self.id:
-                        self.strategy.have_piece = piece_info.id
-                        break
-                else:
-                    self.strategy.have_piece = "-1"
+                self.handle_response(response)
 
         self.shutdown()
 
-    def choose_message(self, decision: Decision) -> str:
+    def start_playing(self):
+        self.game_on = True
+        self.strategy = StrategyFactory(self.team, self.type, self.location, self.game_info, self.id,
+                                        self.strategies.get(self.team, DEFAULT_STRATEGY))
+
+    def send_requests(self):
         """
+        if the player may act now, find the next decision and send the message(s) specified by it.
+        """
+        if self.can_decide():
+            decision = self.strategy.get_next_move(self.location)
+            if decision.choice != Decision.DISCOVER or Decision.DISCOVER not in self.in_flight.values():
+                self.send_request(decision)
+
+            if self.pipelined and decision.choice in (Decision.MOVE, Decision.MOVE_PATH) \
+                    and Decision.DISCOVER not in self.in_flight.values():
+                # look around while the GM is still busy moving us.
+                self.send_request(Decision(Decision.DISCOVER))
+
+    def handle_response(self, response: str):
+        """
+        update our knowledge and the strategy with a response to one of our requests.
+        """
+        self.complete_request(response)
+        self.handle_data(response)
+        self.strategy.current_location = self.location
+
+        # check if we have a piece now
+        self.strategy.have_piece = self.game_info.knowledge.held_by(self.id)
+
+    def can_decide(self) -> bool:
+        """
+        :returns: True if the player may send his next action: when nothing is in flight, or (in pipelined mode)
+        when the only requests still in flight are Discovers, which don't conflict with anything.
+        """
+        if not self.pipelined:
+            return len(self.in_flight) == 0
+        return all(choice == Decision.DISCOVER for choice in self.in_flight.values())
+
+    def send_request(self, decision: Decision):
+        """
+        send the message specified by the decision, tagged with a new request id.
+        """
+        request_id = next(self.request_ids)
+        self.in_flight[request_id] = decision.choice
+        self.send(self.choose_message(decision, request_id))
+
+    def complete_request(self, response: str):
+        """
+        forget about the request answered by the response.
+        Data from the GM carries the request id; responses of other players to our knowledge exchange don't.
+        """
+        if "GameMasterDisconnected" in response:
+            self.in_flight.clear()
+            return
+        request_id = ET.fromstring(response).attrib.get('requestId')
+        if request_id is not None and int(request_id) in self.in_flight:
+            del self.in_flight[int(request_id)]
+            return
+        for request_id, choice in self.in_flight.items():
+            if choice == Decision.KNOWLEDGE_EXCHANGE:
+                del self.in_flight[request_id]
+                return
+        if len(self.in_flight) > 0:
+            # a GM which doesn't echo request ids answers the oldest request.
+            self.in_flight.popitem(last=False)
+
+    def choose_message(self, decision: Decision, request_id=None) -> str:
+        """
+        :param request_id: optional correlation id, echoed by the GM in its response
         :returns: an appropriate message string basing on decision.
         """
         if decision.choice == Decision.DISCOVER:
-            return messages.Discover(self.game_info.id, self.Guid)
+            return messages.Discover(self.game_info.id, self.Guid, request_id)
 
         elif decision.choice == Decision.MOVE:
             direction = decision.additional_info
-            return messages.Move(self.game_info.id, self.Guid, direction)
+            return messages.Move(self.game_info.id, self.Guid, direction, request_id)
+
+        elif decision.choice == Decision.MOVE_PATH:
+            if isinstance(decision.additional_info, tuple):
+                return messages.MovePath(self.game_info.id, self.Guid, target=decision.additional_info,
+                                         request_id=request_id)
+            return messages.MovePath(self.game_info.id, self.Guid, directions=decision.additional_info,
+                                     request_id=request_id)
 
         elif decision.choice == Decision.PICK_UP:
-            return messages.PickUpPiece(self.game_info.id, self.Guid)
+            return messages.PickUpPiece(self.game_info.id, self.Guid, request_id)
 
         elif decision.choice == Decision.PLACE:
-            return messages.PlacePiece(self.game_info.id, self.Guid)
+            return messages.PlacePiece(self.game_info.id, self.Guid, request_id)
+
+        elif decision.choice == Decision.KNOWLEDGE_EXCHANGE:
+            self.pending_exchange = decision.additional_info
+            return messages.AuthorizeKnowledgeExchange(self.game_info.id, self.Guid, decision.additional_info,
+                                                       request_id)
 
             # TODO: ADD THE OTHER MESSAGE HERE.
 
 
 if __name__ == '__main__':
-    def simulate(player_count, verbose):
+    def simulate(player_count, verbose, dilation, pipelined, multiplexed, transport, strategies, fast_join):
         game_name = 'easy clone'
+        clock = Clock(dilation)
+        connection = MultiplexedConnection(transport) if multiplexed else None
         for i in range(player_count):
-            p = Player(index=i, verbose=verbose, game_name=game_name)
+            p = Player(index=i, verbose=verbose, game_name=game_name, clock=clock, pipelined=pipelined,
+                       connection=connection, transport=transport, strategies=strategies, fast_join=fast_join)
             if p.connect():
                 if p.try_join(game_name):
                     p.play()
@@ -260,5 +464,20 @@ if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('-c', '--playercount', default=1, help='Number of players to be deployed.')
     parser.add_argument('-v', '--verbose', action='store_true', default=False, help='Use verbose debugging mode.')
+    parser.add_argument('-d', '--dilation', default=1, help='How many times faster than real time the clock runs.')
+    parser.add_argument('-p', '--pipelined', action='store_true', default=False,
+                        help='Send a Discover along with every move, without waiting for the move to finish.')
+    parser.add_argument('-m', '--multiplexed', action='store_true', default=False,
+                        help='Connect all the players to the server over one shared connection.')
+    parser.add_argument('-t', '--transport', default=TCP, choices=TRANSPORTS, help='How to connect to the server.')
+    parser.add_argument('--red-strategy', default=DEFAULT_STRATEGY, choices=sorted(STRATEGIES),
+                        help='Strategy to play with in the red team.')
+    parser.add_argument('--blue-strategy', default=DEFAULT_STRATEGY, choices=sorted(STRATEGIES),
+                        help='Strategy to play with in the blue team.')
+    parser.add_argument('-f', '--fast-join', action='store_true', default=False,
+                        help='Join any open game in one round trip, without asking for the list of games.')
     args = vars(parser.parse_args())
-    simulate(int(args["playercount"]), args["verbose"])
+    simulate(int(args["playercount"]), args["verbose"], float(args["dilation"]), args["pipelined"],
+             args["multiplexed"], args["transport"],
+             {Allegiance.RED.value: args["red_strategy"], Allegiance.BLUE.value: args["blue_strategy"]},
+             args["fast_join"])
@@ -3,11 +3,15 @@ import socket
 import xml.etree.ElementTree as ET
 from argparse import ArgumentParser
 from datetime import datetime
-from threading import Thread
-from time import sleep
-
-from src.communication import messages
-from src.communication.info import ClientInfo, GameInfo, ClientTypeTag
+from threading import Thread, Lock
+
+from src.communication import messages, multiplex
+from src.communication.clock import Clock, REAL_TIME
+from src.communication.framing import encode_message
+from src.communication.info import ClientInfo, GameInfo, ClientTypeTag, Allegiance
+from src.communication.keepalive import IdleTracker, default_idle_timeout
+from src.communication.matchmaking import MatchmakingQueue
+from src.communication.transport import TCP, TRANSPORTS, bind, new_socket, release
 from src.communication.unexpected import UnexpectedClientMessage
 
 XML_MESSAGE_TAG = "{https://se2.mini.pw.edu.pl/17-results/}"
@@ -20,18 +24,26 @@ class CommunicationServer:
     DEFAULT_BUFFER_SIZE = 2048
     DEFAULT_PORT = 420
     DEFAULT_TIMEOUT = 10
+    # stands for the default idle timeout: seconds without any message or keep-alive, after which a client is
+    # considered dead, derived from KeepAliveInterval of GameMasterSettings.xml when the server is created:
+    DEFAULT_IDLE_TIMEOUT = -1
     DEFAULT_HOSTNAME = socket.gethostname()
 
     # below list contains messages which are addressed to a different player, NOT GM
     TO_PLAYER_MESSAGES = ["Data", "KnowledgeExchangeRequest", "AcceptExchangeRequest",
                           "RejectKnowledgeExchange"]
 
-    def __init__(self, verbose: bool, hostname: str = DEFAULT_HOSTNAME, port: int = DEFAULT_PORT):
+    def __init__(self, verbose: bool, hostname: str = DEFAULT_HOSTNAME, port: int = DEFAULT_PORT,
+                 clock: Clock = None, transport: str = TCP, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
         """
         constructor.
         :param verbose:
         :param hostname:
         :param port:
+        :param clock: Clock used for all waiting done by the server. real time by default.
+        :param transport: TCP, UNIX or LOOPBACK (see transport.py). clients have to use the same one.
+        :param idle_timeout: seconds of silence after which a client is disconnected. None turns it off. by default,
+        it matches the keep-alive interval of the settings (see DEFAULT_IDLE_TIMEOUT).
         """
 
         # declare fields:
@@ -39,21 +51,35 @@ class CommunicationServer:
         self.host = hostname
         self.port = port
         self.verbose = verbose
+        self.clock = clock if clock is not None else REAL_TIME
+        self.transport = transport
 
-        self.socket = socket.socket()
+        self.socket = new_socket(transport)
         self.clients = {}  # client_id => ClientInfo object
         self.games = {}  # game_id => GameInfo object
+        self.game_players = {}  # game_id => set of ids of the players who joined the game
+        self.matchmaking = MatchmakingQueue()  # open places in the games which haven't started, see handle_join_any
+        self.lobby_lock = Lock()
+        self.lobby_listing = None  # RegisteredGames of the open games, ready to be sent. None if it has to be rebuilt
         self.client_indexer = 0
+        self.client_indexer_lock = Lock()
         self.games_indexer = 0
+        self.disconnect_lock = Lock()
+        self.multiplexed_connections = {}  # connection id => socket shared by the players of a multiplexed connection
+        # (liveness is a property of the connection, not of the game: it's tracked in real time, whatever the dilation)
+        if idle_timeout == CommunicationServer.DEFAULT_IDLE_TIMEOUT:
+            idle_timeout = default_idle_timeout()
+        self.idle_clients = IdleTracker(idle_timeout) if idle_timeout else None
 
         try:
-            self.socket.bind((hostname, port))
+            bind(self.socket, transport, hostname, port)
 
         except OSError as e:
             self.verbose_debug("Error while setting up the socket: " + str(e), True)
             raise e
 
-        self.verbose_debug("Created server with hostname: " + hostname + " on port " + str(port), True)
+        self.verbose_debug(
+            "Created " + transport + " server with hostname: " + hostname + " on port " + str(port), True)
 
     def verbose_debug(self, message: str, important: bool = False):
         """
@@ -72,7 +98,7 @@ class CommunicationServer:
         """
         while self.running:
             self.verbose_debug("Currently there are " + str(len(self.clients)) + " clients connected.")
-            sleep(CommunicationServer.INTER_PRINT_STATE_TIME)
+            self.clock.sleep(CommunicationServer.INTER_PRINT_STATE_TIME)
 
     def listen(self):
         """
@@ -83,6 +109,8 @@ class CommunicationServer:
 
         Thread(target=self.print_state, daemon=True).start()
         Thread(target=self.accept_clients, daemon=True).start()
+        if self.idle_clients is not None:
+            Thread(target=self.evict_idle_clients, daemon=True).start()
 
         # wait for and respond to user commands:
         try:
@@ -126,18 +154,52 @@ class CommunicationServer:
         """
         while self.running:
             # block and wait until a client connects:
-            client_socket, address = self.socket.accept()
-            self.register_connection(client_socket, str(self.client_indexer))
+            try:
+                client_socket, address = self.socket.accept()
+            except OSError as e:
+                if not self.running:
+                    break  # the server socket was closed by shutdown()
+                raise e
+            self.register_connection(client_socket, self.new_client_id())
+
+    def evict_idle_clients(self):
+        """
+        method running on a separate thread, disconnects the clients which went silent (e.g. half-open connections).
+        a client is evicted at most a moment after his idle timeout passes.
+        """
+        while self.running:
+            self.idle_clients.clock.sleep(self.idle_clients.time_to_next_deadline())
+
+            for client_id in self.idle_clients.expired():
+                if client_id in self.multiplexed_connections:
+                    self.verbose_debug("Multiplexed connection C" + str(client_id) + " timed out. Closing it.", True)
+                    close_socket(self.multiplexed_connections[client_id])
+                elif client_id in self.clients.keys():
+                    self.verbose_debug(self.clients[client_id].get_tag() + " timed out. Disconnecting him.", True)
+                    self.disconnect_client(client_id)
+
+    def mark_alive(self, client_id):
+        if self.idle_clients is not None:
+            self.idle_clients.touch(client_id)
+
+    def new_client_id(self) -> str:
+        with self.client_indexer_lock:
+            client_id = str(self.client_indexer)
             self.client_indexer += 1
+        return client_id
 
     def register_connection(self, client_socket: socket, client_id: str):
+        new_client = self.add_client(client_socket, client_id)
+        Thread(target=self.handle_client, args=[new_client], daemon=True).start()
+
+    def add_client(self, client_socket, client_id: str) -> ClientInfo:
         new_client = ClientInfo(client_id, socket=client_socket)
         self.clients[client_id] = new_client
+        self.mark_alive(client_id)
 
         self.verbose_debug(
             "New client: " + new_client.get_tag() + " with address " + str(client_socket.getsockname()) + " connected.")
-
-        Thread(target=self.handle_client, args=[new_client], daemon=True).start()
+        return new_client
 
     def handle_client(self, new_client: ClientInfo):
         """
@@ -148,12 +210,18 @@ class CommunicationServer:
 
         try:
             if self.running:
+                if multiplex.starts_with_preamble(new_client.socket):
+                    # many players talking over one connection:
+                    new_client.socket.recv(len(multiplex.PREAMBLE))
+                    self.handle_multiplexed(new_client)
+                    return
+
                 # read the first message:
                 received_data = self.receive(new_client)
 
                 if "RegisterGame" in received_data:
                     new_client.tag = ClientTypeTag.GAME_MASTER
-                elif "GetGames" in received_data:
+                elif "GetGames" in received_data or "JoinAnyGame" in received_data:
                     new_client.tag = ClientTypeTag.PLAYER
 
                 if new_client.tag == ClientTypeTag.CLIENT:
@@ -162,7 +230,7 @@ class CommunicationServer:
 
                 if new_client.tag == ClientTypeTag.PLAYER:
                     self.verbose_debug("Identified C" + str(new_client.id) + " as a player")
-                    self.handle_player(new_client)
+                    self.handle_player(new_client, received_data)
 
                 elif new_client.tag == ClientTypeTag.GAME_MASTER:
                     self.verbose_debug("Identified " + new_client.get_tag() + " as a Game Master")
@@ -177,37 +245,139 @@ class CommunicationServer:
             self.disconnect_client(new_client.id)
             raise e
 
-    def handle_player(self, player: ClientInfo):
-        # first_message was a GetGames xml, so let's get all the open games:
-        open_games = {}
-        for game in self.games.values():
-            if game.open:
-                open_games[game.id] = game
-
-        # and send them to this player
-        self.send(player, messages.RegisteredGames(open_games))
+    def handle_player(self, player: ClientInfo, first_message: str):
+        # first_message was either a GetGames xml, so let's send him all the open games, or a JoinAnyGame:
+        self.handle_player_message(player, first_message)
 
         while self.running:
             player_message = self.receive(player)
-            message_root = ET.fromstring(player_message)
-
             if player_message is None:
                 raise ConnectionAbortedError
 
-            # parse the message:
-            if "JoinGame" in player_message:
-                self.handle_join(player, player_message)
+            self.handle_player_message(player, player_message)
 
-            elif any(message in player_message for message in self.TO_PLAYER_MESSAGES):
-                self.send(self.clients[message_root.attrib["playerId"]], player_message)
+    def handle_player_message(self, player: ClientInfo, player_message: str):
+        message_root = ET.fromstring(player_message)
+
+        # parse the message:
+        if "JoinAnyGame" in player_message:
+            self.handle_join_any(player, player_message)
 
-            elif "GetGames" in player_message:
-                # he's trying to re-join so let's handle him again!
-                self.handle_player(player)
+        elif "JoinGame" in player_message:
+            self.handle_join(player, player_message)
 
-            else:
-                # DEFAULT HANDLING: relay the message to GM
-                self.send(self.clients[player.game_master_id], player_message)
+        elif any(message in player_message for message in self.TO_PLAYER_MESSAGES):
+            recipient = self.clients.get(message_root.attrib["playerId"])
+            if recipient is not None:
+                try:
+                    self.send(recipient, player_message)
+                except OSError as e:
+                    # the recipient is gone (his own handler will disconnect him), which isn't the sender's fault.
+                    self.verbose_debug("Couldn't pass " + player.get_tag() + "'s message on to " +
+                                       recipient.get_tag() + ", dropping it: " + str(e))
+
+        elif "GetGames" in player_message:
+            # he's trying to re-join so let's send him the games again!
+            self.send_open_games(player)
+
+        else:
+            # DEFAULT HANDLING: relay the message to GM
+            gm = self.clients.get(player.game_master_id)
+            if gm is None:
+                # his game is over (or its GM is gone), there's nobody to answer him.
+                self.verbose_debug(player.get_tag() + " isn't in any game, dropping his message.")
+                return
+            self.send(gm, player_message)
+
+    def send_open_games(self, player: ClientInfo):
+        player.socket.sendall(self.open_games_listing())
+        self.verbose_debug("Sent the list of open games to " + player.get_tag() + ".")
+
+    def open_games_listing(self) -> bytes:
+        """
+        :returns: the encoded RegisteredGames message with all the open games. it's built only once after every
+        change of the open games (see games_changed), and then sent as it is to every player who asks.
+        """
+        with self.lobby_lock:
+            if self.lobby_listing is None:
+                open_games = {}
+                for game in self.games.values():
+                    if game.open:
+                        open_games[game.id] = game
+                self.lobby_listing = encode_message(messages.RegisteredGames(open_games))
+            return self.lobby_listing
+
+    def games_changed(self):
+        """
+        to be called whenever a game is registered, started or removed: the list of open games has to be rebuilt.
+        """
+        with self.lobby_lock:
+            self.lobby_listing = None
+
+    def handle_multiplexed(self, connection: ClientInfo):
+        """
+        handle a connection carrying many players, each on his own channel (see multiplex.py).
+        every channel becomes a separate player client, with the usual routing - but there are no threads per player:
+        messages are handled right here, as their frames come in.
+        """
+        # the connection itself isn't a client, its channels are:
+        temp = dict(self.clients)
+        del temp[connection.id]
+        self.clients = temp
+        self.multiplexed_connections[connection.id] = connection.socket
+        self.verbose_debug("C" + str(connection.id) + " is a multiplexed connection.")
+
+        reader = multiplex.FrameReader(connection.socket, CommunicationServer.DEFAULT_BUFFER_SIZE)
+        send_lock = Lock()
+        channels = {}  # channel index => ClientInfo
+
+        try:
+            while self.running:
+                frame = reader.next_frame()
+                if frame is None:
+                    break
+                index, payload = frame
+                player = channels.get(index)
+                self.mark_alive(connection.id)
+
+                if len(payload) == 0:
+                    # the channel was closed by the client.
+                    if player is not None:
+                        del channels[index]
+                        self.verbose_debug(player.get_tag() + " disconnected. Closing channel.")
+                        self.disconnect_client(player.id)
+                    continue
+
+                if player is None:
+                    player = self.add_client(multiplex.ServerChannel(connection.socket, send_lock, index),
+                                             self.new_client_id())
+                    player.tag = ClientTypeTag.PLAYER
+                    channels[index] = player
+
+                if player.id not in self.clients.keys():
+                    continue
+
+                self.mark_alive(player.id)
+                player.received.feed(payload)
+                player_message = player.received.next_message()
+                while player_message is not None:
+                    self.verbose_debug("Message received from " + player.get_tag() + ": \"" + player_message + "\".")
+                    try:
+                        self.handle_player_message(player, player_message)
+                    except Exception as e:
+                        self.verbose_debug("Disconnecting " + player.get_tag() + " due to an unexpected exception: " +
+                                           str(e) + ".", True)
+                        del channels[index]
+                        self.disconnect_client(player.id)
+                        break
+                    player_message = player.received.next_message()
+        finally:
+            for player in channels.values():
+                self.disconnect_client(player.id)
+            del self.multiplexed_connections[connection.id]
+            if self.idle_clients is not None:
+                self.idle_clients.forget(connection.id)
+            connection.socket.close()
 
     def handle_join(self, player, player_message):
         message_root = ET.fromstring(player_message)
@@ -218,17 +388,51 @@ class CommunicationServer:
             if game_info.name == players_game_name:
                 # game found, so we will update JoinGame with player_id and send it to GM:
                 message_root.attrib["playerId"] = str(player.id)
-                join_game_message = ET.tostring(message_root, encoding='unicode', method='xml')
-
-                gm_id = game_info.game_master_id
-                player.game_master_id = gm_id
-                player.game_id = self.clients[gm_id].game_id
-                self.send(self.clients[gm_id], join_game_message)
+                self.forward_join(player, game_info, ET.tostring(message_root, encoding='unicode', method='xml'))
                 return True
         # no game with this name, send rejection
         self.send(player, messages.RejectJoiningGame(player.id, players_game_name))
         return False
 
+    def handle_join_any(self, player, player_message):
+        """
+        find a free place matching the player's criteria, and pass his request on to the game's GM as a JoinGame,
+        so that he's in the game after a single round trip. if there's no place for him, he waits in the
+        matchmaking queue until there is one.
+        """
+        message_root = ET.fromstring(player_message)
+        team = message_root.attrib["preferredTeam"]
+        role = message_root.attrib["preferredRole"]
+        players_per_team = message_root.attrib.get("playersPerTeam")
+
+        place = self.matchmaking.find(team, players_per_team)
+        if place is None:
+            self.verbose_debug("There's no place for " + player.get_tag() + " now, he's waiting for one.")
+            self.matchmaking.enqueue(player.id, team, role, players_per_team)
+            return False
+        self.seat_player(player, place[0], place[1], role)
+        return True
+
+    def seat_player(self, player, game_id, team, role):
+        self.matchmaking.take(player.id, game_id, team)
+        game_info = self.games[game_id]
+        self.forward_join(player, game_info, messages.JoinGame(game_info.name, team, role, str(player.id)))
+
+    def seat_waiting_players(self):
+        """
+        pass the requests of the waiting players, for whom there are places now, on to the GMs.
+        """
+        # (players who left, or have got into a game in the meantime, aren't waiting anymore)
+        for player_id, game_id, team, role in self.matchmaking.assign(
+                lambda waiting_id: waiting_id in self.clients.keys() and self.clients[waiting_id].game_id == "-1"):
+            self.seat_player(self.clients[player_id], game_id, team, role)
+
+    def forward_join(self, player, game_info: GameInfo, join_game_message: str):
+        gm_id = game_info.game_master_id
+        player.game_master_id = gm_id
+        player.game_id = game_info.id
+        self.send(self.clients[gm_id], join_game_message)
+
     def handle_gm(self, gm: ClientInfo, registration_msg: str):
         # first_message should be a RegisterGames xml
 
@@ -255,32 +459,104 @@ class CommunicationServer:
                 if gm_msg is None:
                     raise ConnectionAbortedError
 
-                msg_root = ET.fromstring(gm_msg)
-
-                # non-default message types:
-                if "ConfirmJoiningGame" in gm_msg:
-                    player_id = msg_root.attrib["playerId"]
-                    self.clients[player_id].game_master_id = gm.id
-                    self.send(self.clients[player_id], gm_msg)
+                self.handle_gm_message(gm, gm_msg)
 
-                elif "GameStarted" in gm_msg:
-                    game_id = msg_root.attrib["gameId"]
-                    self.games[game_id].open = False
+    def handle_gm_message(self, gm: ClientInfo, gm_msg: str):
+        msg_root = ET.fromstring(gm_msg)
 
-                elif "Data" in gm_msg:
-                    player_id = msg_root.attrib["playerId"]
-                    finished = msg_root.attrib["gameFinished"]
-                    client = self.clients.get(player_id)
-                    if finished == "true" and client is not None:
-                        # TODO: properly remove a game from server.
-                        pass
-                    self.send(client, gm_msg)
+        # non-default message types:
+        if "ConfirmJoiningGame" in gm_msg:
+            player_id = msg_root.attrib["playerId"]
+            self.clients[player_id].game_master_id = gm.id
+            game_id = msg_root.attrib["gameId"]
+            self.game_players.get(game_id, set()).add(player_id)
+            # (the GM may have put him in the other team than the one his place was in)
+            self.matchmaking.take(player_id, game_id,
+                                  msg_root.find(XML_MESSAGE_TAG + "PlayerDefinition").attrib["team"])
+            self.send(self.clients[player_id], gm_msg)
+
+        elif "RejectJoiningGame" in gm_msg:
+            player_id = msg_root.attrib["playerId"]
+            if self.matchmaking.release(player_id):
+                self.seat_waiting_players()
+            self.relay_msg_to_player(gm, gm_msg)
+            # he isn't in any game, so he can ask to join another one (and wait for a place in the queue):
+            player = self.clients.get(player_id)
+            if player is not None and player.game_master_id == gm.id:
+                player.game_master_id = "-1"
+                player.game_id = "-1"
+
+        elif "GameStarted" in gm_msg:
+            game_id = msg_root.attrib["gameId"]
+            self.games[game_id].open = False
+            self.games_changed()
+            self.matchmaking.remove_game(game_id)
+
+        elif "Data" in gm_msg:
+            player_id = msg_root.attrib["playerId"]
+            finished = msg_root.attrib["gameFinished"]
+            client = self.clients.get(player_id)
+            if client is not None and client.game_master_id == gm.id:
+                self.send(client, gm_msg)
+            if finished == "true":
+                # (a GM hosting many games finishes them one by one, see gamehost.py, so the Data tells which one it
+                # was - even if its recipient is gone. once it's closed, the GM's late answers don't close anything)
+                game_id = msg_root.attrib.get("gameId")
+                if game_id is None and client is not None and client.game_master_id == gm.id:
+                    game_id = client.game_id  # a GM which doesn't set gameId
+                game_info = self.games.get(game_id)
+                if game_info is not None and game_info.game_master_id == gm.id:
+                    self.close_game(game_id, player_id)
+
+        elif "RegisterGame" in gm_msg:
+            # one more game hosted by the same GM:
+            if not self.try_register_game(gm, gm_msg):
+                self.send(gm, messages.RejectGameRegistration(msg_root[0].attrib["gameName"]))
+
+        # todo: be careful. possibly some other messages might require special handling.
 
-                # todo: be careful. possibly some other messages might require special handling.
+        else:
+            # DEFAULT MESSAGE HANDLING:
+            self.relay_msg_to_player(gm, gm_msg)
 
-                else:
-                    # DEFAULT MESSAGE HANDLING:
-                    self.relay_msg_to_player(gm_msg)
+    def close_game(self, game_id: str, finished_player_id=None):
+        """
+        forget a finished game: remove it from the registry and release its players. each of them gets a final Data,
+        and the GM is told that the game is closed (GameFinished), so that he can stop playing.
+        the players stay connected and can join another game.
+        :param finished_player_id: id of the player who already got the final Data from the GM (he doesn't get another)
+        """
+        game_info = self.games.pop(game_id, None)
+        if game_info is None:
+            return  # already closed.
+        self.games_changed()
+        game_info.finished = True
+        self.matchmaking.remove_game(game_id)
+
+        gm = self.clients.get(game_info.game_master_id)
+        if gm is not None and gm.game_id == game_id:
+            gm.game_id = "-1"
+
+        for player_id in self.game_players.pop(game_id, set()):
+            player = self.clients.get(player_id)
+            if player is None or player.game_master_id != game_info.game_master_id:
+                continue
+            player.game_master_id = "-1"
+            player.game_id = "-1"
+            if player_id == finished_player_id:
+                continue
+            try:
+                self.send(player, messages.Data(player_id, True, game_id=game_id))
+            except OSError as e:
+                self.verbose_debug("Couldn't tell " + player.get_tag() + " that his game is over: " + str(e))
+
+        if gm is not None:
+            try:
+                self.send(gm, messages.GameFinished(game_id))
+            except OSError as e:
+                self.verbose_debug("Couldn't tell " + gm.get_tag() + " that his game is closed: " + str(e))
+
+        self.verbose_debug("Game " + game_info.name + " (id: " + game_id + ") finished and closed.")
 
     def try_register_game(self, gm: ClientInfo, register_game_message: str):
         """
@@ -315,19 +591,25 @@ class CommunicationServer:
                                            max_red_players=new_red_players,
                                            open=True, game_master_id=gm.id)
             gm.game_id = game_id
+            self.game_players[game_id] = set()
+            self.games_changed()
+            self.matchmaking.add_game(game_id, {Allegiance.RED.value: int(new_red_players),
+                                                Allegiance.BLUE.value: int(new_blue_players)})
             self.verbose_debug(
                 gm.get_tag() + " registered a new game, with name: " + new_game_name + " num of blue players: " + str(
                     new_blue_players) + " num of red players: " + str(new_red_players))
             self.send(gm, messages.ConfirmGameRegistration(game_id))
             self.games_indexer += 1
+            self.seat_waiting_players()
             return True
 
-    def relay_msg_to_player(self, gm_msg):
+    def relay_msg_to_player(self, gm: ClientInfo, gm_msg):
         # the message should be a "PlayerMessage", so it definitely needs to have playerId in root attributes.
         msg_root = ET.fromstring(gm_msg)
         player_id = msg_root.attrib["playerId"]
         client = self.clients.get(player_id)
-        if client is not None:
+        # (a player who has moved on to another game doesn't get messages from his previous GM)
+        if client is not None and client.game_master_id == gm.id:
             self.send(client, gm_msg)
 
     def send(self, recipient: ClientInfo, message: str):
@@ -337,7 +619,7 @@ class CommunicationServer:
         :param message: message to be passed, any type. will be encoded as string.
         """
         message = str(message)
-        recipient.socket.send(message.encode())
+        recipient.socket.sendall(encode_message(message))
         self.verbose_debug("Message sent to " + recipient.get_tag() + ": \"" + message + "\".")
 
     def send_to_all_players(self, message: str):
@@ -349,17 +631,21 @@ class CommunicationServer:
     def receive(self, client: ClientInfo):
         """
         :type client: ClientInfo
+        :returns: the oldest message from the client which hasn't been returned yet.
         """
 
-        # TODO: upgrade this method to split clumped messages and return the last message from queue.
-
         # check if the client hadn't disconnected before we can read a message:
         if client.id not in self.clients.keys():
             raise ConnectionResetError
         try:
-            received_data = client.socket.recv(CommunicationServer.DEFAULT_BUFFER_SIZE).decode()
-            if len(received_data) < 1 or received_data is None:
-                raise ConnectionResetError
+            received_data = client.received.next_message()
+            while received_data is None:
+                data = client.socket.recv(CommunicationServer.DEFAULT_BUFFER_SIZE)
+                if len(data) < 1:
+                    raise ConnectionResetError
+                self.mark_alive(client.id)  # keep-alives (empty messages) count as well
+                client.received.feed(data)
+                received_data = client.received.next_message()
 
             self.verbose_debug("Message received from " + client.get_tag() + ": \"" + received_data + "\".")
             return received_data
@@ -371,32 +657,56 @@ class CommunicationServer:
 
     def disconnect_client(self, client_id: int):
 
-        if client_id not in self.clients.keys():
-            return
-        client = self.clients[client_id]
-
-        # if the client was a GM, remove his game from server:
+        with self.disconnect_lock:
+            # (the client can be disconnected both by his own handler and by evict_idle_clients)
+            if client_id not in self.clients.keys():
+                return
+            client = self.clients[client_id]
+            temp = dict(self.clients)
+            del temp[client_id]
+            self.clients = temp
+        if self.idle_clients is not None:
+            self.idle_clients.forget(client_id)
+
+        # if the client was a player in a game, tell its GM:
+        if client.tag == ClientTypeTag.PLAYER:
+            self.game_players.get(client.game_id, set()).discard(client.id)
+            if self.matchmaking.release(client.id):
+                self.seat_waiting_players()
+        if client.tag == ClientTypeTag.PLAYER and client.game_master_id in self.clients.keys():
+            try:
+                self.send(self.clients[client.game_master_id], messages.player_disconnected(client.id))
+            except OSError as e:
+                self.verbose_debug("Couldn't tell the GM about " + client.get_tag() + " leaving: " + str(e))
+
+        # if the client was a GM, remove his games from server (unless they have finished and been closed already):
         if client.tag == ClientTypeTag.GAME_MASTER:
-            for game_info in self.games.values():
-                if game_info.name == client.game_name and game_info.game_master_id == client_id:
-                    # find all players who were connected to this game and send them a GameMasterdisconneted message
-                    for dude in self.clients.values():
-                        if dude.tag == ClientTypeTag.PLAYER and dude.game_master_id == client.id:
-                            self.send(dude, messages.GameMasterDisconnected(game_info.id))
-
-                    del self.games[game_info.id]
-                    self.verbose_debug("Closed " + client.get_tag() + "'s game (name was: " + game_info.name + ").")
-                    break
-            else:
+            hosted_games = [game_info for game_info in self.games.values() if game_info.game_master_id == client_id]
+            if len(hosted_games) == 0 and client.game_id != "-1":
                 self.verbose_debug(
                     "Couldn't close " + client.get_tag() + "'s game - it wasn't found on the server.")
+            for game_info in hosted_games:
+                # find all players who were connected to this game and send them a GameMasterdisconneted message
+                for dude in self.clients.values():
+                    if dude.tag == ClientTypeTag.PLAYER and dude.game_master_id == client.id and \
+                            dude.game_id == game_info.id:
+                        # (he's free to re-join, so he can wait in the matchmaking queue for a game of a new GM)
+                        dude.game_master_id = "-1"
+                        dude.game_id = "-1"
+                        try:
+                            self.send(dude, messages.GameMasterDisconnected(game_info.id))
+                        except OSError as e:
+                            self.verbose_debug("Couldn't tell " + dude.get_tag() + " about it: " + str(e))
+
+                self.games.pop(game_info.id, None)
+                self.games_changed()
+                self.game_players.pop(game_info.id, None)
+                self.matchmaking.remove_game(game_info.id)
+                self.verbose_debug("Closed " + client.get_tag() + "'s game (name was: " + game_info.name + ").")
 
         # close the socket
         try:
-            client.socket.close()
-            temp = dict(self.clients)
-            del temp[client_id]
-            self.clients = temp
+            close_socket(client.socket)
 
         except socket.error as e:
             self.verbose_debug("Couldn't close socket?! " + str(e), True)
@@ -404,16 +714,33 @@ class CommunicationServer:
     def shutdown(self):
         self.running = False
         self.socket.close()
+        release(self.transport, self.host, self.port)
         self.verbose_debug("Shutting down the server.", True)
 
 
+def close_socket(client_socket):
+    """
+    close the socket, waking up the thread blocked on receiving from it (close alone doesn't do that).
+    """
+    try:
+        client_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # not connected anymore.
+    client_socket.close()
+
+
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('-v', '--verbose', action='store_true', default=False, help='Use verbose debugging mode.')
+    parser.add_argument('-d', '--dilation', default=1, help='How many times faster than real time the clock runs.')
+    parser.add_argument('-t', '--transport', default=TCP, choices=TRANSPORTS, help='How clients connect to the server.')
+    parser.add_argument('-i', '--idle-timeout', type=float, default=CommunicationServer.DEFAULT_IDLE_TIMEOUT,
+                        help='Disconnect clients silent for this many seconds (0 turns it off).')
     args = vars(parser.parse_args())
 
     try:
-        server = CommunicationServer(args["verbose"])
+        server = CommunicationServer(args["verbose"], clock=Clock(float(args["dilation"])), transport=args["transport"],
+                                     idle_timeout=args["idle_timeout"])
         server.listen()
     except OSError:
         print("Couldn't start server.")
@@ -1,6 +1,7 @@
 import random
 
 from src.communication.info import GameInfo, Allegiance, Direction, GoalFieldType
+from src.communication.pathfinding import PathFinder, directions_along
 from src.communication.unexpected import StrategicError
 
 
@@ -11,22 +12,41 @@ class Decision:
 
     NULLDECISION = 0
     MOVE = 1
+    MOVE_PATH = 2  # additional_info: list of directions, or a tuple x,y of the target field
     DISCOVER = 5
     KNOWLEDGE_EXCHANGE = 6
     PICK_UP = 7
     PLACE = 8
 
 
-def StrategyFactory(team: str, player_type: str, location: tuple, game_info: GameInfo):
+STRATEGIES = {}  # name => {team => strategy class}, see register_strategy
+DEFAULT_STRATEGY = "basic"
+
+
+def register_strategy(name: str, red_strategy, blue_strategy):
+    """
+    make a pair of strategy classes (one for each team) available to players under the given name.
+    """
+    STRATEGIES[name] = {Allegiance.RED.value: red_strategy, Allegiance.BLUE.value: blue_strategy}
+
+
+def StrategyFactory(team: str, player_type: str, location: tuple, game_info: GameInfo, player_id=None,
+                    name: str = DEFAULT_STRATEGY):
+    if name not in STRATEGIES:
+        raise ValueError("Unknown strategy: " + str(name) + ", the registered ones are: " + ", ".join(STRATEGIES))
     if team == Allegiance.RED.value:
-        return BasicRedStrategy(team, player_type, location, game_info)
+        return STRATEGIES[name][Allegiance.RED.value](team, player_type, location, game_info, player_id)
     else:
-        return BasicBlueStrategy(team, player_type, location, game_info)
+        return STRATEGIES[name][Allegiance.BLUE.value](team, player_type, location, game_info, player_id)
 
 
 class BaseStrategy:
-    def __init__(self, team: str, player_type: str, location: tuple, game_info: GameInfo):
+    KNOWLEDGE_EXCHANGE_PERIOD = 4  # every n-th time we gather information, we ask a teammate instead of Discovering
+    TRANSIT_STEPS = 4  # how many steps of a path are sent in one MovePath, when going between the areas of the board
+
+    def __init__(self, team: str, player_type: str, location: tuple, game_info: GameInfo, player_id=None):
 
+        self.player_id = player_id
         self.team = team
         self.player_type = player_type
         self.current_location = location
@@ -34,6 +54,8 @@ class BaseStrategy:
         self.last_move = Decision(Decision.NULLDECISION)
         self.have_piece = "-1"  # by default, the player doesn't have a piece.
         # if self.have_piece is different from -1, then it is the id of the currently held piece
+        self.information_requests = 0  # how many times did we gather information
+        self.path_finder = PathFinder(game_info, team, player_id)
 
     def get_next_move(self, new_location: tuple):
         # THE MAIN STRATEGY METHOD
@@ -68,6 +90,37 @@ class BaseStrategy:
         # abstract. implementation depends on if we're red or blue.
         raise NotImplementedError
 
+    def move_towards(self, targets, steps=1):
+        """
+        :param targets: locations of fields, we go to the nearest of them (as far as we know the board).
+        :param steps: maximal number of moves to make at once. more than one are sent as a single MovePath.
+        :returns: a MOVE or MOVE_PATH Decision, or None if we're already on a target or none can be reached.
+        """
+        path = self.path_finder.path_to(self.current_location, targets)
+        if not path:
+            return None
+        directions = directions_along(self.current_location, path[:steps])
+        if len(directions) == 1:
+            return Decision(Decision.MOVE, directions[0])
+        return Decision(Decision.MOVE_PATH, directions)
+
+    def nearest_unknown_goal(self):
+        """
+        :returns: location of the nearest goal field of our team whose type we don't know, and which we can get to
+        (as far as we know). None if there's no such field.
+        """
+        return self.game_info.unknown_goals[self.team].nearest(self.current_location, self.path_finder.is_passable)
+
+    def own_goal_area(self):
+        """
+        :returns: locations of the goal fields of our team worth going to: the nearest unknown one if there is one,
+        all of them otherwise.
+        """
+        nearest = self.nearest_unknown_goal()
+        if nearest is not None:
+            return [nearest]
+        return [location for location, field in self.game_info.goal_fields.items() if field.allegiance == self.team]
+
     def try_and_place(self):
         # try to place the piece on the field on which we're standing.
 
@@ -77,22 +130,22 @@ class BaseStrategy:
         if field.type == GoalFieldType.UNKNOWN.value:
             # we can safely place the piece! and remove it from self.
             self.game_info.pieces[self.have_piece].player_id = "-1"
+            self.game_info.update_piece_index(self.have_piece)
             self.have_piece = "-1"
             return Decision(Decision.PLACE)
         else:
             # our field was already discovered as a goal. let's look for a different one.
-            neighbours = self.game_info.get_neighbours(self.current_location)
-            for neighbour in neighbours.values():
-                if self.game_info.is_goal_field(neighbour.location) and neighbour.type == GoalFieldType.UNKNOWN.value:
-                    return Decision(Decision.MOVE, self.get_direction_to(neighbour))
-            # no good neighbour found. we have to look for a different field to put our piece:
             return self.look_for_unknown_goal()
 
     def look_for_unknown_goal(self):
-        # we can't place the piece on our field, all our neighbours are no good as well.
-        # we need to move somewhere to find a different unknown goal.
-
-        # base implementation: random.
+        # we can't place the piece on our field. we need to move somewhere to find a different unknown goal.
+
+        # base implementation: go to the nearest one we know of, or move randomly if there's none.
+        nearest = self.nearest_unknown_goal()
+        if nearest is not None:
+            decision = self.move_towards([nearest])
+            if decision is not None:
+                return decision
         return self.get_random_move()
 
     def have_sufficient_information(self):
@@ -104,7 +157,14 @@ class BaseStrategy:
     def gather_information(self):
         # collect information, be it through Discover, or through KnowledgeExchange
 
-        # base implementation: simply Discover
+        # base implementation: Discover, but every couple of times exchange knowledge with a teammate instead.
+        self.information_requests += 1
+        if self.information_requests % self.KNOWLEDGE_EXCHANGE_PERIOD == 0:
+            teammates = sorted(player_id for player_id in self.game_info.teams.get(self.team, {}).keys()
+                               if player_id != self.player_id)
+            if self.player_id is not None and len(teammates) > 0:
+                teammate = teammates[(self.information_requests // self.KNOWLEDGE_EXCHANGE_PERIOD) % len(teammates)]
+                return Decision(Decision.KNOWLEDGE_EXCHANGE, teammate)
         return Decision(Decision.DISCOVER)
 
     def make_educated_move(self):
@@ -125,20 +185,28 @@ class BaseStrategy:
         if field.has_piece:
             return Decision(Decision.PICK_UP)
 
-        else:
-            # look for the best valid (unoccupied, in-bounds) neighbour
-            neighbours = self.game_info.get_neighbours(self.current_location)
-            min_distance, min_neighbour = None, None
-            for neighbour in neighbours.values():
-                if not neighbour.is_occupied and not self.game_info.is_goal_field(neighbour.location):
-                    distance = neighbour.distance_to_piece
-                    # if distance is -1, then no piece on that field. we want to avoid it so we set distance to 1000
-                    if distance == -1:
-                        distance = 1000
-                    if min_distance is None or distance <= min_distance:
-                        min_distance, min_neighbour = distance, neighbour
-
-            return Decision(Decision.MOVE, self.get_direction_to(min_neighbour))
+        # if we know where pieces are, take the shortest way to the nearest one:
+        nearest = self.game_info.knowledge.nearest_piece(self.current_location)
+        decision = self.move_towards([nearest]) if nearest is not None else None
+        if decision is not None:
+            return decision
+
+        # look for the best valid (unoccupied, in-bounds) neighbour
+        neighbours = self.game_info.get_neighbours(self.current_location)
+        min_distance, min_neighbour = None, None
+        for neighbour in neighbours.values():
+            if not neighbour.is_occupied and not self.game_info.is_goal_field(neighbour.location):
+                distance = neighbour.distance_to_piece
+                # if distance is -1, then no piece on that field. we want to avoid it so we set distance to 1000
+                if distance == -1:
+                    distance = 1000
+                if min_distance is None or distance <= min_distance:
+                    min_distance, min_neighbour = distance, neighbour
+
+        if min_neighbour is None:
+            # we're boxed in by other players. let's look around until they move.
+            return Decision(Decision.DISCOVER)
+        return Decision(Decision.MOVE, self.get_direction_to(min_neighbour))
 
     def get_random_move(self, illegal=None):
         # returns a random valid move based on the current position.
@@ -221,16 +289,16 @@ class BaseStrategy:
 
 
 class BasicBlueStrategy(BaseStrategy):
-    def __init__(self, team: str, player_type: str, location: tuple, game_info: GameInfo):
-        super(BasicBlueStrategy, self).__init__(team, player_type, location, game_info)
+    def __init__(self, team: str, player_type: str, location: tuple, game_info: GameInfo, player_id=None):
+        super(BasicBlueStrategy, self).__init__(team, player_type, location, game_info, player_id)
 
     def go_to_goal_fields(self):
         # goal fields are at the bottom of the board for blue players.
-        return self.try_go_down()
+        return self.move_towards(self.own_goal_area(), self.TRANSIT_STEPS) or self.try_go_down()
 
     def go_to_task_fields(self):
         # vice versa!
-        return self.try_go_up()
+        return self.move_towards(self.game_info.task_fields.keys(), self.TRANSIT_STEPS) or self.try_go_up()
 
     def try_go_up(self):
         # overriding the base method to make sure that a Blue player doesn't get into Red goal fields.
@@ -242,15 +310,15 @@ class BasicBlueStrategy(BaseStrategy):
 
 
 class BasicRedStrategy(BaseStrategy):
-    def __init__(self, team: str, player_type: str, location: tuple, game_info: GameInfo):
-        super(BasicRedStrategy, self).__init__(team, player_type, location, game_info)
+    def __init__(self, team: str, player_type: str, location: tuple, game_info: GameInfo, player_id=None):
+        super(BasicRedStrategy, self).__init__(team, player_type, location, game_info, player_id)
 
     def go_to_goal_fields(self):
         # goal fields are at the top of the board for red players
-        return self.try_go_up()
+        return self.move_towards(self.own_goal_area(), self.TRANSIT_STEPS) or self.try_go_up()
 
     def go_to_task_fields(self):
-        return self.try_go_down()
+        return self.move_towards(self.game_info.task_fields.keys(), self.TRANSIT_STEPS) or self.try_go_down()
 
     def try_go_down(self):
         # overriding the base method to make sure that a Red player doesn't get into Blue goal fields.
@@ -259,3 +327,18 @@ class BasicRedStrategy(BaseStrategy):
                 # it's red team's goal fields! we can't go there.
                 return self.get_random_move(illegal=[Direction.DOWN.value])
         return super(BasicRedStrategy, self).try_go_down()
+
+
+class GreedyRedStrategy(BasicRedStrategy):
+    # the basic strategy without path finding: every move is chosen only by looking at the neighbouring fields.
+    def move_towards(self, targets, steps=1):
+        return None
+
+
+class GreedyBlueStrategy(BasicBlueStrategy):
+    def move_towards(self, targets, steps=1):
+        return None
+
+
+register_strategy(DEFAULT_STRATEGY, BasicRedStrategy, BasicBlueStrategy)
+register_strategy("greedy", GreedyRedStrategy, GreedyBlueStrategy)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+import cProfile
+import pstats
+import random
+from argparse import ArgumentParser
+from time import perf_counter
+
+from src.communication.helpful_math import Manhattan_Distance as manhattan
+from src.communication.info import GameInfo, Allegiance, GoalFieldType, PieceInfo
+from src.communication.metrics import Histogram, LatencyRecorder, format_ms
+from src.communication.strategy import BasicBlueStrategy, BasicRedStrategy, Decision
+from src.communication.unexpected import StrategicError
+
+BOARDS = [(5, 8, 2), (10, 16, 3), (20, 32, 4)]  # (width, task area height, goal area height)
+DENSITIES = [0.05, 0.2]  # fraction of task fields occupied by other players
+PIECE_DENSITY = 0.05  # fraction of task fields with a piece on them
+STRATEGIES = {Allegiance.RED.value: BasicRedStrategy, Allegiance.BLUE.value: BasicBlueStrategy}
+CARRIED_PIECE_ID = "carried"
+
+# what the breakdown is made of: method name => phase. the times are inclusive (e.g. a random move also gets
+# the neighbours), so the phases don't have to add up to the whole decision.
+GAME_INFO_PHASES = {"get_neighbours": "get_neighbours", "is_goal_field": "is_goal_field/is_task_field",
+                    "is_task_field": "is_goal_field/is_task_field"}
+STRATEGY_PHASES = {"get_direction_to": "direction selection", "get_random_move": "direction selection",
+                   "move_towards": "path finding"}
+
+
+def synthetic_game_info(width: int, task_height: int, goals_height: int, density: float, rng: random.Random):
+    """
+    :returns: a GameInfo as a player could know it in the middle of a game: with other players standing on
+    a given fraction of the task fields, some pieces, distances to them, and a third of the goals discovered.
+    """
+    game_info = GameInfo(board_width=width, task_height=task_height, goals_height=goals_height)
+    game_info.initialize_fields()
+
+    task_locations = list(game_info.task_fields.keys())
+    for player_index, location in enumerate(rng.sample(task_locations, int(density * len(task_locations)))):
+        game_info.task_fields[location].player_id = str(1000 + player_index)
+
+    piece_locations = rng.sample(task_locations, max(1, int(PIECE_DENSITY * len(task_locations))))
+    for piece_index, location in enumerate(piece_locations):
+        game_info.task_fields[location].piece_id = str(piece_index)
+        game_info.pieces[str(piece_index)] = PieceInfo(str(piece_index), location=location)
+        game_info.update_piece_index(str(piece_index), location)
+    for location, field in game_info.task_fields.items():
+        field.distance_to_piece = min(manhattan(location, piece) for piece in piece_locations)
+
+    for location, field in game_info.goal_fields.items():
+        if rng.random() < 1 / 3:
+            field.type = rng.choice([GoalFieldType.GOAL.value, GoalFieldType.NON_GOAL.value])
+            game_info.update_goal_index(location)
+
+    game_info.pieces[CARRIED_PIECE_ID] = PieceInfo(CARRIED_PIECE_ID)
+    return game_info
+
+
+def random_states(game_info: GameInfo, team: str, count: int, rng: random.Random) -> list:
+    """
+    :returns: list of tuples (location, held piece id, last decision) of a player of the given team.
+    """
+    locations = [location for location, field in game_info.task_fields.items() if not field.is_occupied]
+    locations += [location for location, field in game_info.goal_fields.items() if field.allegiance == team]
+    states = []
+    for i in range(count):
+        have_piece = CARRIED_PIECE_ID if rng.random() < 0.5 else "-1"
+        last_move = Decision(rng.choice([Decision.MOVE, Decision.DISCOVER]))
+        states.append((rng.choice(locations), have_piece, last_move))
+    return states
+
+
+def decide(strategy, state) -> bool:
+    """
+    :returns: False if the strategy failed to make a decision in the given state.
+    """
+    location, have_piece, last_move = state
+    strategy.have_piece = have_piece
+    strategy.last_move = last_move
+    strategy.game_info.pieces[CARRIED_PIECE_ID].player_id = strategy.player_id
+    try:
+        strategy.get_next_move(location)
+        return True
+    except (IndexError, StrategicError):
+        return False
+
+
+def timed(method, recorder: LatencyRecorder, phase: str):
+    def wrapper(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            recorder.record("phase", phase, perf_counter() - started)
+
+    return wrapper
+
+
+def instrument(strategy, recorder: LatencyRecorder):
+    """
+    replace the methods making up the breakdown with timed ones, on these instances only.
+    """
+    for name, phase in GAME_INFO_PHASES.items():
+        setattr(strategy.game_info, name, timed(getattr(strategy.game_info, name), recorder, phase))
+    for name, phase in STRATEGY_PHASES.items():
+        setattr(strategy, name, timed(getattr(strategy, name), recorder, phase))
+
+
+def measure(team: str, board: tuple, density: float, decisions: int, seed: int = 0):
+    """
+    time get_next_move of the team's basic strategy over random states of a synthetic board.
+    :returns: a tuple: (Histogram of decision times, LatencyRecorder with the breakdown, number of failed decisions)
+    """
+    rng = random.Random(seed)
+    game_info = synthetic_game_info(*board, density, rng)
+    states = random_states(game_info, team, decisions, rng)
+    strategy = STRATEGIES[team](team, "member", states[0][0], game_info, player_id="1")
+    random.seed(seed)  # the strategies move randomly now and then
+
+    decision_times = Histogram()
+    failed = 0
+    for state in states:
+        started = perf_counter()
+        failed += not decide(strategy, state)
+        decision_times.add(perf_counter() - started)
+
+    # the breakdown is measured in a separate run, so that the timing wrappers don't inflate the decision times:
+    breakdown = LatencyRecorder()
+    instrument(strategy, breakdown)
+    with breakdown.measure("decision", "instrumented"):
+        for state in states:
+            decide(strategy, state)
+
+    return decision_times, breakdown, failed
+
+
+def report(team: str, board: tuple, density: float, decisions: int) -> str:
+    decision_times, breakdown, failed = measure(team, board, density, decisions)
+    width, task_height, goals_height = board
+    lines = [" " + team + " " + str(width) + "x" + str(task_height + 2 * goals_height) + " density=" + str(density) +
+             ": decision " + decision_times.summary() + " failed=" + str(failed)]
+
+    total = breakdown.histograms["decision", "instrumented"].max
+    for (action, phase), histogram in sorted(breakdown.histograms.items()):
+        if action != "phase":
+            continue
+        spent = histogram.mean * histogram.count
+        lines.append("   " + phase + ": calls=" + str(histogram.count) + " total=" + format_ms(spent) + (
+            " (%.0f%%)" % (100 * spent / total)))
+    return "\n".join(lines)
+
+
+def run(decisions: int):
+    for board in BOARDS:
+        for density in DENSITIES:
+            for team in STRATEGIES:
+                print(report(team, board, density, decisions))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--decisions', default=2000, help='Number of decisions timed on each board.')
+    parser.add_argument('--profile', default=None,
+                        help='Run under cProfile and save the stats to the given file (e.g. for snakeviz or '
+                             'flameprof), printing the most expensive functions.')
+    args = vars(parser.parse_args())
+
+    if args["profile"]:
+        profiler = cProfile.Profile()
+        profiler.runcall(run, int(args["decisions"]))
+        profiler.dump_stats(args["profile"])
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    else:
+        run(int(args["decisions"]))
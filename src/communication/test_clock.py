@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import time
+from unittest import TestCase
+
+from src.communication.clock import Clock
+
+
+class TestClock(TestCase):
+    def test_dilated_sleep_is_shorter(self):
+        clock = Clock(dilation=100)
+
+        start = time.monotonic()
+        clock.sleep(2)
+        elapsed = time.monotonic() - start
+
+        assert elapsed < 1
+
+    def test_sleep_ms(self):
+        clock = Clock(dilation=10)
+
+        start = time.monotonic()
+        clock.sleep_ms(500)
+        elapsed = time.monotonic() - start
+
+        assert 0.04 <= elapsed < 0.5
+
+    def test_virtual_time_runs_faster(self):
+        clock = Clock(dilation=100)
+
+        time.sleep(0.05)
+
+        assert clock.time() >= 5
+
+    def test_invalid_dilation(self):
+        flag = False
+        try:
+            Clock(dilation=0)
+        except ValueError:
+            flag = True
+
+        assert flag
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from src.communication.framing import MessageBuffer, encode_message
+
+
+class TestMessageBuffer(TestCase):
+    def test_clumped_messages_are_split(self):
+        buffer = MessageBuffer()
+        buffer.feed(encode_message("<Move/>") + encode_message("<Discover/>"))
+
+        assert buffer.next_message() == "<Move/>"
+        assert buffer.next_message() == "<Discover/>"
+        assert buffer.next_message() is None
+
+    def test_partial_messages_wait_for_the_rest(self):
+        buffer = MessageBuffer()
+        message = encode_message("<Data playerId=\"1\"/>")
+
+        buffer.feed(message[:5])
+        assert buffer.next_message() is None
+
+        buffer.feed(message[5:] + message[:3])
+        assert buffer.next_message() == "<Data playerId=\"1\"/>"
+        assert buffer.next_message() is None
+
+    def test_keep_alives_are_skipped(self):
+        buffer = MessageBuffer()
+        buffer.feed(encode_message("") + encode_message("<GetGames/>") + encode_message(""))
+
+        assert buffer.next_message() == "<GetGames/>"
+        assert buffer.next_message() is None
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+import socket
+from unittest import TestCase
+
+from src.communication import messages
+from src.communication.framing import MessageBuffer, encode_message
+from src.communication.gamehost import GameHost, game_masters
+
+
+class TestGameHost(TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+
+        self.host = GameHost()
+        self.games = game_masters(self.host, 2)
+        for gm in self.games:
+            assert gm.socket.connect_ex(self.listener.getsockname()) == 0
+        self.server_socket, address = self.listener.accept()
+
+    def tearDown(self):
+        self.host.close()
+        self.server_socket.close()
+        self.listener.close()
+
+    def receive_on_server(self, count: int) -> list:
+        received, result = MessageBuffer(), []
+        while len(result) < count:
+            received.feed(self.server_socket.recv(2048))
+            message = received.next_message()
+            while message is not None:
+                result.append(message)
+                message = received.next_message()
+        return result
+
+    def test_games_share_settings_and_socket(self):
+        first, second = self.games
+        assert first.game_name != second.game_name
+        assert first.settings is second.settings
+
+        second.send(messages.RegisterGame(second.game_name, 2, 2))
+        first.send(messages.RegisterGame(first.game_name, 2, 2))
+
+        received = self.receive_on_server(2)
+        assert second.game_name in received[0] and first.game_name in received[1]
+
+    def test_messages_are_routed_to_their_games(self):
+        first, second = self.games
+        second.send(messages.RegisterGame(second.game_name, 2, 2))
+        first.send(messages.RegisterGame(first.game_name, 2, 2))
+        self.receive_on_server(2)
+
+        # (confirmations come in the order of the registrations)
+        self.server_socket.sendall(encode_message(messages.ConfirmGameRegistration("5")) +
+                                   encode_message(messages.ConfirmGameRegistration("6")) +
+                                   encode_message(messages.JoinGame(first.game_name, "red", "leader", "11")) +
+                                   encode_message(messages.Discover("5", "c094cab7-da7b-457f-89e5-a5c51756035f")) +
+                                   encode_message(messages.player_disconnected("11")))
+
+        assert 'gameId="5"' in second.receive()
+        assert "Discover" in second.receive()
+        assert 'gameId="6"' in first.receive()
+        assert "JoinGame" in first.receive()
+        assert "PlayerDisconnected" in first.receive()
+
+    def test_closed_game_is_forgotten(self):
+        first, second = self.games
+        first.send(messages.RegisterGame(first.game_name, 2, 2))
+        self.server_socket.sendall(encode_message(messages.ConfirmGameRegistration("5")))
+        assert 'gameId="5"' in first.receive()
+
+        first.socket.close()
+
+        assert self.host.route(messages.Discover("5", "c094cab7-da7b-457f-89e5-a5c51756035f")) is None
+        assert self.host.route(messages.JoinGame(first.game_name, "red", "leader", "11")) is None
+        assert self.host.route(messages.JoinGame(second.game_name, "red", "leader", "11")) is second.socket
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+import xml.etree.ElementTree as ET
+from time import sleep
+from unittest import TestCase
+
+from src.communication.clock import Clock
+from src.communication.gamemaster import DiscoverWindow, GameMaster, direction_towards, strip_known_data
+from src.communication.info import GameInfo, PlayerInfo, PieceInfo
+from src.communication.testing import RecordingSocket
+
+
+class RecordingClock(Clock):
+    """a Clock which doesn't really wait, only remembers how long it was asked to."""
+
+    def __init__(self):
+        super().__init__()
+        self.sleeps = []  # milliseconds
+
+    def sleep_ms(self, milliseconds):
+        self.sleeps.append(milliseconds)
+
+
+def game_master(clock: Clock = None, **kwargs) -> GameMaster:
+    """
+    :returns: a GameMaster with a game set up for one red and one blue player, talking to a RecordingSocket.
+    """
+    gm = GameMaster(clock=clock if clock is not None else Clock(1000), **kwargs)
+    gm.socket.close()
+    gm.socket = RecordingSocket()
+    gm.info.id = "0"  # (as if the server had confirmed the registration)
+    gm.add_player("1", "member", "red", "guid-1")
+    gm.add_player("2", "member", "blue", "guid-2")
+    gm.set_up_game()
+    return gm
+
+
+def place(gm: GameMaster, player_info: PlayerInfo, location: tuple):
+    """
+    put the player on the given field of the GM's board.
+    """
+    fields = dict(gm.info.task_fields)
+    fields.update(gm.info.goal_fields)
+    fields[player_info.location].player_id = "-1"
+    fields[location].player_id = player_info.id
+    player_info.location = location
+
+
+class InterleavingDict(dict):
+    """
+    attribute dict of a field, calling back right after the field's version changes.
+    """
+
+    def __init__(self, attributes: dict, on_version):
+        super().__init__(attributes)
+        self.on_version = on_version
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key == "version":
+            self.on_version()
+
+
+class TestDiscoverWindow(TestCase):
+    def setUp(self):
+        self.info = GameInfo(board_width=3, task_height=3, goals_height=1)
+        self.info.initialize_fields()
+        self.location = (1, 3)
+        fields = list(self.info.get_neighbours(self.location, True).values())
+        fields.append(self.info.task_fields[self.location])
+        self.window = DiscoverWindow(fields)
+
+    def test_window_is_reused_until_something_changes(self):
+        assert self.window.refresh() is True
+        assert self.window.refresh() is False
+
+        self.info.task_fields[1, 2].piece_id = "4"
+
+        assert self.window.refresh() is True
+        assert ((1, 2), "-1", -1, "4") in self.window.task_fields
+
+    def test_changes_outside_the_window_are_ignored(self):
+        self.window.refresh()
+
+        self.info.goal_fields[1, 0].player_id = "2"
+
+        assert self.window.refresh() is False
+
+    def test_write_interleaved_with_refresh(self):
+        self.window.refresh()
+        field = self.info.task_fields[1, 2]
+        # the window refreshes (as a handler on another thread would) right when the field's version is bumped:
+        object.__setattr__(field, "__dict__", InterleavingDict(field.__dict__, self.window.refresh))
+
+        field.piece_id = "4"
+
+        self.window.refresh()
+        assert ((1, 2), "-1", -1, "4") in self.window.task_fields
+
+    def test_window_covers_goal_fields(self):
+        self.window.refresh()
+
+        assert len(self.window.task_fields) == 6
+        assert len(self.window.goal_fields) == 3
+
+
+class TestDeltaData(TestCase):
+    def setUp(self):
+        self.info = GameInfo(board_width=3, task_height=3, goals_height=1)
+        self.info.initialize_fields()
+        self.player = PlayerInfo("1", "red")
+
+    def strip(self, **data):
+        strip_known_data(self.player, data)
+        return data
+
+    def test_unchanged_fields_are_not_sent_again(self):
+        fields = {(1, 1): self.info.task_fields[1, 1], (1, 2): self.info.task_fields[1, 2]}
+
+        assert len(self.strip(task_fields=dict(fields))["task_fields"]) == 2
+        assert self.strip(task_fields=dict(fields))["task_fields"] is None
+
+        self.info.task_fields[1, 2].distance_to_piece = 3
+        assert list(self.strip(task_fields=dict(fields))["task_fields"].keys()) == [(1, 2)]
+
+    def test_pieces_are_tracked_separately(self):
+        piece = PieceInfo("5", location=(1, 1))
+
+        assert self.strip(pieces={"5": piece})["pieces"] == {"5": piece}
+        assert self.strip(pieces={"5": piece})["pieces"] is None
+
+        piece.type = "sham"
+        assert self.strip(pieces={"5": piece})["pieces"] == {"5": piece}
+
+
+class TestDiscoverTick(TestCase):
+    def setUp(self):
+        self.gm = game_master(discover_tick=10)
+        self.red, self.blue = self.gm.find_player_by_id("1"), self.gm.find_player_by_id("2")
+
+    def test_only_due_discovers_are_answered(self):
+        self.gm.queue_discover(self.red, request_id=7)
+        first_due = self.gm.pending_discovers[0][0]
+        sleep(0.001)
+        self.gm.queue_discover(self.blue, request_id=8)
+
+        assert self.gm.resolve_due_discovers(first_due) == 1
+        sent = self.gm.socket.messages()
+        assert len(sent) == 1
+        assert ET.fromstring(sent[0]).attrib["playerId"] == "1"
+        assert len(self.gm.pending_discovers) == 1
+
+        assert self.gm.resolve_due_discovers(self.gm.pending_discovers[0][0]) == 1
+        assert ET.fromstring(self.gm.socket.messages()[0]).attrib["playerId"] == "2"
+        assert self.gm.resolve_due_discovers(self.gm.clock.time() + 1) == 0
+
+    def test_one_response_per_request(self):
+        for request_id in (3, 4, 5):
+            self.gm.queue_discover(self.red, request_id=request_id)
+        self.gm.queue_discover(self.blue, request_id=6)
+
+        assert self.gm.resolve_due_discovers(self.gm.clock.time() + 1) == 4
+
+        responses = [ET.fromstring(message).attrib for message in self.gm.socket.messages()]
+        assert [(response["playerId"], response["requestId"]) for response in responses] == [
+            ("1", "3"), ("1", "4"), ("1", "5"), ("2", "6")]
+        assert all(response["gameId"] == "0" for response in responses)
+        assert self.gm.pending_discovers == []
+
+    def test_discover_sees_where_the_player_is_when_answered(self):
+        gm = game_master(clock=RecordingClock(), discover_tick=10)
+        red = gm.find_player_by_id("1")
+        row = gm.info.goals_height + 1
+        place(gm, red, (1, row))
+
+        gm.queue_discover(red, request_id=1)
+        gm.handle_move_message("right", red, request_id=2)  # (e.g. a pipelined player's move, sent before it)
+        gm.socket.messages()
+        gm.resolve_due_discovers(gm.clock.time() + 1)
+
+        # like an unbatched Discover (whose handler reads the location after the delay), it shows the new window:
+        discovered = ET.fromstring(gm.socket.messages()[0])
+        task_fields = set((int(element.get("x")), int(element.get("y"))) for element in discovered.iter()
+                          if element.tag.endswith("}TaskField"))
+        assert (3, row) in task_fields and (0, row) not in task_fields
+
+
+class TestMovePath(TestCase):
+    def setUp(self):
+        self.clock = RecordingClock()
+        self.gm = game_master(clock=self.clock)
+        self.red, self.blue = self.gm.find_player_by_id("1"), self.gm.find_player_by_id("2")
+        self.row = self.gm.info.goals_height + 1  # a row of the task area
+        place(self.gm, self.red, (0, self.row))
+        place(self.gm, self.blue, (3, self.row))
+        self.gm.socket.messages()
+
+    def data(self) -> tuple:
+        """
+        :returns: a tuple: (player location, set of locations of the task fields) of the only Data message sent.
+        """
+        sent = self.gm.socket.messages()
+        assert len(sent) == 1
+        root = ET.fromstring(sent[0])
+        location = [element for element in root.iter() if element.tag.endswith("PlayerLocation")][0]
+        task_fields = set((int(element.get("x")), int(element.get("y"))) for element in root.iter()
+                          if element.tag.endswith("}TaskField"))
+        return (int(location.get("x")), int(location.get("y"))), task_fields
+
+    def test_path_stops_at_an_occupied_field(self):
+        self.gm.handle_move_path_message(["right"] * 5, None, self.red)
+
+        assert self.red.location == (2, self.row)
+        assert self.data() == ((2, self.row), {(1, self.row), (2, self.row)})
+
+    def test_path_towards_a_target(self):
+        self.gm.handle_move_path_message(None, (1, self.row + 2), self.red, request_id=4)
+
+        assert self.red.location == (1, self.row + 2)
+        location, task_fields = self.data()
+        assert location == (1, self.row + 2)
+        assert task_fields == {(1, self.row), (1, self.row + 1), (1, self.row + 2)}
+
+    def test_delay_is_charged_per_step(self):
+        self.gm.handle_move_path_message(["up", "up", "right"], None, self.red)
+
+        assert self.clock.sleeps == [self.gm.move_delay] * 3
+        assert self.gm.latency.histograms["move_path", "compute"].count == 1
+        assert self.data()[1] == {(0, self.row + 1), (0, self.row + 2), (1, self.row + 2)}
+
+
+class TestDirectionTowards(TestCase):
+    def test_horizontal_moves_come_first(self):
+        assert direction_towards((1, 1), (3, 0)) == "right"
+        assert direction_towards((3, 1), (3, 0)) == "down"
+        assert direction_towards((3, 0), (3, 0)) is None
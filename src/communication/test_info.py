@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from src.communication.info import PieceStore, PieceType, TaskFieldInfo, GameInfo, GoalFieldType, PieceInfo, \
+    GoalFieldInfo, GoalFieldView, Allegiance, KnowledgeStore
+
+
+class TestPieceStore(TestCase):
+    def setUp(self):
+        self.store = PieceStore(max_live_pieces=3)
+
+    def test_lifecycle(self):
+        piece = self.store.new_piece(PieceType.NORMAL.value, location=(1, 2))
+        assert self.store.live_count == 1
+
+        self.store.pick_up(piece.id, "7")
+        assert self.store.live_count == 0
+        assert self.store.carried_count == 1
+        assert piece.location is None
+
+        self.store.put_down(piece.id, (2, 2))
+        assert self.store.live_count == 1
+        assert self.store.carried_count == 0
+
+        self.store.consume(piece.id)
+        assert len(self.store) == 0
+        assert self.store.consumed_count == 1
+
+    def test_cap_on_live_pieces(self):
+        for i in range(3):
+            assert self.store.new_piece(location=(i, 1)) is not None
+
+        assert self.store.new_piece(location=(4, 1)) is None
+
+    def test_reclaimed_slot_gets_new_generation(self):
+        old_piece = self.store.new_piece(location=(1, 1))
+        self.store.consume(old_piece.id)
+
+        new_piece = self.store.new_piece(location=(1, 1))
+
+        assert PieceStore.slot_of(new_piece.id) == PieceStore.slot_of(old_piece.id)
+        assert new_piece.id != old_piece.id
+        assert self.store.get(old_piece.id) is None
+        assert self.store.consume(old_piece.id) is None
+
+    def test_memory_stays_flat_over_a_long_game(self):
+        for i in range(10000):
+            piece = self.store.new_piece(location=(0, 1))
+            self.store.pick_up(piece.id, "1")
+            self.store.consume(piece.id)
+
+        assert len(self.store) == 0
+        assert len(self.store._generations) == 1
+        assert self.store.consumed_count == 10000
+
+
+class TestFieldVersions(TestCase):
+    def test_version_grows_only_on_changes(self):
+        field = TaskFieldInfo(1, 2)
+        version = field.version
+
+        field.piece_id = "3"
+        assert field.version == version + 1
+
+        field.piece_id = "3"
+        assert field.version == version + 1
+
+        field.timestamp = datetime.now()
+        assert field.version == version + 1
+
+        field.distance_to_piece = 0
+        assert field.version == version + 2
+
+
+class TestKnowledgeExchange(TestCase):
+    def setUp(self):
+        self.info = GameInfo(board_width=3, task_height=3, goals_height=1)
+        self.info.initialize_fields()
+        self.now = datetime.now() + timedelta(seconds=1)
+
+    def test_only_new_knowledge_is_collected(self):
+        self.info.task_fields[1, 1].timestamp = self.now
+        self.info.goal_fields[0, 4].timestamp = (self.now + timedelta(seconds=1)).isoformat()
+
+        task_fields, goal_fields, pieces, newest = self.info.knowledge_since()
+        assert list(task_fields.keys()) == [(1, 1)]
+        assert list(goal_fields.keys()) == [(0, 4)]
+        assert newest == self.now + timedelta(seconds=1)
+
+        task_fields, goal_fields, pieces, newest = self.info.knowledge_since(newest)
+        assert len(task_fields) + len(goal_fields) + len(pieces) == 0
+
+    def test_collected_knowledge_is_bounded(self):
+        for i, field in enumerate(self.info.task_fields.values()):
+            field.timestamp = self.now + timedelta(seconds=i)
+
+        task_fields, goal_fields, pieces, newest = self.info.knowledge_since(limit=2)
+
+        assert len(task_fields) == 2
+        assert newest == self.now + timedelta(seconds=len(self.info.task_fields) - 1)
+
+    def test_merge_keeps_newer_knowledge(self):
+        self.info.task_fields[1, 1].timestamp = self.now
+        self.info.task_fields[1, 1].distance_to_piece = 2
+
+        older = TaskFieldInfo(1, 1, self.now - timedelta(seconds=1), distance_to_piece=5)
+        newer = TaskFieldInfo(1, 2, self.now, distance_to_piece=0, piece_id="3")
+        updated = self.info.merge_knowledge(task_fields={(1, 1): older, (1, 2): newer})
+
+        assert updated == 1
+        assert self.info.task_fields[1, 1].distance_to_piece == 2
+        assert self.info.task_fields[1, 2].piece_id == "3"
+
+    def test_merge_never_forgets_known_types(self):
+        self.info.goal_fields[0, 4].type = GoalFieldType.GOAL.value
+        self.info.pieces["1"] = PieceInfo("1", PieceType.SHAM.value, timestamp=self.now)
+
+        goal_field = self.info.goal_fields[0, 4]
+        incoming_goal = type(goal_field)(0, 4, goal_field.allegiance, timestamp=self.now)
+        incoming_piece = PieceInfo("1", PieceType.UNKNOWN.value, timestamp=self.now + timedelta(seconds=1))
+        self.info.merge_knowledge(goal_fields={(0, 4): incoming_goal}, pieces={"1": incoming_piece})
+
+        assert self.info.goal_fields[0, 4].type == GoalFieldType.GOAL.value
+        assert self.info.pieces["1"].type == PieceType.SHAM.value
+
+
+class TestGoalFieldView(TestCase):
+    def test_view_overlays_type(self):
+        field = GoalFieldInfo(1, 4, "red", "3", type=GoalFieldType.GOAL.value)
+        view = GoalFieldView(field, GoalFieldType.UNKNOWN.value)
+
+        assert view.type == GoalFieldType.UNKNOWN.value
+        assert view.location == (1, 4)
+        assert view.player_id == "3"
+        assert view.allegiance == "red"
+
+        field.player_id = "-1"
+        assert not view.is_occupied
+
+    def test_view_is_read_only(self):
+        view = GoalFieldView(GoalFieldInfo(1, 4), GoalFieldType.UNKNOWN.value)
+
+        flag = False
+        try:
+            view.type = GoalFieldType.GOAL.value
+        except AttributeError:
+            flag = True
+
+        assert flag
+
+
+class TestGoalIndex(TestCase):
+    def setUp(self):
+        # 4 wide, goal areas 2 high: blue goals are y=0..1, task fields y=2..4, red goals y=5..6
+        self.info = GameInfo(board_width=4, task_height=3, goals_height=2)
+        self.info.initialize_fields()
+
+    def test_all_goals_start_unknown(self):
+        assert len(self.info.unknown_goals[Allegiance.BLUE.value]) == 8
+        assert (0, 0) in self.info.unknown_goals[Allegiance.BLUE.value]
+        assert (0, 6) in self.info.unknown_goals[Allegiance.RED.value]
+
+    def test_nearest(self):
+        index = self.info.unknown_goals[Allegiance.BLUE.value]
+
+        assert index.nearest((3, 4)) == (3, 1)
+        assert index.nearest((3, 4), accept=lambda location: location[0] < 2) == (1, 1)
+
+    def test_discovered_goals_are_removed(self):
+        self.info.goal_fields[3, 1].type = GoalFieldType.NON_GOAL.value
+        self.info.update_goal_index((3, 1))
+
+        assert (3, 1) not in self.info.unknown_goals[Allegiance.BLUE.value]
+        assert self.info.unknown_goals[Allegiance.BLUE.value].nearest((3, 4)) in [(2, 1), (3, 0)]
+
+    def test_merged_knowledge_updates_the_index(self):
+        other = GameInfo(board_width=4, task_height=3, goals_height=2)
+        other.initialize_fields()
+        other.goal_fields[0, 0].type = GoalFieldType.GOAL.value
+        other.goal_fields[0, 0].timestamp = datetime.now() + timedelta(seconds=1)
+
+        self.info.merge_knowledge(goal_fields={(0, 0): other.goal_fields[0, 0]})
+
+        assert (0, 0) not in self.info.unknown_goals[Allegiance.BLUE.value]
+
+    def test_empty_index(self):
+        index = self.info.unknown_goals[Allegiance.RED.value]
+        for location in list(self.info.goal_fields.keys()):
+            index.discard(location)
+
+        assert len(index) == 0
+        assert index.nearest((0, 0)) is None
+
+
+class TestKnowledgeStore(TestCase):
+    def setUp(self):
+        self.info = GameInfo(board_width=5, task_height=4, goals_height=2)
+        self.info.initialize_fields()
+
+    def put_piece(self, piece_id, location):
+        self.info.pieces[piece_id] = PieceInfo(piece_id)
+        self.info.task_fields[location].piece_id = piece_id
+        self.info.update_piece_index(piece_id, location)
+
+    def test_piece_locations(self):
+        self.put_piece("1", (1, 3))
+
+        assert self.info.knowledge.piece_locations == {(1, 3): "1"}
+        assert self.info.pieces["1"].location == (1, 3)
+
+        self.info.task_fields[1, 3].piece_id = "-1"
+        self.info.update_piece_index(location=(1, 3))
+
+        assert self.info.knowledge.piece_locations == {}
+
+    def test_held_piece(self):
+        self.put_piece("1", (1, 3))
+        assert self.info.knowledge.held_by("7") == "-1"
+
+        self.info.pieces["1"].player_id = "7"
+        self.info.update_piece_index("1")
+
+        assert self.info.knowledge.held_by("7") == "1"
+        assert self.info.knowledge.piece_locations == {}
+
+        self.info.pieces["1"].player_id = "-1"
+        self.info.update_piece_index("1")
+
+        assert self.info.knowledge.held_by("7") == "-1"
+
+    def test_nearest_piece_is_cached_until_pieces_change(self):
+        self.put_piece("1", (0, 2))
+        self.put_piece("2", (4, 5))
+
+        assert self.info.knowledge.nearest_piece((1, 2)) == (0, 2)
+        assert self.info.knowledge._nearest == {(1, 2): (0, 2)}
+
+        self.info.task_fields[0, 2].piece_id = "-1"
+        self.info.update_piece_index(location=(0, 2))
+
+        assert self.info.knowledge.nearest_piece((1, 2)) == (4, 5)
+
+    def test_merged_knowledge_updates_the_index(self):
+        field = TaskFieldInfo(2, 4, datetime.now() + timedelta(seconds=1), 0, piece_id="3")
+        piece = PieceInfo("3", player_id="-1", timestamp=datetime.now() + timedelta(seconds=1))
+
+        self.info.merge_knowledge({(2, 4): field}, pieces={"3": piece})
+
+        assert self.info.knowledge.nearest_piece((0, 0)) == (2, 4)
+        assert KnowledgeStore().nearest_piece((0, 0)) is None
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+import os
+import tempfile
+import time
+from threading import Thread
+from unittest import TestCase
+
+from src.communication.client import Client
+from src.communication.keepalive import FALLBACK_KEEP_ALIVE_INTERVAL, IdleTracker, idle_timeout, \
+    keep_alive_interval, read_keep_alive_interval
+from src.communication.server import CommunicationServer
+from src.communication.transport import LOOPBACK, address, new_socket
+
+
+class StoppedClock:
+    """a clock which only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+class TestKeepAliveInterval(TestCase):
+    def test_interval_comes_from_the_settings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "GameMasterSettings.xml")
+            with open(path, "w") as settings:
+                settings.write('<GameMasterSettings KeepAliveInterval="120"/>')
+
+            assert read_keep_alive_interval(path) == 120
+            assert read_keep_alive_interval(os.path.join(directory, "missing.xml")) == FALLBACK_KEEP_ALIVE_INTERVAL
+
+    def test_server_and_clients_agree(self):
+        client = Client()
+        client.socket.close()
+        server = CommunicationServer(False, "keepalive", 2, transport=LOOPBACK)
+        server.shutdown()
+        assert client.keep_alive_interval == keep_alive_interval()
+        assert server.idle_clients.timeout == idle_timeout(keep_alive_interval())
+        assert server.idle_clients.timeout > keep_alive_interval() / 1000
+
+
+class TestIdleTracker(TestCase):
+    def test_silent_client_expires(self):
+        clock = StoppedClock()
+        tracker = IdleTracker(2, clock)
+        tracker.touch("1")
+
+        clock.now = 1.5
+        assert tracker.expired() == []
+
+        clock.now = 2.0
+        assert tracker.expired() == ["1"]
+        assert tracker.expired() == []  # reported only once
+
+    def test_touch_postpones_the_deadline(self):
+        clock = StoppedClock()
+        tracker = IdleTracker(2, clock)
+        tracker.touch("1")
+        tracker.touch("2")
+
+        clock.now = 1.5
+        tracker.touch("1")
+
+        clock.now = 2.5
+        assert tracker.expired() == ["2"]
+        assert tracker.time_to_next_deadline() == 1.0
+
+        clock.now = 3.5
+        assert tracker.expired() == ["1"]
+
+    def test_forgotten_client_doesnt_expire(self):
+        clock = StoppedClock()
+        tracker = IdleTracker(2, clock)
+        tracker.touch("1")
+        tracker.forget("1")
+
+        clock.now = 5
+        assert tracker.expired() == []
+
+    def test_client_tracked_again_has_one_deadline(self):
+        clock = StoppedClock()
+        tracker = IdleTracker(2, clock)
+        tracker.touch("1")
+        tracker.forget("1")
+        clock.now = 1
+        tracker.touch("1")
+
+        clock.now = 2.5
+        assert tracker.expired() == []  # the deadline from before he was forgotten doesn't count
+        assert len(tracker.deadlines) == 1
+
+        clock.now = 3
+        assert tracker.expired() == ["1"]
+        assert tracker.deadlines == []
+
+
+class TestEviction(TestCase):
+    def setUp(self):
+        self.server = CommunicationServer(False, "keepalive", 1, transport=LOOPBACK, idle_timeout=0.2)
+        self.server.socket.listen()
+        Thread(target=self.server.accept_clients, daemon=True).start()
+        Thread(target=self.server.evict_idle_clients, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def wait_for_clients(self, count, seconds=2.0):
+        deadline = time.monotonic() + seconds
+        while len(self.server.clients) != count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.server.clients)
+
+    def test_silent_client_is_evicted(self):
+        silent = new_socket(LOOPBACK)
+        assert silent.connect_ex(address(LOOPBACK, "keepalive", 1)) == 0
+        assert self.wait_for_clients(1) == 1
+
+        assert self.wait_for_clients(0) == 0
+        assert silent.recv(16) == b""  # the server closed the connection
+
+    def test_client_sending_keep_alives_stays(self):
+        client = Client(transport=LOOPBACK)
+        client.keep_alive_interval = 50
+        assert client.connect("keepalive", 1)
+        assert self.wait_for_clients(1) == 1
+
+        time.sleep(0.6)
+        assert len(self.server.clients) == 1
+        client.connected = False
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from src.communication.matchmaking import MatchmakingQueue
+
+RED, BLUE = "red", "blue"
+
+
+class TestMatchmakingQueue(TestCase):
+    def setUp(self):
+        self.queue = MatchmakingQueue()
+
+    def add_game(self, game_id, size=2):
+        self.queue.add_game(game_id, {RED: size, BLUE: size})
+
+    def test_fullest_game_is_filled_first(self):
+        self.add_game("0")
+        self.add_game("1")
+        self.queue.take("p1", "1", RED)
+
+        assert self.queue.find(RED) == ("1", RED)
+        self.queue.take("p2", "1", RED)
+        assert self.queue.find(RED) == ("0", RED)
+
+    def test_other_team_when_preferred_is_full(self):
+        self.add_game("0", size=1)
+        self.queue.take("p1", "0", RED)
+
+        assert self.queue.find(RED) == ("0", BLUE)
+        self.queue.take("p2", "0", BLUE)
+        assert self.queue.find(RED) is None
+
+    def test_team_size_criterion(self):
+        self.add_game("0", size=1)
+        self.add_game("1", size=3)
+
+        assert self.queue.find(BLUE, 3) == ("1", BLUE)
+        assert self.queue.find(BLUE, "1") == ("0", BLUE)
+        assert self.queue.find(BLUE, 2) is None
+
+    def test_released_place_is_free_again(self):
+        self.add_game("0", size=1)
+        self.queue.take("p1", "0", RED)
+        self.queue.take("p2", "0", BLUE)
+
+        assert self.queue.release("p1")
+        assert not self.queue.release("p1")
+        assert self.queue.find(BLUE) == ("0", RED)
+
+    def test_moving_to_the_other_team(self):
+        self.add_game("0", size=1)
+        self.queue.take("p1", "0", RED)
+        self.queue.take("p1", "0", BLUE)
+
+        assert self.queue.free["0"] == {RED: 1, BLUE: 0}
+
+    def test_started_game_is_forgotten(self):
+        self.add_game("0")
+        self.queue.take("p1", "0", RED)
+        self.queue.remove_game("0")
+
+        assert self.queue.find(RED) is None
+        assert self.queue.seats == {}
+        assert not self.queue.release("p1")
+
+    def test_waiting_players_are_seated_in_order(self):
+        self.queue.enqueue("p1", RED, "member")
+        self.queue.enqueue("gone", RED, "member")
+        self.queue.enqueue("p2", RED, "member", team_size=5)
+        self.queue.enqueue("p3", BLUE, "leader")
+        assert self.queue.assign() == []
+
+        self.add_game("0", size=1)
+
+        assert self.queue.assign(lambda player_id: player_id != "gone") == [("p1", "0", RED, "member"),
+                                                                            ("p3", "0", BLUE, "leader")]
+        assert [player[0] for player in self.queue.waiting] == ["p2"]
+
+    def test_buckets_stay_small(self):
+        for i in range(1000):
+            self.add_game(str(i), size=2)
+        for i in range(0, 1000, 2):
+            self.queue.take("p" + str(i), str(i), RED)
+
+        # the games are grouped by their free places, not looked at one by one:
+        assert sorted(self.queue.buckets[RED][2].keys()) == [1, 2]
+        assert self.queue.find(RED) == ("0", RED)
@@ -44,3 +44,17 @@ class TestClass(TestCase):
         sample_xml = open("../messages/KnowledgeExchangeResponse.xml").read()
 
         assert True
+
+    def test_move_path_too_long(self):
+        # a path longer than MAX_PATH_LENGTH doesn't fit with the schema.
+        player_guid = "c094cab7-da7b-457f-89e5-a5c51756035f"
+
+        MovePath(1, player_guid, ['up'] * MAX_PATH_LENGTH)
+
+        flag = False
+        try:
+            MovePath(1, player_guid, ['up'] * (MAX_PATH_LENGTH + 1))
+        except DocumentInvalid:
+            flag = True
+
+        assert flag
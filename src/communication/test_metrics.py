@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from src.communication.metrics import Histogram, LatencyRecorder
+
+
+class TestMetrics(TestCase):
+    def test_histogram_statistics(self):
+        histogram = Histogram()
+        for i in range(1, 101):
+            histogram.add(i / 1000)
+
+        assert histogram.count == 100
+        assert abs(histogram.mean - 0.0505) < 0.0001
+        assert histogram.max == 0.1
+        # percentiles are bucket upper bounds, so they may overshoot by at most a factor of 2:
+        assert 0.05 <= histogram.percentile(50) <= 0.1
+        assert histogram.percentile(100) == 0.1
+
+    def test_empty_histogram(self):
+        histogram = Histogram()
+
+        assert histogram.mean == 0.0
+        assert histogram.percentile(99) == 0.0
+
+    def test_recorder_measures_phases(self):
+        recorder = LatencyRecorder()
+        with recorder.measure("move", "compute"):
+            pass
+        recorder.record("move", "delay", 0.1)
+
+        assert recorder.histograms["move", "compute"].count == 1
+        assert recorder.histograms["move", "delay"].max == 0.1
+        assert "move/delay" in recorder.dump()
+
+        recorder.reset()
+        assert recorder.dump() == "No latencies recorded."
+
+    def test_counters(self):
+        recorder = LatencyRecorder()
+        recorder.increment("discover", "window_reused")
+        recorder.increment("discover", "window_reused")
+
+        assert recorder.counters["discover", "window_reused"] == 2
+        assert "discover/window_reused: 2" in recorder.dump()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+import socket
+from threading import Lock, Thread
+from time import sleep
+from unittest import TestCase
+
+from src.communication import messages
+from src.communication.framing import encode_message
+from src.communication.multiplex import FrameReader, MultiplexedConnection, PREAMBLE, ServerChannel, encode_frame, \
+    starts_with_preamble
+from src.communication.server import CommunicationServer
+from src.communication.transport import LOOPBACK, UNIX, address
+
+
+class TestFrames(TestCase):
+    def test_frames_are_split(self):
+        left, right = socket.socketpair()
+        left.sendall(encode_frame(3, b"<Discover/>") + encode_frame(12, b"<Move/>") + encode_frame(3, b""))
+
+        reader = FrameReader(right, buffer_size=5)  # small buffer, so frames arrive in pieces
+
+        assert reader.next_frame() == (3, b"<Discover/>")
+        assert reader.next_frame() == (12, b"<Move/>")
+        assert reader.next_frame() == (3, b"")
+
+        left.close()
+        assert reader.next_frame() is None
+        right.close()
+
+
+class TestPreamble(TestCase):
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def send_later(self, data: bytes):
+        def send():
+            sleep(0.05)
+            self.left.sendall(data)
+
+        Thread(target=send).start()
+
+    def test_preamble_in_pieces(self):
+        self.left.sendall(PREAMBLE[:3])
+        self.send_later(PREAMBLE[3:])
+
+        assert starts_with_preamble(self.right)
+        assert self.right.recv(len(PREAMBLE)) == PREAMBLE  # (nothing was read yet)
+
+    def test_ordinary_client(self):
+        self.left.sendall(b"<Ge")
+        self.send_later(b"tGames/>")
+
+        assert not starts_with_preamble(self.right)
+
+    def test_closed_before_the_preamble(self):
+        self.left.sendall(PREAMBLE[:3])
+        self.left.close()
+
+        assert not starts_with_preamble(self.right)
+
+
+class TestMultiplexedConnection(TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+
+        self.connection = MultiplexedConnection()
+        self.first = self.connection.channel()
+        self.second = self.connection.channel()
+
+        assert self.first.connect_ex(self.listener.getsockname()) == 0
+        assert self.second.connect_ex(self.listener.getsockname()) == 0
+        self.server_socket, address = self.listener.accept()
+
+    def tearDown(self):
+        self.connection.close()
+        self.server_socket.close()
+        self.listener.close()
+
+    def test_one_socket_many_channels(self):
+        self.second.send(b"<GetGames/>")
+        self.first.send(b"<GetGames/>")
+
+        reader = FrameReader(self.server_socket)
+        assert self.server_socket.recv(len(PREAMBLE)) == PREAMBLE
+        assert reader.next_frame() == (1, b"<GetGames/>")
+        assert reader.next_frame() == (0, b"<GetGames/>")
+
+        lock = Lock()
+        ServerChannel(self.server_socket, lock, 1).send(b"<RegisteredGames/>")
+        ServerChannel(self.server_socket, lock, 0).close()
+
+        assert self.second.recv() == b"<RegisteredGames/>"
+        assert self.first.recv() == b""
+        assert self.first.closed
+
+
+class TestMultiplexedServer(TestCase):
+    """
+    channels of one connection talking to a real server, on the transports whose sockets have other names than TCP's.
+    """
+
+    def play(self, transport: str):
+        server = CommunicationServer(False, "multiplexed", 1, transport=transport, idle_timeout=None)
+        server.socket.listen()
+        Thread(target=server.accept_clients, daemon=True).start()
+        connection = MultiplexedConnection(transport)
+        try:
+            channels = [connection.channel(), connection.channel()]
+            for channel in channels:
+                assert channel.connect_ex(address(transport, "multiplexed", 1)) == 0
+                channel.send(encode_message(messages.GetGames()))
+
+            for channel in channels:
+                assert b"RegisteredGames" in channel.recv()
+                assert "channel " + str(channel.index) in channel.getsockname()
+        finally:
+            connection.close()
+            server.shutdown()
+
+    def test_unix(self):
+        self.play(UNIX)
+
+    def test_loopback(self):
+        self.play(LOOPBACK)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from src.communication.info import GameInfo, Allegiance, Direction
+from src.communication.pathfinding import PathFinder, directions_along
+
+
+class TestPathFinder(TestCase):
+    def setUp(self):
+        # 5 wide, goal areas 2 high, task area 4 high: blue goals are y=0..1, task fields y=2..5, red goals y=6..7
+        self.info = GameInfo(board_width=5, task_height=4, goals_height=2)
+        self.info.initialize_fields()
+        self.finder = PathFinder(self.info, Allegiance.BLUE.value, player_id="1")
+
+    def test_straight_path(self):
+        path = self.finder.path_to((2, 5), [(2, 1)])
+
+        assert path == [(2, 4), (2, 3), (2, 2), (2, 1)]
+        assert directions_along((2, 5), path) == [Direction.DOWN.value] * 4
+
+    def test_already_there(self):
+        assert self.finder.path_to((2, 1), [(2, 1)]) == []
+
+    def test_occupied_fields_are_avoided(self):
+        self.info.task_fields[2, 3].player_id = "2"
+
+        path = self.finder.path_to((2, 4), [(2, 2)])
+
+        assert (2, 3) not in path
+        assert len(path) == 4
+
+    def test_enemy_goal_area_is_avoided(self):
+        # a wall across the task area: the way around leads either through the red or through the blue goal area.
+        for y in range(2, 6):
+            self.info.task_fields[2, y].player_id = "2"
+
+        path = self.finder.path_to((0, 5), [(4, 5)])
+
+        assert path[-1] == (4, 5)
+        assert all(not self.info.is_goal_field(location) or location[1] < 2 for location in path)
+
+    def test_nearest_target_is_chosen(self):
+        path = self.finder.path_to((0, 3), [(4, 1), (0, 1)])
+
+        assert path[-1] == (0, 1)
+
+    def test_path_is_reused(self):
+        self.finder.path_to((2, 5), [(2, 1)])
+        path = self.finder.path_to((2, 4), [(2, 1)])
+
+        assert path == [(2, 3), (2, 2), (2, 1)]
+        assert self.finder.searches == 1
+
+    def test_irrelevant_change_doesnt_replan(self):
+        self.finder.path_to((2, 5), [(2, 1)])
+        self.info.task_fields[2, 3].distance_to_piece = 2
+
+        self.finder.path_to((2, 5), [(2, 1)])
+
+        assert self.finder.searches == 1
+
+    def test_blocked_path_is_replanned(self):
+        self.finder.path_to((2, 5), [(2, 1)])
+        self.info.task_fields[2, 3].player_id = "2"
+
+        path = self.finder.path_to((2, 5), [(2, 1)])
+
+        assert (2, 3) not in path
+        assert self.finder.searches == 2
@@ -2,9 +2,14 @@
 import socket
 import threading
 import time
+from datetime import datetime
 from unittest import TestCase
 
 from communication import client
+from src.communication import messages
+from src.communication.info import PieceInfo, PieceType
+from src.communication.player import Player
+from src.communication.strategy import Decision
 
 
 class TestPlayer(TestCase):
@@ -52,3 +57,107 @@ class TestPlayer(TestCase):
         connection_status = self.mock_player.connect()
 
         assert connection_status is False
+
+
+class MockPlayer(Player):
+    def __init__(self, player_id):
+        super().__init__(int(player_id))
+        self.id = player_id
+        self.sent = []
+        self.game_info.board_width, self.game_info.task_height, self.game_info.goals_height = 3, 3, 1
+        self.game_info.initialize_fields()
+
+    def send(self, message: str):
+        self.sent.append(message)
+
+
+class TestKnowledgeExchange(TestCase):
+    def setUp(self):
+        self.requester = MockPlayer("1")
+        self.other = MockPlayer("2")
+
+        # the other player has discovered something:
+        field = self.other.game_info.task_fields[1, 2]
+        field.distance_to_piece = 1
+        self.discovered = messages.Data("2", False, task_fields={(1, 2): field})
+
+    def test_request_is_accepted_and_answered(self):
+        self.other.handle_data(self.discovered)
+
+        assert self.other.handle_knowledge_exchange(messages.KnowledgeExchangeRequest("2", "1"))
+        assert "AcceptExchangeRequest" in self.other.sent[0]
+        assert "senderPlayerId" in self.other.sent[1]
+
+        self.requester.pending_exchange = "2"
+        assert not self.requester.handle_knowledge_exchange(self.other.sent[1])
+        self.requester.handle_data(self.other.sent[1])
+        assert self.requester.game_info.task_fields[1, 2].timestamp == self.other.game_info.task_fields[1, 2].timestamp
+
+    def test_knowledge_is_shared_only_once(self):
+        self.other.handle_data(self.discovered)
+
+        self.other.share_knowledge("1")
+        self.other.share_knowledge("1")
+
+        assert "TaskField" in self.other.sent[0]
+        assert "TaskField" not in self.other.sent[1]
+
+    def test_unexpected_data_from_other_player_is_merged(self):
+        self.other.handle_data(self.discovered)
+        self.other.share_knowledge("1")
+
+        # the requester isn't waiting for this, so it shouldn't be treated as a response:
+        assert self.requester.handle_knowledge_exchange(self.other.sent[0])
+        assert self.requester.game_info.task_fields[1, 2].timestamp == self.other.game_info.task_fields[1, 2].timestamp
+
+
+class TestKnowledge(TestCase):
+    def setUp(self):
+        self.player = MockPlayer("1")
+        self.player.start_playing()
+
+    def test_pieces_are_updated_in_place(self):
+        field = self.player.game_info.task_fields[1, 2]
+        field.piece_id, field.distance_to_piece = "5", 0
+        self.player.handle_data(messages.Data("1", False, task_fields={(1, 2): field},
+                                              pieces={"5": PieceInfo("5", PieceType.UNKNOWN.value)}))
+        piece = self.player.game_info.pieces["5"]
+
+        assert isinstance(piece.timestamp, datetime)
+        assert piece.location == (1, 2)
+        assert self.player.game_info.knowledge.nearest_piece((1, 3)) == (1, 2)
+
+        self.player.handle_response(messages.Data("1", False, pieces={"5": PieceInfo("5", player_id="1")}))
+
+        assert self.player.game_info.pieces["5"] is piece
+        assert self.player.strategy.have_piece == "5"
+
+
+class TestPipelining(TestCase):
+    def setUp(self):
+        self.player = MockPlayer("1")
+        self.player.pipelined = True
+        self.player.Guid = "c094cab7-da7b-457f-89e5-a5c51756035f"
+        self.player.game_info.id = 1
+
+    def test_discover_is_sent_while_moving(self):
+        self.player.send_request(Decision(Decision.MOVE, "up"))
+        self.player.send_request(Decision(Decision.DISCOVER))
+
+        assert 'requestId="1"' in self.player.sent[0]
+        assert 'requestId="2"' in self.player.sent[1]
+        assert not self.player.can_decide()
+
+        # the GM answers the move first:
+        self.player.complete_request(messages.Data("1", False, player_location=(1, 2), request_id=1))
+        assert self.player.can_decide()
+        assert list(self.player.in_flight.values()) == [Decision.DISCOVER]
+
+    def test_responses_out_of_order(self):
+        self.player.send_request(Decision(Decision.MOVE, "up"))
+        self.player.send_request(Decision(Decision.DISCOVER))
+
+        self.player.complete_request(messages.Data("1", False, request_id=2))
+
+        assert list(self.player.in_flight.values()) == [Decision.MOVE]
+        assert not self.player.can_decide()
@@ -5,6 +5,11 @@ from time import sleep
 from unittest import TestCase
 
 from communication import server
+from src.communication import messages
+from src.communication.info import ClientTypeTag
+from src.communication.server import CommunicationServer
+from src.communication.testing import RecordingSocket, add_client
+from src.communication.transport import LOOPBACK
 
 
 # from unittest.self.mock import Magicself.mock,patch,self.mock TODO maybe use this library for testing
@@ -98,3 +103,267 @@ class TestServer(TestCase):
 
     def setUp(self):
         self.mock_server = server.CommunicationServer(True)
+
+
+class BrokenSocket(RecordingSocket):
+    """stands in for the socket of a client who has just gone away."""
+
+    def sendall(self, data: bytes):
+        raise BrokenPipeError
+
+
+class TestGameLifecycle(TestCase):
+    def setUp(self):
+        self.server = CommunicationServer(False, "lifecycle", 1, transport=LOOPBACK, idle_timeout=None)
+        self.gm = add_client(self.server, "0", ClientTypeTag.GAME_MASTER)
+        assert self.server.try_register_game(self.gm, messages.RegisterGame("lifecycle game", 1, 1))
+        self.game_id = self.gm.game_id
+        self.players = [add_client(self.server, str(i), ClientTypeTag.PLAYER) for i in (1, 2)]
+        for player in self.players:
+            player.game_master_id = self.gm.id
+            player.game_id = self.game_id
+            self.server.game_players[self.game_id].add(player.id)
+        self.gm.socket.messages()
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_finished_game_is_forgotten(self):
+        self.server.close_game(self.game_id)
+
+        assert self.game_id not in self.server.games
+        assert self.game_id not in self.server.game_players
+        assert self.gm.game_id == "-1"
+        for player in self.players:
+            assert player.game_master_id == "-1"
+            assert player.game_id == "-1"
+
+    def test_players_and_gm_are_notified(self):
+        self.server.close_game(self.game_id)
+
+        for player in self.players:
+            received = player.socket.messages()
+            assert len(received) == 1
+            assert "Data" in received[0] and 'gameFinished="true"' in received[0]
+        assert self.gm.socket.messages() == [messages.GameFinished(self.game_id)]
+
+    def test_final_data_is_not_sent_twice(self):
+        winner, other = self.players
+        self.server.handle_gm_message(self.gm, messages.Data(winner.id, True))
+
+        assert len(winner.socket.messages()) == 1  # just the GM's own final Data
+        assert len(other.socket.messages()) == 1
+        assert self.game_id not in self.server.games
+        assert self.gm.socket.messages() == [messages.GameFinished(self.game_id)]
+
+    def test_message_to_a_gone_player_is_dropped(self):
+        sender, recipient = self.players
+        self.server.close_game(self.game_id)
+        recipient.socket = BrokenSocket()
+
+        self.server.handle_player_message(sender, messages.KnowledgeExchangeRequest(recipient.id, sender.id))
+
+        assert sender.id in self.server.clients
+
+    def test_messages_after_the_game_are_dropped(self):
+        self.server.close_game(self.game_id)
+        self.gm.socket.messages()
+
+        discover = messages.Discover(self.game_id, "c094cab7-da7b-457f-89e5-a5c51756035f")
+        self.server.handle_player_message(self.players[0], discover)
+
+        assert self.gm.socket.messages() == []
+
+    def test_registry_stays_flat(self):
+        for i in range(1000):
+            gm = add_client(self.server, "gm" + str(i), ClientTypeTag.GAME_MASTER)
+            self.server.try_register_game(gm, messages.RegisterGame("game " + str(i), 1, 1))
+            self.server.close_game(gm.game_id)
+            del self.server.clients[gm.id]
+
+        assert len(self.server.games) == 1  # only the one from setUp
+        assert len(self.server.game_players) == 1
+
+
+class TestFastJoin(TestCase):
+    def setUp(self):
+        self.server = CommunicationServer(False, "fastjoin", 1, transport=LOOPBACK, idle_timeout=None)
+        self.gms = [add_client(self.server, "gm" + str(size), ClientTypeTag.GAME_MASTER) for size in (1, 2)]
+        for size, gm in zip((1, 2), self.gms):
+            assert self.server.try_register_game(gm, messages.RegisterGame("game " + str(size), size, size))
+            gm.socket.messages()
+        self.player = add_client(self.server, "7", ClientTypeTag.PLAYER)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_join_is_forwarded_to_the_gm(self):
+        self.server.handle_player_message(self.player, messages.JoinAnyGame("blue", "member"))
+
+        forwarded = self.gms[0].socket.messages()
+        assert len(forwarded) == 1
+        assert "JoinGame" in forwarded[0] and 'gameName="game 1"' in forwarded[0] and 'playerId="7"' in forwarded[0]
+        assert self.player.game_master_id == self.gms[0].id
+        assert self.player.socket.messages() == []
+
+    def test_criteria_are_matched(self):
+        self.server.handle_player_message(self.player, messages.JoinAnyGame("blue", "member", players_per_team=2))
+
+        assert self.gms[0].socket.messages() == []
+        assert 'gameName="game 2"' in self.gms[1].socket.messages()[0]
+
+    def test_started_games_are_skipped(self):
+        for game_id in list(self.server.games.keys()):
+            self.server.handle_gm_message(self.gms[int(game_id)], messages.GameStarted(game_id))
+
+        self.server.handle_player_message(self.player, messages.JoinAnyGame("blue", "member"))
+
+        assert self.player.socket.messages() == []
+        assert self.player.game_master_id == "-1"
+
+    def test_waiting_player_is_seated_when_a_game_is_registered(self):
+        for game_id in list(self.server.games.keys()):
+            self.server.handle_gm_message(self.gms[int(game_id)], messages.GameStarted(game_id))
+        self.server.handle_player_message(self.player, messages.JoinAnyGame("blue", "member"))
+
+        gm = add_client(self.server, "gm3", ClientTypeTag.GAME_MASTER)
+        self.server.try_register_game(gm, messages.RegisterGame("game 3", 1, 1))
+
+        assert any("JoinGame" in message and 'playerId="7"' in message for message in gm.socket.messages())
+        assert self.player.game_master_id == gm.id
+
+    def test_players_fill_one_game_at_a_time(self):
+        players = [add_client(self.server, str(10 + i), ClientTypeTag.PLAYER) for i in range(4)]
+        for player in players:
+            self.server.handle_player_message(player, messages.JoinAnyGame("red", "member", players_per_team=1))
+        for player in players[2:]:
+            self.server.handle_player_message(player, messages.JoinAnyGame("red", "member", players_per_team=2))
+
+        assert [player.game_master_id for player in players] == [self.gms[0].id] * 2 + [self.gms[1].id] * 2
+
+        # the first requests of the players who got into the second game don't count anymore:
+        gm = add_client(self.server, "gm3", ClientTypeTag.GAME_MASTER)
+        self.server.try_register_game(gm, messages.RegisterGame("game 3", 1, 1))
+        assert len(gm.socket.messages()) == 1  # just the ConfirmGameRegistration
+        assert len(self.server.matchmaking.waiting) == 0
+
+    def test_rejected_player_can_join_again(self):
+        self.server.handle_player_message(self.player, messages.JoinAnyGame("blue", "member", players_per_team=1))
+        self.server.handle_gm_message(self.gms[0], messages.RejectJoiningGame(self.player.id, "game 1"))
+
+        assert "RejectJoiningGame" in self.player.socket.messages()[0]
+        assert self.player.game_master_id == "-1"
+        assert self.player.game_id == "-1"
+
+    def test_player_rejoins_after_gm_restart(self):
+        self.server.handle_player_message(self.player, messages.JoinAnyGame("blue", "member", players_per_team=1))
+        game_id = self.player.game_id
+        self.server.handle_gm_message(self.gms[0], messages.ConfirmJoiningGame(
+            self.player.id, game_id, "c094cab7-da7b-457f-89e5-a5c51756035f", "blue", "member"))
+        self.player.socket.messages()
+
+        self.server.disconnect_client(self.gms[0].id)
+        assert self.player.socket.messages() == [messages.GameMasterDisconnected(game_id)]
+
+        # there's no game of his size left, so he waits for one:
+        self.server.handle_player_message(self.player, messages.JoinAnyGame("blue", "member", players_per_team=1))
+        assert len(self.server.matchmaking.waiting) == 1
+
+        gm = add_client(self.server, "gm3", ClientTypeTag.GAME_MASTER)
+        self.server.try_register_game(gm, messages.RegisterGame("game 3", 1, 1))
+
+        assert any("JoinGame" in message and 'playerId="7"' in message for message in gm.socket.messages())
+        assert self.player.game_master_id == gm.id
+
+
+class TestHostedGames(TestCase):
+    """
+    one GM client hosting many games (see gamehost.py).
+    """
+
+    def setUp(self):
+        self.server = CommunicationServer(False, "hosted", 1, transport=LOOPBACK, idle_timeout=None)
+        self.gm = add_client(self.server, "0", ClientTypeTag.GAME_MASTER)
+        assert self.server.try_register_game(self.gm, messages.RegisterGame("hosted game 0", 1, 1))
+        self.server.handle_gm_message(self.gm, messages.RegisterGame("hosted game 1", 1, 1))
+        self.game_ids = sorted(self.server.games.keys())
+        self.players = []
+        for game_id in self.game_ids:
+            player = add_client(self.server, str(len(self.server.clients)), ClientTypeTag.PLAYER)
+            player.game_master_id = self.gm.id
+            player.game_id = game_id
+            self.server.game_players[game_id].add(player.id)
+            self.players.append(player)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_games_are_registered(self):
+        received = self.gm.socket.messages()
+        assert len(self.game_ids) == 2
+        assert [message for message in received if "ConfirmGameRegistration" in message] == [
+            messages.ConfirmGameRegistration(game_id) for game_id in self.game_ids]
+
+        self.server.handle_gm_message(self.gm, messages.RegisterGame("hosted game 1", 1, 1))
+        assert "RejectGameRegistration" in self.gm.socket.messages()[0]
+        assert len(self.server.games) == 2
+
+    def test_games_finish_one_by_one(self):
+        first, second = self.players
+        self.server.handle_gm_message(self.gm, messages.Data(first.id, True, game_id=self.game_ids[0]))
+        assert sorted(self.server.games.keys()) == self.game_ids[1:]
+
+        # a late answer of the finished game's GM, to its former player:
+        self.server.handle_gm_message(self.gm, messages.Data(first.id, True, game_id=self.game_ids[0]))
+        assert sorted(self.server.games.keys()) == self.game_ids[1:]
+        assert second.game_id == self.game_ids[1]
+
+    def test_game_of_a_disconnected_player_finishes(self):
+        first, second = self.players
+        self.server.disconnect_client(first.id)
+
+        self.server.handle_gm_message(self.gm, messages.Data(first.id, True, game_id=self.game_ids[0]))
+
+        assert sorted(self.server.games.keys()) == self.game_ids[1:]
+        assert messages.GameFinished(self.game_ids[0]) in self.gm.socket.messages()
+
+    def test_gm_leaving_closes_all_games(self):
+        self.server.disconnect_client(self.gm.id)
+
+        assert len(self.server.games) == 0
+        for player, game_id in zip(self.players, self.game_ids):
+            assert player.socket.messages() == [messages.GameMasterDisconnected(game_id)]
+
+
+class TestLobbyListing(TestCase):
+    def setUp(self):
+        self.server = CommunicationServer(False, "lobby", 1, transport=LOOPBACK, idle_timeout=None)
+        self.gm = add_client(self.server, "0", ClientTypeTag.GAME_MASTER)
+        self.server.try_register_game(self.gm, messages.RegisterGame("lobby game", 1, 1))
+        self.player = add_client(self.server, "1", ClientTypeTag.PLAYER)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_listing_is_built_once(self):
+        listing = self.server.open_games_listing()
+
+        self.server.handle_player_message(self.player, messages.GetGames())
+        self.server.handle_player_message(self.player, messages.GetGames())
+
+        assert self.server.open_games_listing() is listing
+        received = self.player.socket.messages()
+        assert len(received) == 2 and 'gameName="lobby game"' in received[0] and received[0] == received[1]
+
+    def test_listing_follows_the_games(self):
+        assert 'gameName="lobby game"' in self.server.open_games_listing().decode()
+
+        gm = add_client(self.server, "2", ClientTypeTag.GAME_MASTER)
+        self.server.try_register_game(gm, messages.RegisterGame("other game", 1, 1))
+        assert 'gameName="other game"' in self.server.open_games_listing().decode()
+
+        self.server.handle_gm_message(self.gm, messages.GameStarted(self.gm.game_id))
+        assert 'gameName="lobby game"' not in self.server.open_games_listing().decode()
+
+        self.server.close_game(gm.game_id)
+        assert "GameInfo" not in self.server.open_games_listing().decode()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+from unittest import TestCase
+
+from src.communication.info import Allegiance
+from src.communication.strategy_benchmark import GAME_INFO_PHASES, STRATEGY_PHASES, measure, report
+
+BOARD = (5, 8, 2)  # the smallest board of the benchmark
+
+
+class TestStrategyBenchmark(TestCase):
+    def test_phase_breakdown(self):
+        for team in (Allegiance.RED.value, Allegiance.BLUE.value):
+            decision_times, breakdown, failed = measure(team, BOARD, 0.05, 50)
+
+            assert decision_times.count == 50
+            assert failed < 50
+            phases = set(phase for action, phase in breakdown.histograms.keys() if action == "phase")
+            assert len(phases) > 0
+            assert phases <= set(GAME_INFO_PHASES.values()) | set(STRATEGY_PHASES.values())
+            assert ("decision", "instrumented") in breakdown.histograms
+
+    def test_report(self):
+        lines = report(Allegiance.RED.value, BOARD, 0.2, 20).splitlines()
+
+        assert lines[0].startswith(" red 5x12 density=0.2: decision n=20 ")
+        assert len(lines) > 1
+        assert all(": calls=" in line and line.endswith("%)") for line in lines[1:])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import contextlib
+import io
+from unittest import TestCase
+
+from src.communication.info import Allegiance, GameInfo
+from src.communication.strategy import BasicBlueStrategy, GreedyRedStrategy, StrategyFactory
+from src.communication.tournament import MatchResult, play_match, report, round_robin
+
+
+class TestStrategyRegistry(TestCase):
+    def setUp(self):
+        self.info = GameInfo(board_width=5, task_height=4, goals_height=2)
+        self.info.initialize_fields()
+
+    def test_default_strategy(self):
+        strategy = StrategyFactory(Allegiance.BLUE.value, "member", (0, 3), self.info, player_id="1")
+
+        assert type(strategy) is BasicBlueStrategy
+
+    def test_strategy_by_name(self):
+        strategy = StrategyFactory(Allegiance.RED.value, "member", (0, 3), self.info, player_id="1", name="greedy")
+
+        assert type(strategy) is GreedyRedStrategy
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            StrategyFactory(Allegiance.RED.value, "member", (0, 3), self.info, player_id="1", name="nonexistent")
+
+
+class TestTournament(TestCase):
+    def test_round_robin_plays_both_colours(self):
+        matches = round_robin(["basic", "greedy"], 2, 50, 30)
+
+        assert len(matches) == 4
+        assert matches.count(("basic", "greedy", 50, 30)) == 2
+        assert matches.count(("greedy", "basic", 50, 30)) == 2
+
+    def test_report(self):
+        results = [MatchResult("basic", "greedy", Allegiance.RED.value, 2.0, 100),
+                   MatchResult("greedy", "basic", Allegiance.RED.value, 2.0, 100),
+                   MatchResult("basic", "greedy", None, 4.0, 200)]
+
+        lines = report(results, 4.0).splitlines()
+
+        assert lines[0] == " basic: games=3 wins=1 win rate=33% unfinished=1 mean game time=2.67s"
+        assert lines[1] == " greedy: games=3 wins=1 win rate=33% unfinished=1 mean game time=2.67s"
+        assert lines[2] == " total: games=3 games/s=0.75 decisions/s=50 elapsed=4.00s"
+
+    def test_play_match(self):
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            result = play_match(("basic", "greedy", 50, 10))
+
+        assert printed.getvalue() == ""
+        assert result.winning_strategy in ("basic", "greedy")
+        assert result.decisions > 0
+
+    def test_unfinished_match(self):
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            result = play_match(("basic", "greedy", 50, 0.05))
+
+        assert printed.getvalue() == ""
+        assert result.winner is None
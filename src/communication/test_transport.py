@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+import socket
+from unittest import TestCase
+
+from src.communication.transport import LOOPBACK, LoopbackSocket, TCP, UNIX, address, bind, new_socket, release, \
+    socket_name
+
+
+class TestLoopback(TestCase):
+    def setUp(self):
+        self.listener = new_socket(LOOPBACK)
+        bind(self.listener, LOOPBACK, "test", 1)
+        self.listener.listen()
+
+        self.client = new_socket(LOOPBACK)
+        assert self.client.connect_ex(address(LOOPBACK, "test", 1)) == 0
+        self.server_end, name = self.listener.accept()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_messages_go_both_ways(self):
+        self.client.sendall(b"<GetGames/>")
+        assert self.server_end.recv(4, socket.MSG_PEEK) == b"<Get"
+        assert self.server_end.recv(2048) == b"<GetGames/>"
+
+        self.server_end.send(b"<RegisteredGames/>")
+        assert self.client.recv(2048) == b"<RegisteredGames/>"
+
+    def test_closing_ends_the_connection(self):
+        self.client.sendall(b"<GetGames/>")
+        self.client.close()
+
+        # the data sent before closing can still be read:
+        assert self.server_end.recv(2048) == b"<GetGames/>"
+        assert self.server_end.recv(2048) == b""
+
+    def test_connecting_to_a_closed_listener_fails(self):
+        self.listener.close()
+
+        assert LoopbackSocket().connect_ex(address(LOOPBACK, "test", 1)) != 0
+
+
+class TestAddress(TestCase):
+    def test_addresses(self):
+        assert address(TCP, "localhost", 420) == ("localhost", 420)
+        assert address(UNIX, "localhost", 420).endswith("project-game-localhost-420.sock")
+
+    def test_unix_socket_file_is_removed(self):
+        server_socket = new_socket(UNIX)
+        bind(server_socket, UNIX, "test", 1)
+        server_socket.close()
+        release(UNIX, "test", 1)
+
+        # binding again works, even if the file had been left over:
+        server_socket = new_socket(UNIX)
+        bind(server_socket, UNIX, "test", 1)
+        server_socket.close()
+        server_socket = new_socket(UNIX)
+        bind(server_socket, UNIX, "test", 1)
+        server_socket.close()
+        release(UNIX, "test", 1)
+
+    def test_socket_names_are_tuples(self):
+        for transport in (TCP, UNIX, LOOPBACK):
+            any_socket = new_socket(transport)
+            assert type(socket_name(any_socket)) is tuple
+            any_socket.close()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+from src.communication.framing import MessageBuffer
+from src.communication.info import ClientInfo
+
+
+class RecordingSocket:
+    """stands in for a client's (or the GM's own) socket in tests, keeps the messages sent through it."""
+
+    def __init__(self):
+        self.received = MessageBuffer()
+
+    def sendall(self, data: bytes):
+        self.received.feed(data)
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
+
+    def messages(self) -> list:
+        result = []
+        message = self.received.next_message()
+        while message is not None:
+            result.append(message)
+            message = self.received.next_message()
+        return result
+
+
+def add_client(server, client_id, tag) -> ClientInfo:
+    """
+    :returns: a client of the server (without a handler thread) talking to a RecordingSocket.
+    """
+    client = ClientInfo(client_id, tag, socket=RecordingSocket())
+    server.clients[client_id] = client
+    return client
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+import asyncio
+import contextlib
+import io
+from argparse import ArgumentParser
+from itertools import permutations
+from multiprocessing import Pool
+from threading import Thread
+from time import perf_counter
+
+from src.communication.bots import AsyncPlayer
+from src.communication.clock import Clock
+from src.communication.gamemaster import GameMaster
+from src.communication.info import Allegiance
+from src.communication.server import CommunicationServer, close_socket
+from src.communication.strategy import STRATEGIES
+
+TOURNAMENT_HOSTNAME = "127.0.0.1"
+GM_SHUTDOWN_GRACE = 1  # seconds the GM of a match gets to shut down on its own once the bots have stopped
+
+
+class MatchResult:
+    def __init__(self, red: str, blue: str, winner, elapsed: float, decisions: int):
+        """
+        :param red: name of the strategy of the red team
+        :param blue: name of the strategy of the blue team
+        :param winner: the winning team (Allegiance value), or None if the match didn't end in time
+        :param elapsed: seconds from the start of the game until all of the bots stopped
+        :param decisions: number of decisions made by all of the bots
+        """
+        self.red = red
+        self.blue = blue
+        self.winner = winner
+        self.elapsed = elapsed
+        self.decisions = decisions
+
+    @property
+    def winning_strategy(self):
+        if self.winner == Allegiance.RED.value:
+            return self.red
+        if self.winner == Allegiance.BLUE.value:
+            return self.blue
+        return None
+
+
+def play_match(match: tuple) -> MatchResult:
+    """
+    runs in a worker process: play one game with its own server, GM and bots (whatever they print is dropped).
+    :param match: a tuple: (red strategy name, blue strategy name, clock dilation, timeout in seconds)
+    """
+    red, blue, dilation, timeout = match
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = CommunicationServer(False, TOURNAMENT_HOSTNAME, 0)
+        server.socket.listen()
+        Thread(target=server.accept_clients, daemon=True).start()
+        Thread(target=server.evict_idle_clients, daemon=True).start()
+        port = server.socket.getsockname()[1]
+
+        clock = Clock(dilation)
+        gm = GameMaster(clock=clock)
+        gm.connect(TOURNAMENT_HOSTNAME, port)
+        gm_thread = Thread(target=gm.run, daemon=True)
+        gm_thread.start()
+
+        started = perf_counter()
+        bots = asyncio.run(play_bots(gm.team_limit * 2, port, clock, {Allegiance.RED.value: red,
+                                                                      Allegiance.BLUE.value: blue}, timeout))
+        elapsed = perf_counter() - started
+        server.shutdown()
+
+        # the GM prints its latency report when it shuts down, so it has to be done before printing is restored
+        # (the GM of an unfinished game is still waiting for the server, so its connection is closed first):
+        gm_thread.join(GM_SHUTDOWN_GRACE)
+        if gm_thread.is_alive():
+            close_socket(gm.socket)
+            gm_thread.join()
+
+    winner = None
+    for team, goals in gm.achieved_goal_counters.items():
+        if goals >= gm.goal_target:
+            winner = team
+    return MatchResult(red, blue, winner, elapsed, sum(bot.turns for bot in bots))
+
+
+async def play_bots(bot_count, port, clock, strategies, timeout) -> list:
+    """
+    like bots.run_bots, but the bots are abandoned after the timeout. they join with JoinAnyGame, which waits in the
+    server's queue until the GM has registered its game (the list of games could still be empty when they ask for it).
+    """
+    bots = [AsyncPlayer(index=i, clock=clock, strategies=strategies, fast_join=True) for i in range(bot_count)]
+    tasks = [asyncio.ensure_future(bot.run(TOURNAMENT_HOSTNAME, port)) for bot in bots]
+    await asyncio.wait(tasks, timeout=timeout)
+    for task in tasks:
+        task.cancel()
+    return bots
+
+
+def round_robin(strategies: list, rounds: int, dilation: float, timeout: float) -> list:
+    """
+    :returns: list of matches: every strategy plays every other one in both colours, rounds times.
+    """
+    return [(red, blue, dilation, timeout) for i in range(rounds) for red, blue in permutations(strategies, 2)]
+
+
+def report(results: list, elapsed: float) -> str:
+    """
+    :returns: a human-readable report: win rate and speed of every strategy, and the throughput of the tournament.
+    """
+    lines = []
+    for strategy in sorted(set(result.red for result in results) | set(result.blue for result in results)):
+        played = [result for result in results if strategy in (result.red, result.blue)]
+        won = [result for result in played if result.winning_strategy == strategy]
+        unfinished = [result for result in played if result.winner is None]
+        mean_time = sum(result.elapsed for result in played) / len(played)
+        lines.append(" " + strategy + ": games=" + str(len(played)) + " wins=" + str(len(won)) + (
+            " win rate=%.0f%%" % (100 * len(won) / len(played))) + " unfinished=" + str(len(unfinished)) + (
+                         " mean game time=%.2fs" % mean_time))
+
+    decisions = sum(result.decisions for result in results)
+    game_time = sum(result.elapsed for result in results)
+    lines.append(" total: games=" + str(len(results)) + (" games/s=%.2f" % (len(results) / elapsed)) + (
+        " decisions/s=%.0f" % (decisions / game_time if game_time > 0 else 0.0)) + (" elapsed=%.2fs" % elapsed))
+    return "\n".join(lines)
+
+
+def run_tournament(strategies: list, rounds: int = 1, workers: int = None, dilation: float = 50,
+                   timeout: float = 30) -> list:
+    """
+    play the round robin in parallel worker processes.
+    :returns: list of MatchResults
+    """
+    with Pool(workers) as pool:
+        return pool.map(play_match, round_robin(strategies, rounds, dilation, timeout))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-s', '--strategies', nargs='+', default=sorted(STRATEGIES), choices=sorted(STRATEGIES),
+                        help='Strategies taking part (all the registered ones by default).')
+    parser.add_argument('-r', '--rounds', default=5, help='How many times every pairing is played.')
+    parser.add_argument('-w', '--workers', default=None, help='Number of worker processes (one per core by default).')
+    parser.add_argument('-d', '--dilation', default=50, help='How many times faster than real time the games run.')
+    parser.add_argument('--timeout', default=30, help='Seconds after which an unfinished match is abandoned.')
+    args = vars(parser.parse_args())
+
+    tournament_started = perf_counter()
+    match_results = run_tournament(args["strategies"], int(args["rounds"]),
+                                   int(args["workers"]) if args["workers"] else None, float(args["dilation"]),
+                                   float(args["timeout"]))
+    print("Tournament results:\n" + report(match_results, perf_counter() - tournament_started))
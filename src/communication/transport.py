@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+import errno
+import os
+import socket
+import tempfile
+from queue import Queue
+from threading import Condition, Lock
+
+TCP = "tcp"
+UNIX = "unix"  # AF_UNIX sockets: for a server and clients running on the same host
+LOOPBACK = "loopback"  # in-process queues: for a server and clients running in the same process
+TRANSPORTS = [TCP, UNIX, LOOPBACK]
+
+
+def address(transport: str, hostname: str, port: int):
+    """
+    :returns: the address of the endpoint identified by hostname and port, in the form the transport's sockets expect.
+    """
+    if transport == TCP:
+        return hostname, port
+    if transport == UNIX:
+        return os.path.join(tempfile.gettempdir(), "project-game-" + hostname + "-" + str(port) + ".sock")
+    if transport == LOOPBACK:
+        return hostname + ":" + str(port)
+    raise ValueError("Unknown transport: " + str(transport))
+
+
+def new_socket(transport: str):
+    """
+    :returns: a new, unconnected socket of the given transport (used both by clients and by the server).
+    """
+    if transport == TCP:
+        return socket.socket()
+    if transport == UNIX:
+        return socket.socket(socket.AF_UNIX)
+    if transport == LOOPBACK:
+        return LoopbackSocket()
+    raise ValueError("Unknown transport: " + str(transport))
+
+
+def socket_name(any_socket) -> tuple:
+    """
+    :returns: the name of the socket as a tuple, on any transport (the name of an AF_UNIX socket is a plain str).
+    """
+    name = any_socket.getsockname()
+    return (name,) if isinstance(name, (str, bytes)) else tuple(name)
+
+
+def bind(server_socket, transport: str, hostname: str, port: int):
+    endpoint = address(transport, hostname, port)
+    if transport == UNIX and os.path.exists(endpoint):
+        # left over by a server which didn't shut down cleanly.
+        os.unlink(endpoint)
+    server_socket.bind(endpoint)
+
+
+def release(transport: str, hostname: str, port: int):
+    """
+    clean up after a server socket was closed.
+    """
+    if transport == UNIX:
+        try:
+            os.unlink(address(transport, hostname, port))
+        except OSError:
+            pass
+
+
+class LoopbackSocket:
+    """
+    one end of an in-process connection. it has the subset of the socket API used by Client and CommunicationServer:
+    bind, listen and accept (when used by a server), connect_ex, send, sendall, recv (with MSG_PEEK), shutdown, close.
+    """
+    listeners = {}  # address => listening LoopbackSocket, for the whole process
+    listeners_lock = Lock()
+
+    def __init__(self):
+        self.peer = None
+        self.name = None
+        self.incoming = b""
+        self.closed = False
+        self.condition = Condition()
+        self.pending = None  # Queue of accepted LoopbackSockets, if this socket is listening
+
+    # server side:
+
+    def bind(self, name: str):
+        with LoopbackSocket.listeners_lock:
+            if name in LoopbackSocket.listeners:
+                raise OSError(errno.EADDRINUSE, "Address already in use: " + name)
+            LoopbackSocket.listeners[name] = self
+        self.name = name
+        self.pending = Queue()
+
+    def listen(self, backlog: int = None):
+        pass
+
+    def accept(self):
+        accepted = self.pending.get()
+        if accepted is None:
+            raise OSError(errno.EBADF, "Listening socket closed.")
+        return accepted, self.name
+
+    # client side:
+
+    def connect_ex(self, name: str) -> int:
+        with LoopbackSocket.listeners_lock:
+            listener = LoopbackSocket.listeners.get(name)
+        if listener is None:
+            return errno.ECONNREFUSED
+
+        server_end = LoopbackSocket()
+        server_end.name = name
+        server_end.peer = self
+        self.name = name
+        self.peer = server_end
+        listener.pending.put(server_end)
+        return 0
+
+    # both sides:
+
+    def send(self, data: bytes) -> int:
+        if self.closed or self.peer is None or self.peer.closed:
+            raise ConnectionResetError
+        with self.peer.condition:
+            self.peer.incoming += data
+            self.peer.condition.notify_all()
+        return len(data)
+
+    def sendall(self, data: bytes):
+        self.send(data)
+
+    def recv(self, buffer_size: int, flags: int = 0) -> bytes:
+        """
+        block until there's data, or the connection gets closed (then b"" is returned, like with a real socket).
+        """
+        with self.condition:
+            while len(self.incoming) == 0 and not self.closed and not (self.peer is not None and self.peer.closed):
+                self.condition.wait()
+            data = self.incoming[:buffer_size]
+            if not flags & socket.MSG_PEEK:
+                self.incoming = self.incoming[buffer_size:]
+            return data
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.pending is not None:
+            # a listening socket: stop accepting.
+            with LoopbackSocket.listeners_lock:
+                if LoopbackSocket.listeners.get(self.name) is self:
+                    del LoopbackSocket.listeners[self.name]
+            self.pending.put(None)
+        with self.condition:
+            self.condition.notify_all()
+        if self.peer is not None:
+            with self.peer.condition:
+                self.peer.condition.notify_all()
+
+    def shutdown(self, how):
+        self.close()
+
+    def getsockname(self):
+        return LOOPBACK, self.name
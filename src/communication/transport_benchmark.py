@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+from threading import Thread
+from time import perf_counter
+
+from src.communication import messages
+from src.communication.client import Client
+from src.communication.metrics import Histogram
+from src.communication.server import CommunicationServer
+from src.communication.transport import TCP, TRANSPORTS
+
+BENCHMARK_HOSTNAME = "127.0.0.1"
+
+
+def join_as_player(client: Client):
+    """
+    a client becomes a player on the server by asking for the list of games.
+    """
+    client.send(messages.GetGames())
+    client.receive()
+
+
+def echo(client: Client, round_trips: int):
+    """
+    runs on a thread: send every message received back to its sender.
+    """
+    for i in range(round_trips):
+        message = client.receive()
+        if message is None:
+            return
+        client.send(messages.KnowledgeExchangeRequest("0", "1"))
+
+
+def measure(transport: str, round_trips: int, port: int = 0) -> Histogram:
+    """
+    round trip: player 0 -> server -> player 1 -> server -> player 0, over the given transport.
+    :returns: Histogram of the round trip times.
+    """
+    server = CommunicationServer(False, BENCHMARK_HOSTNAME, port, transport=transport)
+    server.socket.listen()
+    Thread(target=server.accept_clients, daemon=True).start()
+    if transport == TCP:
+        port = server.socket.getsockname()[1]
+
+    # the server numbers clients in the order they connect, so they have to join one by one:
+    sender = Client(0, transport=transport)
+    sender.connect(BENCHMARK_HOSTNAME, port)
+    join_as_player(sender)
+    echoer = Client(1, transport=transport)
+    echoer.connect(BENCHMARK_HOSTNAME, port)
+    join_as_player(echoer)
+
+    Thread(target=echo, args=[echoer, round_trips], daemon=True).start()
+
+    round_trip_times = Histogram()
+    request = messages.KnowledgeExchangeRequest("1", "0")
+    for i in range(round_trips):
+        started = perf_counter()
+        sender.send(request)
+        sender.receive()
+        round_trip_times.add(perf_counter() - started)
+
+    server.shutdown()
+    return round_trip_times
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--roundtrips', default=1000, help='Number of round trips measured for each transport.')
+    parser.add_argument('-t', '--transport', default=None, choices=TRANSPORTS,
+                        help='Measure only the given transport (by default, all of them are measured).')
+    args = vars(parser.parse_args())
+
+    for transport in [args["transport"]] if args["transport"] else TRANSPORTS:
+        print(" " + transport + ": " + measure(transport, int(args["roundtrips"])).summary())